@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'salon.middleware.SalonUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
@@ -83,6 +84,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Параллельные записи ждут освобождения блокировки, а не падают сразу;
+        # IMMEDIATE берёт блокировку записи в начале транзакции, иначе ожидание
+        # не работает при повышении блокировки после чтения
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Файловая тестовая база: у базы в памяти блокировки таблиц не ждут,
+        # и тесты параллельной записи получали бы "database table is locked"
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -146,3 +159,51 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 }
+
+# Расписание салона: рабочие часы по умолчанию (если у мастера нет своего расписания)
+# и шаг сетки слотов в минутах (по этой же сетке записи занимают ячейки MasterTimeSlot,
+# поэтому при смене шага нужно пересобрать ячейки командой rebuild_time_slots)
+SALON_DEFAULT_WORKING_HOURS = ('09:00', '21:00')
+SALON_SLOT_STEP_MINUTES = 15
+
+# Сколько секунд статистика записей считается свежей в кэше
+SALON_STATISTICS_CACHE_SECONDS = 5
+
+# Сколько секунд хранится закэшированный ответ API (устаревает раньше при записи в модели).
+# Поколения моделей хранятся в кэше default: без CACHES это локальный кэш процесса, и при
+# нескольких процессах сброс не доходит до остальных - там нужен общий кэш (salon.W001)
+SALON_RESPONSE_CACHE_SECONDS = 60
+
+# Максимум записей в одном запросе POST /api/bookings/bulk/
+SALON_BULK_BOOKINGS_LIMIT = 500
+
+# Сколько строк читается из БД за раз при потоковой выгрузке /api/bookings/export/
+# и при фоновой выгрузке из админки (после каждой пачки обновляется ход выгрузки)
+SALON_EXPORT_CHUNK_SIZE = 2000
+
+# Каталог файлов фоновых выгрузок из админки (не раздаётся как MEDIA - файлы
+# скачиваются через админку с проверкой прав) и запуск выгрузок в потоке веб-процесса;
+# при False задания выполняет команда run_export_jobs
+SALON_EXPORT_DIR = BASE_DIR / 'exports'
+SALON_EXPORT_JOBS_IN_THREAD = True
+
+# Максимум результатов полнотекстового поиска (?search=), упорядоченных по релевантности
+SALON_SEARCH_MAX_RESULTS = 1000
+
+# Сколько секунд списки админки хранят количество строк, даты date_hierarchy и варианты
+# фильтров (для записей и отзывов значения устаревают раньше - при изменении данных)
+SALON_ADMIN_CACHE_SECONDS = 60
+
+# Хранение истории: через сколько дней строки журнала изменений (change_history) и
+# истории записей simple_history (booking_history) переносятся командой archive_history
+# в сжатые файлы архива (None - хранить в БД без ограничения), каталог архива и
+# сколько строк переносится за одну транзакцию
+SALON_HISTORY_RETENTION_DAYS = {'change_history': 365, 'booking_history': 365}
+SALON_ARCHIVE_DIR = BASE_DIR / 'archive'
+SALON_ARCHIVE_BATCH_SIZE = 5000
+
+# Завершённые и отменённые записи старше стольких дней (по времени приёма) команда
+# archive_bookings переносит из таблицы записей в архив (ArchivedBooking); списки
+# читают архив, только если запрошенный период в него заходит. Записей за транзакцию
+SALON_BOOKING_ARCHIVE_DAYS = 180
+SALON_BOOKING_ARCHIVE_BATCH_SIZE = 500
@@ -1,15 +1,90 @@
-from django.contrib import admin
+from datetime import date
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
-from django.urls import reverse
+from import_export.formats.base_formats import CSV, JSON, TSV, XLSX
+from django.urls import NoReverseMatch, path, reverse
 from simple_history.admin import SimpleHistoryAdmin
-from .models import User, Service, Master, Image, MasterService, Booking, Review, ChangeHistory
+from .audit import background_flush
+from .booking_archive import period_needs_archive, period_start
+from .booking_import import STATUS_LABELS, import_bookings, read_rows
+from .changelist import CachedRelatedFieldListFilter, Rollup, ScalableChangeListMixin, filter_params
+from .export_jobs import create_job, export_path
+from .forms import BookingBulkImportForm
+from .models import (
+    User, Service, Master, Image, MasterService, Booking, BookingCounter, Review, ChangeHistory, WorkingHours,
+    ExportJob, ArchivedBooking, BookingRecord,
+)
+from .reservations import BookingConflict
+
+
+def related_count(model, field):
+    """
+    Количество связанных объектов model (по ForeignKey field) подзапросом:
+    в отличие от Count() по JOIN не размножает строки списка и не требует GROUP BY,
+    а COUNT(*) пагинатора его не выполняет
+    """
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+class BackgroundAuditMixin:
+    """Журнал изменений при импорте пишется пачками в фоновом потоке"""
+    
+    def import_data(self, *args, **kwargs):
+        with background_flush():
+            return super().import_data(*args, **kwargs)
+
+
+class BackgroundExportMixin:
+    """
+    Выгрузка import-export выполняется фоновым заданием (salon.export_jobs):
+    запрос админки только ставит его в очередь, файл скачивается из списка выгрузок
+    """
+    # Форматы, которые пишутся в файл построчно
+    export_formats = [CSV, TSV, XLSX, JSON]
+    
+    def _do_file_export(self, file_format, request, queryset, export_form=None):
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        job = create_job(
+            self.model,
+            self.get_export_filters(request, export_form),
+            self.choose_export_resource_class(export_form, request),
+            file_format.get_extension(),
+            export_fields=self.get_export_resource_fields_from_form(export_form),
+            user=request.user,
+        )
+        messages.success(request, f'Выгрузка #{job.pk} поставлена в очередь, файл появится в списке выгрузок')
+        return redirect('admin:salon_exportjob_changelist')
+    
+    def get_export_filters(self, request, export_form=None):
+        """
+        Что выгружать: параметры списка из адреса и ID записей, выбранных
+        действием списка (None - весь отфильтрованный список)
+        """
+        pks = None
+        if export_form is not None and 'export_items' in export_form.changed_data:
+            pks = export_form.cleaned_data['export_items']
+        elif request.POST.get('action') and request.POST.get('select_across') != '1':
+            pks = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
+        return {'params': dict(request.GET.lists()), 'pks': pks}
 
 
 # Ресурсы для экспорта
-class BookingResource(resources.ModelResource):
+class BookingResource(BackgroundAuditMixin, resources.ModelResource):
     """Кастомный ресурс для экспорта Booking с дополнительными методами"""
     
     class Meta:
@@ -25,13 +100,7 @@ class BookingResource(resources.ModelResource):
     
     def dehydrate_status(self, booking):
         """Кастомизация поля status при экспорте - добавляем текстовое представление"""
-        status_dict = {
-            'pending': 'В ожидании',
-            'confirmed': 'Подтверждена',
-            'completed': 'Завершена',
-            'cancelled': 'Отменена'
-        }
-        return status_dict.get(booking.status, booking.status)
+        return STATUS_LABELS.get(booking.status, booking.status)
     
     def dehydrate_appointment_datetime(self, booking):
         """Кастомизация поля appointment_datetime - форматируем дату"""
@@ -40,7 +109,7 @@ class BookingResource(resources.ModelResource):
         return ''
 
 
-class MasterResource(resources.ModelResource):
+class MasterResource(BackgroundAuditMixin, resources.ModelResource):
     """Ресурс для экспорта Master"""
     class Meta:
         model = Master
@@ -116,6 +185,13 @@ class MasterServiceInline(admin.TabularInline):
     raw_id_fields = ('master', 'service')
 
 
+class WorkingHoursInline(admin.TabularInline):
+    """Inline для рабочего времени мастера"""
+    model = WorkingHours
+    extra = 0
+    max_num = 7
+
+
 @admin.register(Service)
 class ServiceAdmin(ImportExportModelAdmin):
     """Административная панель для модели Service"""
@@ -130,7 +206,7 @@ class ServiceAdmin(ImportExportModelAdmin):
     inlines = [MasterServiceInline]
     fieldsets = (
         ('Основная информация', {
-            'fields': ('title', 'description', 'price')
+            'fields': ('title', 'description', 'price', 'duration_minutes')
         }),
         ('Связанные услуги', {
             'fields': ('related_services',),
@@ -142,15 +218,24 @@ class ServiceAdmin(ImportExportModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Мастера всех услуг страницы загружаются одним запросом"""
+        return super().get_queryset(request).annotate(
+            masters_total=related_count(MasterService, 'service'),
+        ).prefetch_related(
+            Prefetch('masters', queryset=Master.objects.only('master_id', 'full_name').order_by('full_name'))
+        )
+    
     @admin.display(description='Цена с валютой', ordering='price')
     def get_price_display(self, obj):
         """Собственный метод для отображения цены"""
         return f"{obj.price} руб."
     get_price_display.short_description = 'Цена'
     
-    @admin.display(description='Мастера')
+    @admin.display(description='Мастера', ordering='masters_total')
     def get_master_link(self, obj):
         """Гиперссылка на мастеров, предоставляющих эту услугу"""
+        # Срез предзагруженного списка, а не отдельный запрос с LIMIT
         masters = obj.masters.all()[:3]
         if masters:
             links = []
@@ -182,7 +267,7 @@ class MasterAdmin(ImportExportModelAdmin):
     readonly_fields = ('master_id', 'created_at', 'updated_at')
     raw_id_fields = ('image',)
     date_hierarchy = 'created_at'
-    inlines = [MasterServiceInline]
+    inlines = [MasterServiceInline, WorkingHoursInline]
     fieldsets = (
         ('Основная информация', {
             'fields': ('full_name', 'specialization', 'experience_years', 'image')
@@ -193,6 +278,12 @@ class MasterAdmin(ImportExportModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Изображение и количество записей выбираются вместе с мастерами"""
+        return super().get_queryset(request).select_related('image').annotate(
+            bookings_total=related_count(Booking, 'master'),
+        )
+    
     @admin.display(description='Изображение')
     def get_image_link(self, obj):
         """Гиперссылка на изображение"""
@@ -208,12 +299,12 @@ class MasterAdmin(ImportExportModelAdmin):
         return '-'
     get_image_link.short_description = 'Изображение'
     
-    @admin.display(description='Количество записей')
+    @admin.display(description='Количество записей', ordering='bookings_total')
     def get_bookings_count(self, obj):
         """Количество записей к мастеру"""
-        count = obj.bookings.count()
+        count = obj.bookings_total
         if count > 0:
-            url = reverse('admin:salon_booking_changelist') + f'?master__id__exact={obj.pk}'
+            url = reverse('admin:salon_booking_changelist') + f'?master__master_id__exact={obj.pk}'
             return format_html('<a href="{}">{} записей</a>', url, count)
         return '0'
     get_bookings_count.short_description = 'Записи'
@@ -244,6 +335,7 @@ class MasterServiceAdmin(admin.ModelAdmin):
     """Административная панель для модели MasterService"""
     list_display = ('master_service_id', 'master', 'service', 'get_master_specialization')
     list_display_links = ('master_service_id',)
+    list_select_related = ('master', 'service')
     list_filter = ('master', 'service')
     search_fields = ('master__full_name', 'service__title')
     raw_id_fields = ('master', 'service')
@@ -256,7 +348,7 @@ class MasterServiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(User)
-class UserAdmin(ImportExportModelAdmin):
+class UserAdmin(BackgroundExportMixin, ImportExportModelAdmin):
     """Административная панель для модели User"""
     resource_class = UserResource
     list_display = ('user_id', 'name', 'email', 'role', 'created_at', 'get_role_display_custom')
@@ -264,6 +356,7 @@ class UserAdmin(ImportExportModelAdmin):
     list_filter = ('role', 'created_at')
     search_fields = ('name', 'email')
     readonly_fields = ('user_id', 'created_at')
+    raw_id_fields = ('auth_user',)
     date_hierarchy = 'created_at'
     
     @admin.display(description='Роль (отформатированная)')
@@ -275,10 +368,34 @@ class UserAdmin(ImportExportModelAdmin):
     get_role_display_custom.short_description = 'Роль'
 
 
+class BookingArchiveFilter(admin.SimpleListFilter):
+    """
+    Включение архива в список записей. Сам выбор таблицы делает
+    BookingAdmin.get_queryset; архив подключается и без фильтра, если период
+    date_hierarchy или фильтра по дате приёма заходит в него
+    """
+    title = 'Архив записей'
+    parameter_name = 'archive'
+    
+    def lookups(self, request, model_admin):
+        return [('include', 'Включать всегда')]
+    
+    def queryset(self, request, queryset):
+        return queryset
+    
+    def choices(self, changelist):
+        choices = list(super().choices(changelist))
+        choices[0]['display'] = 'Если период в архиве'
+        return choices
+
+
 @admin.register(Booking)
-class BookingAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
+class BookingAdmin(ScalableChangeListMixin, BackgroundExportMixin, ImportExportModelAdmin, SimpleHistoryAdmin):
     """Административная панель для модели Booking"""
     resource_class = BookingResource
+    changelist_dependencies = (Booking, ArchivedBooking)
+    # Кнопка массового импорта поверх кнопок import-export
+    change_list_template = 'admin/salon/booking/change_list.html'
     list_display = (
         'booking_id',
         'get_user_link',
@@ -290,14 +407,22 @@ class BookingAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
         'get_status_display_custom'
     )
     list_display_links = ('booking_id',)
-    list_filter = ('status', 'appointment_datetime', 'created_at', 'master', 'service')
+    # Колонки-ссылки и Booking.__str__ обращаются к клиенту, мастеру и услуге
+    list_select_related = ('user', 'master', 'service')
+    list_filter = (
+        'status', 'appointment_datetime', 'created_at',
+        ('master', CachedRelatedFieldListFilter), ('service', CachedRelatedFieldListFilter),
+        BookingArchiveFilter,
+    )
     search_fields = ('user__name', 'user__email', 'master__full_name', 'service__title')
-    readonly_fields = ('booking_id', 'created_at')
+    readonly_fields = ('booking_id', 'end_datetime', 'created_at')
+    # Представления, которые читают список с фильтрами: сам список и выгрузка
+    archive_views = ('salon_booking_changelist', 'salon_booking_export')
     raw_id_fields = ('user', 'master', 'service')
     date_hierarchy = 'appointment_datetime'
     fieldsets = (
         ('Информация о записи', {
-            'fields': ('user', 'master', 'service', 'appointment_datetime', 'status')
+            'fields': ('user', 'master', 'service', 'appointment_datetime', 'end_datetime', 'status')
         }),
         ('Системная информация', {
             'fields': ('booking_id', 'created_at'),
@@ -305,6 +430,111 @@ class BookingAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
         }),
     )
     
+    def includes_archive(self, request):
+        """Читает ли список архивные записи вместе с текущими (BookingRecord)"""
+        if getattr(request.resolver_match, 'url_name', None) not in self.archive_views:
+            return False
+        params = request.GET
+        if params.get(BookingArchiveFilter.parameter_name) == 'include':
+            return True
+        year = params.get(f'{self.date_hierarchy}__year')
+        try:
+            start = date(int(year), int(params.get(f'{self.date_hierarchy}__month', 1)),
+                         int(params.get(f'{self.date_hierarchy}__day', 1))) if year else None
+        except ValueError:
+            start = None
+        start = period_start(start or params.get(f'{self.date_hierarchy}__gte'))
+        return period_needs_archive(start)
+    
+    def get_queryset(self, request):
+        if not self.includes_archive(request):
+            return super().get_queryset(request)
+        queryset = BookingRecord.objects.all()
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
+    
+    def get_actions(self, request):
+        # Действия меняют только текущие записи
+        if self.includes_archive(request):
+            return {}
+        return super().get_actions(request)
+    
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # Список вместе с архивом ссылается сюда и на архивные записи
+        if (
+            object_id.isdigit() and not Booking.objects.filter(pk=object_id).exists()
+            and ArchivedBooking.objects.filter(pk=object_id).exists()
+        ):
+            return redirect('admin:salon_archivedbooking_change', object_id)
+        return super().change_view(request, object_id, form_url, extra_context)
+    
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except BookingConflict as error:
+            # Время заняли параллельным запросом уже после проверки формы; транзакция формы откатилась
+            self.message_user(request, error.message, messages.ERROR)
+            return redirect(request.get_full_path())
+    
+    def get_urls(self):
+        return [
+            path(
+                'bulk-import/',
+                self.admin_site.admin_view(self.bulk_import_view),
+                name='salon_booking_bulk_import',
+            ),
+        ] + super().get_urls()
+    
+    def bulk_import_view(self, request):
+        """
+        Массовый импорт записей из файла (salon.booking_import): построчное чтение,
+        поиск связей через кэш и вставка пачками вместо импорта по одной строке
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = BookingBulkImportForm(request.POST or None, request.FILES or None)
+        report = None
+        if form.is_valid():
+            data = form.cleaned_data
+            report = import_bookings(
+                read_rows(data['file'], data['file_format']),
+                changed_by=request.user.get_username(),
+                create_users=data['create_users'],
+                dry_run=data['dry_run'],
+            )
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Массовый импорт записей',
+            'form': form,
+            'report': report,
+            'dry_run': form.is_valid() and form.cleaned_data['dry_run'],
+        }
+        return TemplateResponse(request, 'admin/salon/booking/bulk_import.html', context)
+    
+    def get_changelist_rollup(self, request):
+        """
+        Счётчики записей по дню и статусу заменяют таблицу записей, если список
+        ограничен только статусом и днями date_hierarchy. Счётчики учитывают и
+        архивные записи, поэтому подходят только для списка вместе с архивом
+        """
+        if not self.includes_archive(request):
+            return None
+        params, search = filter_params(request)
+        params.pop(BookingArchiveFilter.parameter_name, None)
+        lookups = {'status__exact': 'status'}
+        for part in ('year', 'month', 'day'):
+            lookups[f'{self.date_hierarchy}__{part}'] = f'day__{part}'
+        if search or not params.keys() <= lookups.keys():
+            return None
+        try:
+            counters = BookingCounter.objects.filter(
+                count__gt=0, **{lookups[name]: values[-1] for name, values in params.items()}
+            )
+        except (ValueError, ValidationError):
+            return None
+        return Rollup(counters, 'count', 'day')
+    
     @admin.display(description='Пользователь')
     def get_user_link(self, obj):
         """Гиперссылка на пользователя"""
@@ -352,10 +582,31 @@ class BookingAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
     get_status_display_custom.short_description = 'Статус'
 
 
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """Архив записей (salon.booking_archive), только для чтения"""
+    changelist_dependencies = (ArchivedBooking,)
+    list_display = ('booking_id', 'user', 'master', 'service', 'appointment_datetime', 'status', 'archived_at')
+    list_select_related = ('user', 'master', 'service')
+    list_filter = ('status', ('master', CachedRelatedFieldListFilter), ('service', CachedRelatedFieldListFilter))
+    search_fields = ('user__name', 'user__email', 'master__full_name', 'service__title')
+    date_hierarchy = 'appointment_datetime'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Review)
-class ReviewAdmin(ImportExportModelAdmin):
+class ReviewAdmin(ScalableChangeListMixin, BackgroundExportMixin, ImportExportModelAdmin):
     """Административная панель для модели Review"""
     resource_class = ReviewResource
+    changelist_dependencies = (Review,)
     list_display = (
         'review_id',
         'user',
@@ -366,7 +617,8 @@ class ReviewAdmin(ImportExportModelAdmin):
         'get_comment_preview'
     )
     list_display_links = ('review_id', 'user')
-    list_filter = ('rating', 'created_at', 'master')
+    list_select_related = ('user', 'master')
+    list_filter = ('rating', 'created_at', ('master', CachedRelatedFieldListFilter))
     search_fields = ('user__name', 'user__email', 'master__full_name', 'comment')
     readonly_fields = ('review_id', 'created_at')
     raw_id_fields = ('user', 'master')
@@ -394,22 +646,32 @@ class ReviewAdmin(ImportExportModelAdmin):
 
 
 @admin.register(ChangeHistory)
-class ChangeHistoryAdmin(admin.ModelAdmin):
-    """Административная панель для истории изменений"""
+class ChangeHistoryAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """
+    Административная панель для истории изменений. Журнал пишется пачками в
+    обход сигналов, поэтому количества и даты списка обновляются по истечении
+    SALON_ADMIN_CACHE_SECONDS
+    """
     list_display = ('id', 'content_type', 'object_id', 'action', 'changed_by', 'timestamp', 'get_object_link')
-    list_filter = ('action', 'timestamp', 'content_type')
+    list_select_related = ('content_type',)
+    list_filter = ('action', 'timestamp', ('content_type', CachedRelatedFieldListFilter))
     search_fields = ('changed_by',)
     readonly_fields = ('content_type', 'object_id', 'action', 'changed_by', 'changes', 'timestamp')
     date_hierarchy = 'timestamp'
     
+    def get_queryset(self, request):
+        # Объекты строк страницы - одним запросом на тип (со связями для __str__)
+        return super().get_queryset(request).with_content_objects()
+    
     def get_object_link(self, obj):
-        """Гиперссылка на объект"""
+        """Гиперссылка на объект (для удалённого объекта - только тип и ID)"""
+        if obj.content_object is None:
+            return obj.get_object_display()
         try:
-            model = obj.content_type.model_class()
             admin_url = reverse(f'admin:{obj.content_type.app_label}_{obj.content_type.model}_change', args=[obj.object_id])
-            return format_html('<a href="{}">{}</a>', admin_url, str(obj.content_object))
-        except:
-            return str(obj.content_object)
+        except NoReverseMatch:
+            return obj.get_object_display()
+        return format_html('<a href="{}">{}</a>', admin_url, obj.get_object_display())
     get_object_link.short_description = 'Объект'
     
     def has_add_permission(self, request):
@@ -417,3 +679,66 @@ class ChangeHistoryAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Фоновые выгрузки: ход работы и скачивание готовых файлов"""
+    list_display = (
+        'job_id', 'content_type', 'file_format', 'status', 'get_progress', 'created_by', 'created_at',
+        'finished_at', 'get_download_link',
+    )
+    list_filter = ('status', 'file_format', 'content_type')
+    list_select_related = ('content_type', 'created_by')
+    readonly_fields = (
+        'job_id', 'content_type', 'resource', 'export_fields', 'filters', 'file_format', 'status', 'total_rows',
+        'processed_rows', 'file_name', 'error', 'created_by', 'created_at', 'finished_at',
+    )
+    date_hierarchy = 'created_at'
+    
+    def get_queryset(self, request):
+        """Пользователь видит свои выгрузки, суперпользователь - все"""
+        queryset = super().get_queryset(request)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(created_by=request.user)
+        return queryset
+    
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='salon_exportjob_download',
+            ),
+        ] + super().get_urls()
+    
+    def download_view(self, request, object_id):
+        """Файл готовой выгрузки"""
+        job = get_object_or_404(self.get_queryset(request), pk=object_id, status='done')
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        try:
+            return FileResponse(export_path(job).open('rb'), as_attachment=True, filename=job.file_name)
+        except FileNotFoundError:
+            raise Http404('Файл выгрузки удалён')
+    
+    @admin.display(description='Выполнено')
+    def get_progress(self, obj):
+        """Доля выгруженных строк"""
+        if not obj.total_rows:
+            return f'{obj.processed_rows}'
+        return f'{obj.processed_rows} из {obj.total_rows} ({obj.processed_rows * 100 // obj.total_rows}%)'
+    
+    @admin.display(description='Файл')
+    def get_download_link(self, obj):
+        """Ссылка на скачивание готового файла"""
+        if obj.status != 'done':
+            return obj.error or '-'
+        url = reverse('admin:salon_exportjob_download', args=[obj.pk])
+        return format_html('<a href="{}">Скачать</a>', url)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
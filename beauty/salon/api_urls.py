@@ -1,13 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .viewsets import BookingViewSet, MasterViewSet, ServiceViewSet
+from .viewsets import BookingViewSet, MasterViewSet, ReviewViewSet, ServiceViewSet, cache_stats
 
 router = DefaultRouter()
 router.register(r'bookings', BookingViewSet, basename='booking')
 router.register(r'masters', MasterViewSet, basename='master')
 router.register(r'services', ServiceViewSet, basename='service')
+router.register(r'reviews', ReviewViewSet, basename='review')
 
 urlpatterns = [
+    path('cache/stats/', cache_stats, name='cache-stats'),
     path('', include(router.urls)),
 ]
 
@@ -6,4 +6,5 @@ class SalonConfig(AppConfig):
     name = 'salon'
     
     def ready(self):
+        import salon.checks  # noqa
         import salon.signals  # noqa
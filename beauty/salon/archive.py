@@ -0,0 +1,142 @@
+"""
+Архив истории: журнал изменений (ChangeHistory) и история записей simple_history.
+
+Обе таблицы растут с каждым сохранением записи. Строки старше срока хранения
+(SALON_HISTORY_RETENTION_DAYS) переносятся в сегменты архива - файлы
+<SALON_ARCHIVE_DIR>/<таблица>/<ГГГГ-ММ>.jsonl.gz, по одному на месяц: строка
+таблицы - JSON-объект {поле: значение} в отдельной строке файла.
+
+Перенос идёт пачками по SALON_ARCHIVE_BATCH_SIZE строк: пачка дописывается в
+сегменты новым gzip-блоком (файл только дополняется, сжатые блоки можно
+склеивать), файл сбрасывается на диск, и только после этого строки пачки
+удаляются из БД. Если процесс прервётся между записью и удалением, пачка
+попадёт в архив повторно - читатель отбрасывает повторы по первичному ключу.
+Одновременно должна работать одна команда archive_history.
+"""
+import gzip
+import json
+import os
+from datetime import date, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Booking, ChangeHistory
+
+
+def _json_value(value):
+    # В отличие от DjangoJSONEncoder, время сохраняется с микросекундами
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+class ArchivedTable:
+    """Таблица с архивом: date_field - дата строки, object_field - ID объекта истории"""
+
+    def __init__(self, name, model, date_field, object_field):
+        self.name = name
+        self.model = model
+        self.date_field = date_field
+        self.object_field = object_field
+
+    @property
+    def directory(self):
+        return Path(settings.SALON_ARCHIVE_DIR) / self.name
+
+    def retention_days(self):
+        return settings.SALON_HISTORY_RETENTION_DAYS.get(self.name)
+
+    def cutoff(self, days=None):
+        """Граница срока хранения: строки раньше неё переносятся в архив (None - не переносятся)"""
+        days = self.retention_days() if days is None else days
+        if days is None:
+            return None
+        return timezone.now() - timedelta(days=days)
+
+    def expired(self, before):
+        return self.model._base_manager.filter(**{f'{self.date_field}__lt': before})
+
+    def segment_path(self, month):
+        return self.directory / f'{month}.jsonl.gz'
+
+    def segments(self):
+        """Месяцы (ГГГГ-ММ), для которых есть сегменты архива, по порядку"""
+        if not self.directory.exists():
+            return []
+        return sorted(path.name.removesuffix('.jsonl.gz') for path in self.directory.glob('*.jsonl.gz'))
+
+    def append(self, rows):
+        """Дописывает строки в сегменты их месяцев и сбрасывает файлы на диск"""
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(f'{timezone.localtime(row[self.date_field]):%Y-%m}', []).append(row)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for month, month_rows in by_month.items():
+            with open(self.segment_path(month), 'ab') as file:
+                with gzip.GzipFile(fileobj=file, mode='wb') as archive:
+                    for row in month_rows:
+                        archive.write(json.dumps(row, default=_json_value, ensure_ascii=False).encode())
+                        archive.write(b'\n')
+                file.flush()
+                os.fsync(file.fileno())
+        return by_month
+
+    def archive(self, before, batch_size=None, progress=None):
+        """
+        Переносит строки старше before в архив и удаляет их из БД пачками;
+        progress(перенесено) вызывается после каждой пачки. Возвращает число строк.
+        """
+        batch_size = batch_size or settings.SALON_ARCHIVE_BATCH_SIZE
+        pk_name = self.model._meta.pk.attname
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(self.expired(before).order_by(pk_name).values()[:batch_size])
+                if not rows:
+                    return moved
+                self.append(rows)
+                self.model._base_manager.filter(pk__in=[row[pk_name] for row in rows]).delete()
+            moved += len(rows)
+            if progress is not None:
+                progress(moved)
+
+    def read(self, object_id=None, since=None, until=None, fields=None):
+        """
+        Строки архива (словари) по порядку месяцев; object_id - только история
+        этого объекта, since/until - границы даты строки (until не включается),
+        fields - {поле: значение} для остальных условий (например, content_type_id)
+        """
+        pk_name = self.model._meta.pk.attname
+        for month in self.segments():
+            if since is not None and month < f'{timezone.localtime(since):%Y-%m}':
+                continue
+            if until is not None and month > f'{timezone.localtime(until):%Y-%m}':
+                continue
+            seen = set()
+            with gzip.open(self.segment_path(month), 'rt', encoding='utf-8') as archive:
+                for line in archive:
+                    row = json.loads(line)
+                    if row[pk_name] in seen:
+                        continue
+                    seen.add(row[pk_name])
+                    if object_id is not None and row[self.object_field] != object_id:
+                        continue
+                    if fields and any(row.get(name) != value for name, value in fields.items()):
+                        continue
+                    if since is not None or until is not None:
+                        row_date = parse_datetime(row[self.date_field])
+                        if since is not None and row_date < since or until is not None and row_date >= until:
+                            continue
+                    yield row
+
+
+TABLES = {
+    table.name: table for table in (
+        ArchivedTable('change_history', ChangeHistory, 'timestamp', 'object_id'),
+        ArchivedTable('booking_history', Booking.history.model, 'history_date', 'booking_id'),
+    )
+}
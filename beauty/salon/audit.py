@@ -0,0 +1,159 @@
+"""
+Отложенная запись журнала изменений (ChangeHistory).
+
+Записи журнала не сохраняются по одной в сигналах, а копятся до фиксации
+транзакции и записываются одним bulk_create. Буфер заводится на уровень
+транзакции (внешний блок atomic или точку сохранения внутри него): при
+создании буфера ставится один transaction.on_commit-обработчик, который
+запишет его пачкой, следующие записи того же уровня просто добавляются в
+буфер. При откате точки сохранения Django убирает её обработчики, и буфер
+уровня отбрасывается вместе с ними - в журнал попадают только реально
+зафиксированные изменения.
+
+Booking.save открывает свою точку сохранения на каждую запись; чтобы
+сохранение многих записей в одной транзакции давало одну пачку, записи
+журнала внутри неё идут в буфер вызывающего уровня (shared_buffer), а при
+откате этой точки сохранения выбрасываются.
+
+Для массового импорта есть фоновый режим (background_flush): после фиксации
+записи передаются в отдельный поток, который сохраняет их пачками.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import connection, transaction
+
+from .models import ChangeHistory
+
+BACKGROUND_BATCH_SIZE = 1000
+
+_local = threading.local()
+
+
+def _level():
+    """Ключ текущего уровня транзакции: внешний блок atomic и открытые точки сохранения"""
+    return (connection.atomic_blocks[0], *(sid for sid in connection.savepoint_ids if sid))
+
+
+def _buffer():
+    """Буфер текущего уровня; при создании ставит обработчик записи пачки"""
+    shared = getattr(_local, 'shared', None)
+    if shared:
+        return shared[-1]
+    buffers = _local.__dict__.setdefault('buffers', {})
+    key = _level()
+    buffer = buffers.get(key)
+    if buffer is None:
+        # Буферы других (завершённых или откаченных) транзакций больше не понадобятся
+        for stale in [other for other in buffers if other[0] is not key[0]]:
+            del buffers[stale]
+        buffer = buffers[key] = []
+        transaction.on_commit(partial(_flush, key, buffer))
+    return buffer
+
+
+def _flush(key, buffer):
+    buffers = getattr(_local, 'buffers', {})
+    if buffers.get(key) is buffer:
+        del buffers[key]
+    if buffer:
+        write_entries(buffer)
+
+
+def record(entry):
+    """Добавляет несохранённый ChangeHistory в журнал после фиксации транзакции"""
+    if not connection.in_atomic_block:
+        write_entries([entry])
+        return
+    _buffer().append(entry)
+
+
+@contextmanager
+def shared_buffer():
+    """
+    Записи журнала внутри блока идут в буфер уровня, на котором блок открыт
+    (блок открывает свою точку сохранения уже внутри). При исключении записи
+    блока выбрасываются.
+    """
+    if not connection.in_atomic_block:
+        # Блок сам станет внешней транзакцией и получит свой буфер
+        yield
+        return
+    buffer = _buffer()
+    mark = len(buffer)
+    _local.__dict__.setdefault('shared', []).append(buffer)
+    try:
+        yield
+    except BaseException:
+        del buffer[mark:]
+        raise
+    finally:
+        _local.shared.pop()
+
+
+def write_entries(entries):
+    """Сохраняет записи журнала: в фоновом потоке, если он запущен, иначе сразу"""
+    writer = getattr(_local, 'writer', None)
+    if writer is not None:
+        writer.put(entries)
+    else:
+        ChangeHistory.objects.bulk_create(entries)
+
+
+class BackgroundWriter(threading.Thread):
+    """Поток, сохраняющий записи журнала пачками по batch_size"""
+
+    def __init__(self, batch_size=BACKGROUND_BATCH_SIZE):
+        super().__init__(name='audit-writer', daemon=True)
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.error = None
+
+    def put(self, entries):
+        self.queue.put(entries)
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        batch = []
+        try:
+            while True:
+                entries = self.queue.get()
+                if entries is None:
+                    break
+                batch.extend(entries)
+                if len(batch) >= self.batch_size or self.queue.empty():
+                    ChangeHistory.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                ChangeHistory.objects.bulk_create(batch)
+        except Exception as error:
+            self.error = error
+        finally:
+            # У потока своё соединение с БД
+            connection.close()
+
+
+@contextmanager
+def background_flush(batch_size=BACKGROUND_BATCH_SIZE):
+    """
+    Фоновая запись журнала для массовых операций. При выходе из блока
+    дожидается сохранения всех переданных записей.
+    """
+    if getattr(_local, 'writer', None) is not None:
+        yield
+        return
+    writer = BackgroundWriter(batch_size)
+    writer.start()
+    _local.writer = writer
+    try:
+        yield
+    finally:
+        _local.writer = None
+        writer.stop()
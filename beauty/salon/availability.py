@@ -0,0 +1,242 @@
+"""
+Движок свободного времени мастеров.
+
+Для каждого мастера в памяти процесса хранится индекс интервалов: отсортированные
+начала и окончания занятых промежутков и рабочие часы по дням недели. Индекс
+строится одним запросом по составному индексу (master, appointment_datetime) при
+первом обращении. Поиск свободных слотов на день - это бинарный поиск по
+индексу, без обращения к таблице записей.
+
+Актуальность индекса проверяется по версии расписания мастера в БД
+(MasterScheduleVersion): сигналы и массовые операции увеличивают её в той же
+транзакции, что и запись или рабочие часы, поэтому изменение, сделанное любым
+процессом (другим воркером, командой импорта), видно всем процессам сразу после
+фиксации. Проверка - один запрос по первичному ключу вместо перестройки индекса.
+
+Сетка времени одна для всего салона: начала слотов кратны SALON_SLOT_STEP_MINUTES
+от epoch (grid_ceil, on_grid). По ней же резервирование (reservations) проверяет
+начало записи и занимает ячейки, поэтому любой предложенный слот можно
+забронировать, даже если рабочий день начинается не на сетке (например, в 09:10 -
+первый слот тогда в 09:15).
+"""
+import threading
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+# Отменённые записи время мастера не занимают
+ACTIVE_STATUSES = ('pending', 'confirmed', 'completed')
+
+# Насколько в прошлое загружать записи: прошедшее время всё равно недоступно,
+# а услуга не длится дольше суток
+LOAD_WINDOW = timedelta(days=1)
+
+
+def get_schedule_versions(master_ids):
+    """Текущие версии расписаний мастеров {ID мастера: версия} (одним запросом)"""
+    from .models import MasterScheduleVersion
+
+    versions = dict.fromkeys(master_ids, 0)
+    versions.update(
+        MasterScheduleVersion.objects.filter(master_id__in=versions).values_list('master_id', 'version')
+    )
+    return versions
+
+
+def bump_schedule_versions(master_ids, create=True):
+    """
+    Помечает индексы мастеров устаревшими во всех процессах (в текущей
+    транзакции: другие процессы увидят новую версию вместе с изменениями).
+    create=False - не создавать недостающие строки (при удалениях, в том числе
+    каскадном удалении самого мастера).
+    """
+    from .models import MasterScheduleVersion
+
+    master_ids = sorted(set(master_ids))
+    if not master_ids:
+        return
+    versions = MasterScheduleVersion.objects.filter(master_id__in=master_ids)
+    updated = set(versions.values_list('master_id', flat=True))
+    versions.update(version=F('version') + 1)
+    missing = [master_id for master_id in master_ids if master_id not in updated]
+    if missing and create:
+        # Параллельная вставка не мешает: строки создаются с нулём и увеличиваются UPDATE
+        MasterScheduleVersion.objects.bulk_create(
+            [MasterScheduleVersion(master_id=master_id) for master_id in missing], ignore_conflicts=True
+        )
+        MasterScheduleVersion.objects.filter(master_id__in=missing).update(version=F('version') + 1)
+
+
+def grid_step(step_minutes=None):
+    """
+    Шаг сетки в секундах. Шаг, отличный от SALON_SLOT_STEP_MINUTES, округляется
+    вверх до кратного ему, чтобы слоты оставались на сетке резервирования.
+    """
+    base = settings.SALON_SLOT_STEP_MINUTES * 60
+    if not step_minutes:
+        return base
+    return -(-step_minutes * 60 // base) * base
+
+
+def grid_ceil(ts, step):
+    """Ближайшая точка сетки (отсчёт от epoch) не раньше ts, секунды epoch"""
+    return -(-ts // step) * step
+
+
+def on_grid(value):
+    """Лежит ли момент времени на сетке SALON_SLOT_STEP_MINUTES"""
+    return not value.microsecond and _to_timestamp(value) % grid_step() == 0
+
+
+def _default_working_hours():
+    start, end = settings.SALON_DEFAULT_WORKING_HOURS
+    return time.fromisoformat(start), time.fromisoformat(end)
+
+
+def _to_timestamp(value):
+    return int(value.timestamp())
+
+
+def _day_bounds(day, start, end):
+    """Начало и конец рабочего дня в секундах epoch"""
+    tz = timezone.get_current_timezone()
+    return (
+        _to_timestamp(timezone.make_aware(datetime.combine(day, start), tz)),
+        _to_timestamp(timezone.make_aware(datetime.combine(day, end), tz)),
+    )
+
+
+class MasterSchedule:
+    """Индекс занятых интервалов и рабочих часов одного мастера"""
+    __slots__ = ('version', 'starts', 'ends', 'max_length', 'working_hours')
+
+    def __init__(self, version, intervals, working_hours):
+        intervals.sort()
+        self.version = version
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+        self.max_length = max((end - start for start, end in intervals), default=0)
+        self.working_hours = working_hours
+
+    def hours_for(self, weekday):
+        """Рабочие часы на день недели или None, если день выходной"""
+        if not self.working_hours:
+            return _default_working_hours()
+        return self.working_hours.get(weekday)
+
+    def busy_between(self, start, end):
+        """Занятые интервалы, пересекающие [start, end), отсортированные по началу"""
+        # Интервал не длиннее max_length, поэтому всё, что началось раньше, уже закончилось
+        i = bisect_left(self.starts, start - self.max_length)
+        busy = []
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                busy.append((self.starts[i], self.ends[i]))
+            i += 1
+        return busy
+
+
+class AvailabilityIndex:
+    """Потокобезопасный реестр индексов расписания мастеров"""
+
+    def __init__(self):
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Сбрасывает все загруженные индексы процесса"""
+        with self._lock:
+            self._schedules.clear()
+
+    def get(self, master_id, version=None):
+        """
+        Индекс мастера; перестраивается, если версия расписания в БД изменилась.
+        version - уже прочитанная версия (get_schedule_versions), чтобы не читать её снова.
+        """
+        if version is None:
+            version = get_schedule_versions([master_id])[master_id]
+        schedule = self._schedules.get(master_id)
+        if schedule is not None and schedule.version == version:
+            return schedule
+        with self._lock:
+            schedule = self._schedules.get(master_id)
+            if schedule is None or schedule.version != version:
+                schedule = self._load(master_id, version)
+                self._schedules[master_id] = schedule
+        return schedule
+
+    def _load(self, master_id, version):
+        from .models import Booking, WorkingHours
+
+        rows = Booking.objects.filter(
+            master_id=master_id,
+            appointment_datetime__gte=timezone.now() - LOAD_WINDOW,
+            status__in=ACTIVE_STATUSES,
+        ).order_by().values_list('appointment_datetime', 'end_datetime')
+        intervals = []
+        for start, end in rows:
+            if end is None:
+                end = start + timedelta(hours=1)
+            intervals.append((_to_timestamp(start), _to_timestamp(end)))
+
+        working_hours = {
+            weekday: (start_time, end_time)
+            for weekday, start_time, end_time in WorkingHours.objects.filter(
+                master_id=master_id
+            ).values_list('weekday', 'start_time', 'end_time')
+        }
+        return MasterSchedule(version, intervals, working_hours)
+
+    def free_intervals(self, master_id, day, now=None, version=None):
+        """Свободные промежутки мастера на дату в виде пар (начало, конец) в секундах epoch"""
+        schedule = self.get(master_id, version)
+        hours = schedule.hours_for(day.weekday())
+        if hours is None:
+            return []
+        return self._free_intervals(schedule, _day_bounds(day, *hours), now)
+
+    def free_slots(self, master_id, day, duration_minutes, step_minutes=None, now=None, version=None):
+        """Начала слотов заданной длительности на сетке салона (секунды epoch)"""
+        schedule = self.get(master_id, version)
+        hours = schedule.hours_for(day.weekday())
+        if hours is None:
+            return []
+        bounds = _day_bounds(day, *hours)
+        step = grid_step(step_minutes)
+        duration = duration_minutes * 60
+
+        slots = []
+        for start, end in self._free_intervals(schedule, bounds, now):
+            # Выравниваем начало по общей сетке (та же проверяется при записи)
+            slot = grid_ceil(start, step)
+            while slot + duration <= end:
+                slots.append(slot)
+                slot += step
+        return slots
+
+    @staticmethod
+    def _free_intervals(schedule, bounds, now):
+        open_ts, close_ts = bounds
+        cursor = max(open_ts, _to_timestamp(now or timezone.now()))
+
+        free = []
+        for start, end in schedule.busy_between(cursor, close_ts):
+            if start > cursor:
+                free.append((cursor, start))
+            cursor = max(cursor, end)
+            if cursor >= close_ts:
+                break
+        if cursor < close_ts:
+            free.append((cursor, close_ts))
+        return free
+
+
+def from_timestamp(value):
+    """Секунды epoch -> aware datetime в текущем часовом поясе"""
+    return datetime.fromtimestamp(value, tz=timezone.get_current_timezone())
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,121 @@
+"""
+Текущие и архивные записи.
+
+Завершённые и отменённые записи старше SALON_BOOKING_ARCHIVE_DAYS команда
+archive_bookings переносит из Booking в ArchivedBooking (пачками, ID записей
+сохраняются). Поэтому списки, фильтры и поиск по умолчанию работают с
+небольшой таблицей текущих записей.
+
+Перенос - не изменение записи: строки удаляются из Booking без сигналов,
+счётчики (BookingCounter), дневные агрегаты и история продолжают их учитывать,
+а пересчёт счётчиков и агрегатов читает обе таблицы через BookingRecord.
+Архивная запись, удалённая каскадом вместе с клиентом, мастером или услугой,
+вычитается из счётчиков и агрегатов сигналом post_delete.
+Из полнотекстового индекса и плоской таблицы списков (BookingListItem)
+архивные записи убираются; поиск по архиву идёт через LIKE по search_fields.
+
+Вместе с архивом (представление BookingRecord) списки читают записи, только
+если начало запрошенного периода не позже самой поздней архивной записи или
+архив запрошен явно (?archived=true в API, фильтр "Архив записей" в админке).
+Без нижней границы периода показываются только текущие записи.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .caching import coalesced_get
+from .models import ArchivedBooking, Booking, MasterTimeSlot
+from .read_model import remove_items
+from .response_cache import bump_generation_on_commit, get_generations
+from .search import BOOKING_INDEX
+
+FINISHED_STATUSES = ('completed', 'cancelled')
+# Колонки, общие для Booking, ArchivedBooking и BookingRecord
+COLUMNS = (
+    'booking_id', 'user_id', 'master_id', 'service_id', 'appointment_datetime', 'end_datetime', 'status',
+    'created_at', 'updated_at',
+)
+
+
+def archive_boundary():
+    """Время приёма самой поздней архивной записи (None, если архив пуст)"""
+    generation, = get_generations((ArchivedBooking,))
+    return coalesced_get(
+        f'booking-archive:boundary:{generation}',
+        lambda: ArchivedBooking.objects.aggregate(last=Max('appointment_datetime'))['last'],
+        settings.SALON_RESPONSE_CACHE_SECONDS,
+    )
+
+
+def period_start(value):
+    """Начало периода из параметра запроса (дата или дата и время); None, если не задано или с ошибкой"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        value = datetime.combine(value, time.min)
+    else:
+        try:
+            value = forms.DateTimeField(required=False).clean(value)
+        except ValidationError:
+            return None
+        if value is None:
+            return None
+    return timezone.make_aware(value) if settings.USE_TZ and timezone.is_naive(value) else value
+
+
+def period_needs_archive(start):
+    """Заходит ли период, начинающийся со start, в архив"""
+    if start is None:
+        return False
+    boundary = archive_boundary()
+    return boundary is not None and start <= boundary
+
+
+def archive_cutoff(days=None):
+    """Граница переноса: записи с приёмом раньше неё переносятся в архив"""
+    days = settings.SALON_BOOKING_ARCHIVE_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def finished_before(before):
+    return Booking.objects.filter(status__in=FINISHED_STATUSES, appointment_datetime__lt=before)
+
+
+def archive_bookings(before, batch_size=None, progress=None):
+    """
+    Переносит завершённые и отменённые записи с приёмом раньше before в архив;
+    progress(перенесено) вызывается после каждой пачки. Возвращает число записей.
+    """
+    batch_size = batch_size or settings.SALON_BOOKING_ARCHIVE_BATCH_SIZE
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(finished_before(before).select_for_update().order_by('pk').values(*COLUMNS)[:batch_size])
+            if not rows:
+                return moved
+            pks = [row['booking_id'] for row in rows]
+            ArchivedBooking.objects.bulk_create([ArchivedBooking(**row) for row in rows])
+            # Завершённые и отменённые записи время не занимают, ячейки могли остаться
+            # только после массовых изменений в обход сигналов
+            MasterTimeSlot.objects.filter(booking_id__in=pks).delete()
+            # Удаление прямым DELETE, а не queryset.delete(): для счётчиков, дневных
+            # агрегатов и истории запись не удалена, её post_delete-сигналы (журнал,
+            # пересчёт статистики, версии расписания) срабатывать не должны
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {Booking._meta.db_table} WHERE {Booking._meta.pk.column} '
+                    f'IN ({", ".join(["%s"] * len(pks))})',
+                    pks,
+                )
+            BOOKING_INDEX.remove(pks)
+            remove_items(pks)
+            bump_generation_on_commit(Booking)
+            bump_generation_on_commit(ArchivedBooking)
+        moved += len(rows)
+        if progress is not None:
+            progress(moved)
@@ -0,0 +1,349 @@
+"""
+Потоковый массовый импорт записей (команда import_bookings и массовый импорт в админке).
+
+Импорт через BookingResource ищет клиента, мастера и услугу отдельными
+запросами на каждую строку и сохраняет записи по одной с сигналами и
+simple_history. Здесь файл (CSV, XLSX или NDJSON) читается построчно и
+обрабатывается пачками:
+
+- разбор строк (даты, статусы) - чистый Python, его можно раздать пулу
+  процессов (workers); порядок пачек при этом сохраняется;
+- клиенты (по email, без него - по имени), мастера (по имени) и услуги (по
+  названию) ищутся в кэше в памяти, недостающие ключи пачки дочитываются
+  одним запросом на модель, отсутствующие тоже запоминаются;
+- занятость времени проверяется для всей пачки одним запросом, записи
+  вставляются bulk_create в транзакции пачки, история simple_history, журнал
+  изменений, счётчики и поисковый индекс обновляются пачкой
+  (bulk.insert_bookings), журнал пишется в фоновом потоке.
+
+Проверка даты в будущем, как в API, не выполняется: импортируются и прошлые
+записи. Начало записи, как и в API, должно лежать на сетке расписания. Колонки - как у BookingResource (user__name, master__full_name, ...)
+или как у выгрузки /api/bookings/export/ (user_name, master, ...).
+"""
+import csv
+import io
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .audit import background_flush
+from .bulk import RACE_RETRIES, claim_slots, insert_bookings
+from .export import EXPORT_COLUMNS
+from .models import Booking, Master, Service, User
+from .reservations import check_alignment
+from .response_cache import bump_generation_on_commit
+
+FORMATS = ('csv', 'xlsx', 'ndjson')
+# Статусы в выгрузке BookingResource
+STATUS_LABELS = {
+    'pending': 'В ожидании',
+    'confirmed': 'Подтверждена',
+    'completed': 'Завершена',
+    'cancelled': 'Отменена',
+}
+# Статус в файле (код, подпись модели или подпись выгрузки, без учёта регистра) -> код
+STATUS_CODES = {
+    **{code.lower(): code for code, _ in Booking.STATUS_CHOICES},
+    **{str(label).lower(): code for code, label in Booking.STATUS_CHOICES},
+    **{label.lower(): code for code, label in STATUS_LABELS.items()},
+}
+DATETIME_FORMATS = ('%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%Y-%m-%d %H:%M')
+# Колонки выгрузки API -> колонки BookingResource
+COLUMN_ALIASES = {header: path for header, path in EXPORT_COLUMNS}
+# Строк для одной задачи пула процессов и число задач в работе на процесс
+DEFAULT_BATCH_SIZE = 1000
+TASKS_PER_WORKER = 2
+# Сколько ошибок хранит отчёт (остальные только считаются)
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_rows(file, file_format):
+    """Строки файла как словари {колонка: значение}; file открыт в двоичном режиме"""
+    if file_format == 'csv':
+        yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    elif file_format == 'ndjson':
+        for line in io.TextIOWrapper(file, encoding='utf-8-sig'):
+            if line.strip():
+                yield json.loads(line)
+    elif file_format == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = [str(header) if header is not None else '' for header in next(rows, ())]
+            for row in rows:
+                if any(value is not None for value in row):
+                    yield dict(zip(headers, row))
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f'Неизвестный формат {file_format}, допустимы: {", ".join(FORMATS)}')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _datetime(value):
+    if isinstance(value, datetime):
+        return value
+    value = _text(value)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for datetime_format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format)
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+def parse_rows(rows):
+    """
+    Разбор пачки [(номер строки, словарь)] без обращения к БД (выполняется и в
+    пуле процессов). Возвращает [(номер строки, значения или None, ошибки или None)].
+    Время без часового пояса остаётся наивным - пояс назначается при сборке записи.
+    """
+    parsed = []
+    for line, raw in rows:
+        row = {COLUMN_ALIASES.get(name, name): value for name, value in raw.items()}
+        values = {
+            'user_name': _text(row.get('user__name')),
+            'user_email': _text(row.get('user__email')),
+            'master': _text(row.get('master__full_name')),
+            'service': _text(row.get('service__title')),
+        }
+        errors = {}
+        if not values['user_email'] and not values['user_name']:
+            errors['user'] = ['Не указан клиент (user__email или user__name)']
+        for name, column in (('master', 'master__full_name'), ('service', 'service__title')):
+            if not values[name]:
+                errors[name] = [f'Не заполнена колонка {column}']
+        try:
+            values['appointment_datetime'] = _datetime(row.get('appointment_datetime'))
+        except ValueError:
+            errors['appointment_datetime'] = ['Неверный формат даты и времени']
+        status = _text(row.get('status')) or 'pending'
+        values['status'] = STATUS_CODES.get(status.lower())
+        if values['status'] is None:
+            errors['status'] = [f'Неизвестный статус "{status}"']
+        parsed.append((line, None, errors) if errors else (line, values, None))
+    return parsed
+
+
+AMBIGUOUS = object()
+
+
+class LookupCache:
+    """
+    Кэш поиска объектов по значению поля: ключ -> кортеж колонок, None (нет
+    такого объекта) или AMBIGUOUS (несколько объектов с этим значением)
+    """
+
+    def __init__(self, model, field_name, columns):
+        self.model = model
+        self.field_name = field_name
+        self.columns = columns
+        self.values = {}
+
+    def load(self, keys):
+        """Дочитывает из БД ключи, которых ещё нет в кэше (один запрос)"""
+        missing = {key for key in keys if key and key not in self.values}
+        if not missing:
+            return
+        for key in missing:
+            self.values[key] = None
+        found = set()
+        rows = self.model.objects.order_by().filter(**{f'{self.field_name}__in': missing}).values_list(
+            self.field_name, *self.columns
+        )
+        for key, *columns in rows:
+            self.values[key] = AMBIGUOUS if key in found else tuple(columns)
+            found.add(key)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def add(self, key, columns):
+        self.values[key] = tuple(columns)
+
+
+@dataclass
+class ImportReport:
+    """Итог импорта: число строк, созданных записей, ошибок и первые ошибки по номерам строк"""
+    rows: int = 0
+    created: int = 0
+    failed: int = 0
+    users_created: int = 0
+    errors: list = field(default_factory=list)
+
+    def add(self, results):
+        self.rows += len(results)
+        for line, booking, errors in results:
+            if booking is not None:
+                self.created += 1
+                continue
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append((line, errors))
+
+
+class BookingImporter:
+    """
+    Импорт пачек разобранных строк. create_users - создавать клиентов, которых
+    нет (по email); dry_run - только проверка, без записи в БД.
+    """
+
+    def __init__(self, changed_by='', create_users=False, dry_run=False):
+        self.changed_by = changed_by
+        self.create_users = create_users
+        self.dry_run = dry_run
+        self.users_by_email = LookupCache(User, 'email', ('pk',))
+        self.users_by_name = LookupCache(User, 'name', ('pk',))
+        self.masters = LookupCache(Master, 'full_name', ('pk',))
+        self.services = LookupCache(Service, 'title', ('pk', 'duration_minutes'))
+        self.report = ImportReport()
+
+    def _create_missing_users(self, parsed):
+        new_users = {}
+        for _, values, _ in parsed:
+            email = values and values['user_email']
+            if email and self.users_by_email.get(email) is None and email not in new_users:
+                new_users[email] = User(name=values['user_name'] or email, email=email)
+        if not new_users:
+            return
+        User.objects.bulk_create(new_users.values())
+        for email, user in new_users.items():
+            self.users_by_email.add(email, (user.pk,))
+        self.report.users_created += len(new_users)
+        bump_generation_on_commit(User)
+
+    def _resolve(self, values, errors):
+        if values['user_email']:
+            user = self.users_by_email.get(values['user_email'])
+            user_key = values['user_email']
+        else:
+            user = self.users_by_name.get(values['user_name'])
+            user_key = values['user_name']
+        resolved = {}
+        for name, key, found in (
+            ('user', user_key, user),
+            ('master', values['master'], self.masters.get(values['master'])),
+            ('service', values['service'], self.services.get(values['service'])),
+        ):
+            if found is None:
+                errors[name] = [f'Не найден объект "{key}"']
+            elif found is AMBIGUOUS:
+                errors[name] = [f'Несколько объектов "{key}"']
+            else:
+                resolved[name] = found
+        return resolved
+
+    def build(self, parsed):
+        """Несохранённые записи пачки: [(номер строки, запись или None, ошибки или None)]"""
+        current_timezone = timezone.get_current_timezone()
+        results = []
+        for line, values, errors in parsed:
+            if values is None:
+                results.append((line, None, errors))
+                continue
+            errors = {}
+            resolved = self._resolve(values, errors)
+            if errors:
+                results.append((line, None, errors))
+                continue
+            appointment = values['appointment_datetime']
+            if settings.USE_TZ and timezone.is_naive(appointment):
+                appointment = timezone.make_aware(appointment, current_timezone)
+            try:
+                check_alignment(appointment)
+            except ValidationError as error:
+                results.append((line, None, {'appointment_datetime': error.messages}))
+                continue
+            service_id, duration = resolved['service']
+            booking = Booking(
+                user_id=resolved['user'][0], master_id=resolved['master'][0], service_id=service_id,
+                appointment_datetime=appointment, status=values['status'],
+            )
+            booking.end_datetime = appointment + timedelta(minutes=duration)
+            results.append((line, booking, None))
+        return results
+
+    def import_batch(self, parsed):
+        """Проверяет и сохраняет пачку разобранных строк; возвращает результаты пачки"""
+        rows = [values for _, values, _ in parsed if values is not None]
+        self.users_by_email.load(values['user_email'] for values in rows)
+        self.users_by_name.load(values['user_name'] for values in rows if not values['user_email'])
+        self.masters.load(values['master'] for values in rows)
+        self.services.load(values['service'] for values in rows)
+        if self.create_users and not self.dry_run:
+            self._create_missing_users(parsed)
+
+        for attempt in range(RACE_RETRIES + 1):
+            results = self.build(parsed)
+            claimed = claim_slots(results)
+            if self.dry_run:
+                break
+            try:
+                insert_bookings(results, claimed, changed_by=self.changed_by)
+            except IntegrityError:
+                # Ячейки заняли между проверкой и вставкой - проверяем пачку заново
+                if attempt == RACE_RETRIES:
+                    raise
+                continue
+            break
+        self.report.add(results)
+        return results
+
+
+def _numbered_batches(rows, batch_size):
+    numbered = enumerate(rows, start=2)  # первая строка файла - заголовок
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def parsed_batches(rows, batch_size=DEFAULT_BATCH_SIZE, workers=0):
+    """Разобранные пачки строк по порядку; при workers > 0 разбор идёт в пуле процессов"""
+    batches = _numbered_batches(rows, batch_size)
+    if not workers:
+        yield from map(parse_rows, batches)
+        return
+    with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+        # Ограниченное число задач в работе: файл не читается в память целиком
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(parse_rows, batch))
+            if len(pending) >= workers * TASKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_bookings(rows, batch_size=DEFAULT_BATCH_SIZE, workers=0, changed_by='', create_users=False,
+                    dry_run=False, progress=None):
+    """
+    Импортирует записи из строк-словарей rows; progress(report) вызывается
+    после каждой пачки. Возвращает ImportReport.
+    """
+    importer = BookingImporter(changed_by=changed_by, create_users=create_users, dry_run=dry_run)
+    with background_flush():
+        for parsed in parsed_batches(rows, batch_size, workers):
+            importer.import_batch(parsed)
+            if progress is not None:
+                progress(importer.report)
+    return importer.report
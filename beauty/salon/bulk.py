@@ -0,0 +1,121 @@
+"""
+Массовое создание записей (POST /api/bookings/bulk/).
+
+Каждый элемент проверяется правилами BookingSerializer, но без запросов на
+элемент: пользователи, мастера и услуги загружаются заранее одним запросом на
+модель, а занятость времени проверяется для всей пачки одним запросом к
+MasterTimeSlot (с учётом пересечений элементов пачки между собой). Прошедшие
+проверку записи вставляются через bulk_create в одной транзакции, история и
+счётчики обновляются пачкой (signals.bookings_bulk_created).
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Booking, Master, MasterTimeSlot, Service, User
+from .reservations import CONFLICT_MESSAGE, occupies_time, slot_starts
+from .serializers import BookingSerializer
+from .signals import bookings_bulk_created
+
+RELATED_FIELDS = (('user', User), ('master', Master), ('service', Service))
+# Сколько раз повторить вставку, если ячейки заняли параллельным запросом
+RACE_RETRIES = 2
+
+
+def preload_related(items):
+    """Загружает связанные объекты всех элементов: {модель: {pk: объект}}"""
+    preloaded = {}
+    for field, model in RELATED_FIELDS:
+        pks = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                pks.add(model._meta.pk.to_python(item.get(field)))
+            except ValidationError:
+                continue
+        pks.discard(None)
+        preloaded[model] = model.objects.in_bulk(pks) if pks else {}
+    return preloaded
+
+
+def validate_items(items, context):
+    """Возвращает [(индекс, несохранённая запись или None, ошибки или None)]"""
+    results = []
+    for index, item in enumerate(items):
+        serializer = BookingSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results.append((index, None, serializer.errors))
+            continue
+        booking = Booking(**serializer.validated_data)
+        booking.end_datetime = booking.compute_end_datetime()
+        results.append((index, booking, None))
+    return results
+
+
+def claim_slots(results):
+    """
+    Проверяет занятость времени всей пачки; элементы с конфликтом превращает
+    в ошибки. Возвращает {индекс: ячейки} для оставшихся записей.
+    """
+    wanted = {}
+    for index, booking, _ in results:
+        if booking is not None and occupies_time(booking):
+            wanted[index] = slot_starts(booking.appointment_datetime, booking.end_datetime)
+    taken = set()
+    if wanted:
+        master_ids = {booking.master_id for _, booking, _ in results if booking is not None}
+        starts = [start for slots in wanted.values() for start in slots]
+        taken = set(MasterTimeSlot.objects.filter(
+            master_id__in=master_ids,
+            slot_start__gte=min(starts),
+            slot_start__lte=max(starts),
+        ).values_list('master_id', 'slot_start'))
+
+    claimed = {}
+    for position, (index, booking, errors) in enumerate(results):
+        if booking is None or index not in wanted:
+            continue
+        cells = {(booking.master_id, start) for start in wanted[index]}
+        if cells & taken:
+            results[position] = (index, None, {'non_field_errors': [CONFLICT_MESSAGE]})
+            continue
+        # Время, занятое этим элементом, недоступно следующим элементам пачки
+        taken |= cells
+        claimed[index] = wanted[index]
+    return claimed
+
+
+def insert_bookings(results, claimed, changed_by=''):
+    """Вставляет записи и занятые ими ячейки в одной транзакции"""
+    bookings = [booking for _, booking, _ in results if booking is not None]
+    with transaction.atomic():
+        Booking.objects.bulk_create(bookings)
+        by_index = {index: booking for index, booking, _ in results if booking is not None}
+        MasterTimeSlot.objects.bulk_create([
+            MasterTimeSlot(master_id=by_index[index].master_id, booking_id=by_index[index].pk, slot_start=start)
+            for index, starts in claimed.items()
+            for start in starts
+        ])
+        bookings_bulk_created(bookings, changed_by=changed_by)
+    for booking in bookings:
+        booking._snapshot_tracked_fields()
+    return bookings
+
+
+def bulk_create_bookings(items, context=None, changed_by=''):
+    """
+    Создаёт записи из списка items; возвращает [(индекс, запись или None, ошибки или None)]
+    в порядке элементов.
+    """
+    context = dict(context or {}, bulk=True, preloaded=preload_related(items))
+    for attempt in range(RACE_RETRIES + 1):
+        results = validate_items(items, context)
+        claimed = claim_slots(results)
+        try:
+            insert_bookings(results, claimed, changed_by=changed_by)
+        except IntegrityError:
+            # Ячейки заняли между проверкой и вставкой - проверяем пачку заново
+            if attempt == RACE_RETRIES:
+                raise
+            continue
+        return results
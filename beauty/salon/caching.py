@@ -0,0 +1,44 @@
+"""
+Вспомогательные функции кэширования.
+
+coalesced_get() хранит значение вместе со сроком свежести. Когда срок истёк,
+пересчёт выполняет только тот запрос, который первым захватил блокировку
+(cache.add атомарен), остальные в это время получают предыдущее значение
+или недолго ждут первого результата. Так одновременные запросы к остывшему
+кэшу не запускают одинаковый тяжёлый пересчёт десятки раз.
+"""
+import time
+
+from django.core.cache import cache
+
+# Устаревшее значение хранится дольше срока свежести, чтобы было что отдать во время пересчёта
+STALE_FACTOR = 10
+WAIT_STEP = 0.05
+
+
+def coalesced_get(key, compute, timeout, lock_timeout=30, wait=5.0):
+    """Значение из кэша; при устаревании его пересчитывает только один запрос"""
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    lock_key = f'{key}:lock'
+    deadline = now + wait
+    while True:
+        if cache.add(lock_key, 1, lock_timeout):
+            try:
+                value = compute()
+                cache.set(key, (value, time.time() + timeout), timeout * STALE_FACTOR)
+                return value
+            finally:
+                cache.delete(lock_key)
+        if entry is not None:
+            # Пересчёт уже идёт в другом запросе - отдаём предыдущее значение
+            return entry[0]
+        if time.time() >= deadline:
+            return compute()
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
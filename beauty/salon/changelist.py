@@ -0,0 +1,180 @@
+"""
+Списки админки для больших таблиц.
+
+На миллионах строк страница списка тратит время не на сами сто строк, а на
+служебные запросы: точный COUNT(*) пагинатора (и второй - для "всего N"),
+загрузку всех мастеров и услуг в боковые фильтры и выборки различных дат для
+date_hierarchy. ScalableChangeListMixin убирает их из каждого показа страницы:
+
+- количество строк берётся из агрегата (get_changelist_rollup), а если его
+  нет - из кэша; общее количество без фильтров не считается;
+- варианты фильтров по связям (CachedRelatedFieldListFilter) загружаются
+  только при выводе боковой панели и кэшируются;
+- годы, месяцы и дни date_hierarchy берутся из агрегата или из кэша.
+
+Ключи кэша включают SQL запроса и поколения моделей changelist_dependencies
+(response_cache), поэтому изменение данных сразу делает их устаревшими. Для
+таблиц без поколений (журнал изменений) значения отстают от данных не больше
+чем на SALON_ADMIN_CACHE_SECONDS - для списка это допустимая оценка.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.admin import RelatedFieldListFilter
+from django.contrib.admin.views.main import ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, cached_property
+
+from .caching import coalesced_get
+from .response_cache import get_generations
+
+# Агрегат, заменяющий таблицу в списке: queryset с теми же фильтрами, поле
+# количества строк и поле даты (день) для date_hierarchy
+Rollup = namedtuple('Rollup', ('queryset', 'count_field', 'date_field'))
+
+
+def cached_value(name, queryset, dependencies, compute):
+    """Результат compute() для queryset из кэша; name отличает разные вычисления"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return compute()
+    parts = [name, queryset.db, sql, params, get_generations(dependencies)]
+    key = 'admin-changelist:' + hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return coalesced_get(key, compute, settings.SALON_ADMIN_CACHE_SECONDS)
+
+
+def filter_params(request):
+    """
+    Параметры фильтрации списка: {имя: [значения]} без сортировки, страницы
+    и т. п. Поиск (?q=) возвращается отдельно, так как агрегаты его не учитывают.
+    """
+    params = {
+        name: values for name, values in request.GET.lists()
+        if name not in IGNORED_PARAMS and name not in (PAGE_VAR, ERROR_FLAG)
+    }
+    return params, request.GET.get(SEARCH_VAR, '')
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт количество строк из агрегата или кэша"""
+
+    def __init__(self, *args, dependencies=(), rollup=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependencies = dependencies
+        self.rollup = rollup
+
+    @cached_property
+    def count(self):
+        if self.rollup is not None:
+            source, field = self.rollup.queryset, self.rollup.count_field
+            return cached_value('count', source, self.dependencies,
+                                lambda: source.aggregate(total=Sum(field))['total'] or 0)
+        return cached_value('count', self.object_list, self.dependencies, self.object_list.count)
+
+
+class CachedRelatedFieldListFilter(RelatedFieldListFilter):
+    """
+    Фильтр по связи, варианты которого загружаются только при выводе боковой
+    панели и кэшируются по поколению связанной модели
+    """
+
+    def has_output(self):
+        # Проверка "есть ли что показать" загрузила бы все варианты на каждой странице
+        return True
+
+    def field_choices(self, field, request, model_admin):
+        related = field.remote_field.model._default_manager.all()
+
+        def load():
+            return cached_value(
+                f'choices:{field.model._meta.label_lower}.{field.name}', related, (field.remote_field.model,),
+                lambda: super(CachedRelatedFieldListFilter, self).field_choices(field, request, model_admin),
+            )
+        return SimpleLazyObject(load)
+
+
+class DateHierarchyQuerySet:
+    """
+    changelist.queryset для тега date_hierarchy: границы дат и списки годов,
+    месяцев и дней из агрегата или из кэша. Остальные атрибуты - от queryset.
+    rollup - Rollup с теми же фильтрами, что у списка, или None.
+    """
+
+    def __init__(self, queryset, dependencies, rollup=None):
+        self.queryset = queryset
+        self.dependencies = dependencies
+        self.rollup = rollup
+
+    def __getattr__(self, name):
+        return getattr(self.queryset, name)
+
+    def _rollup_datetime(self, day):
+        """Дата агрегата как начало дня в текущем часовом поясе"""
+        if day is None:
+            return None
+        value = datetime.combine(day, time.min)
+        return timezone.make_aware(value) if settings.USE_TZ else value
+
+    def aggregate(self, **expressions):
+        if self.rollup is not None and set(expressions) == {'first', 'last'}:
+            source, field = self.rollup.queryset, self.rollup.date_field
+            bounds = cached_value('bounds', source, self.dependencies,
+                                  lambda: source.aggregate(first=Min(field), last=Max(field)))
+            return {name: self._rollup_datetime(value) for name, value in bounds.items()}
+        return cached_value(f'aggregate:{expressions!r}', self.queryset, self.dependencies,
+                            lambda: self.queryset.aggregate(**expressions))
+
+    def dates(self, field_name, kind, order='ASC'):
+        return cached_value(f'dates:{field_name}:{kind}:{order}', self.queryset, self.dependencies,
+                            lambda: list(self.queryset.dates(field_name, kind, order)))
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if self.rollup is not None and tzinfo is None:
+            source, field = self.rollup.queryset, self.rollup.date_field
+            days = cached_value(f'dates:{kind}:{order}', source, self.dependencies,
+                                lambda: list(source.dates(field, kind, order)))
+            return [self._rollup_datetime(day) for day in days]
+        return cached_value(f'datetimes:{field_name}:{kind}:{order}:{tzinfo}', self.queryset, self.dependencies,
+                            lambda: list(self.queryset.datetimes(field_name, kind, order, tzinfo)))
+
+
+class ScalableChangeList(ChangeList):
+    """ChangeList, в котором date_hierarchy читает даты через DateHierarchyQuerySet"""
+
+    def get_results(self, request):
+        super().get_results(request)
+        # Дальше queryset нужен только тегу date_hierarchy (выгрузка import-export
+        # строит свой ChangeList без get_results() и получает обычный queryset)
+        if self.date_hierarchy:
+            self.queryset = DateHierarchyQuerySet(
+                self.queryset, self.model_admin.changelist_dependencies,
+                self.model_admin.get_changelist_rollup(request),
+            )
+
+
+class ScalableChangeListMixin:
+    """
+    Список админки для больших таблиц. changelist_dependencies - модели, при
+    изменении которых закэшированные количества и даты устаревают.
+    """
+    changelist_dependencies = ()
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return CachedCountPaginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            dependencies=self.changelist_dependencies, rollup=self.get_changelist_rollup(request),
+        )
+
+    def get_changelist_rollup(self, request):
+        """Rollup для текущих фильтров списка, если агрегат может заменить таблицу, иначе None"""
+        return None
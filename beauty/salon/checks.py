@@ -0,0 +1,30 @@
+"""
+Проверки настроек салона (manage.py check --deploy).
+
+Поколения моделей для кэша ответов API и списков админки (salon.response_cache)
+хранятся в кэше default. Локальный кэш процесса (LocMemCache) у каждого
+процесса свой: запись, обработанная одним процессом, увеличивает поколение
+только в нём, и остальные процессы продолжают отдавать устаревшие ответы до
+истечения TTL. Поэтому при нескольких процессах нужен общий кэш (Redis,
+Memcached, база данных).
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш default, в котором хранятся поколения моделей, должен быть общим для процессов"""
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [Warning(
+        'Поколения кэша ответов хранятся в локальном кэше процесса: при нескольких '
+        'процессах запись в одном не сбрасывает закэшированные ответы в остальных.',
+        hint='Укажите в CACHES["default"] общий кэш (Redis, Memcached, DatabaseCache) '
+             'или запускайте один процесс.',
+        id='salon.W001',
+    )]
@@ -0,0 +1,79 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для ViewSet'ов.
+
+Валидаторы считаются без сериализации: для списка - одним агрегирующим
+запросом max(updated_at) и count по отфильтрованному queryset (вместе с
+updated_at связанных объектов, которые попадают во вложенные поля ответа),
+для объекта - по updated_at уже загруженного объекта и его связей. Если
+клиент прислал совпадающий If-None-Match / If-Modified-Since, отдаётся 304
+без вызова сериализатора.
+
+Список отдаётся только с ETag: удаление строки не меняет max(updated_at), и
+клиент с одним If-Modified-Since получил бы 304 и устаревший список, а ETag
+включает count и после удаления меняется.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def _max_datetime(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+class ConditionalGetMixin:
+    """ETag для list, ETag и Last-Modified для retrieve"""
+    # Связи (select_related), поля которых выводятся во вложенных сериализаторах
+    conditional_related = ()
+    # Время изменения строки списка
+    conditional_updated_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        aggregates = {'count': Count('pk'), 'last': Max(self.conditional_updated_field)}
+        for relation in self.conditional_related:
+            aggregates[relation] = Max(f'{relation}__updated_at')
+        stamp = queryset.order_by().aggregate(**aggregates)
+        etag = self.make_etag(request, *[stamp[key] for key in sorted(stamp)])
+
+        not_modified = self.not_modified(request, etag, None)
+        if not_modified is not None:
+            return not_modified
+        response = super().list(request, *args, **kwargs)
+        return self.set_validators(response, etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Обратной связи один-к-одному может не быть (getattr с умолчанием вернёт None)
+        related = [getattr(instance, relation, None) for relation in self.conditional_related]
+        stamps = [instance.updated_at] + [obj.updated_at if obj is not None else None for obj in related]
+        last_modified = _max_datetime(stamps)
+        etag = self.make_etag(request, instance.pk, *stamps)
+
+        not_modified = self.not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        return self.set_validators(Response(serializer.data), etag, last_modified)
+
+    def make_etag(self, request, *parts):
+        """ETag зависит от данных, адреса с параметрами, формата ответа и пользователя"""
+        key = [request.get_full_path(), request.accepted_renderer.format, request.user.pk, *parts]
+        return quote_etag(hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest())
+
+    def not_modified(self, request, etag, last_modified):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            return None
+        return self.set_validators(response, etag, last_modified)
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
@@ -0,0 +1,127 @@
+"""
+Счётчики записей по дню приёма и статусу.
+
+Сигналы записи изменяют BookingCounter в той же транзакции, что и саму запись,
+поэтому статистика читается из маленькой таблицы одним запросом вместо
+нескольких COUNT по всей таблице записей. Массовые операции в обход сигналов
+(queryset.update, bulk_create) исправляет команда reconcile_booking_counters.
+Перенос записей в архив (salon.booking_archive) счётчики не меняет, а удаление
+архивной записи (каскадом вместе с клиентом, мастером или услугой) вычитает её
+так же, как удаление текущей.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caching import coalesced_get
+from .models import Booking, BookingCounter, BookingRecord
+
+STATISTICS_CACHE_KEY = 'booking:statistics'
+UPCOMING_STATUSES = ('pending', 'confirmed')
+UPCOMING_DAYS = 30
+
+
+def counter_key(appointment_datetime, status):
+    """Ключ счётчика (день в текущем часовом поясе, статус)"""
+    return timezone.localdate(appointment_datetime), status
+
+
+def _add(day, status, delta):
+    updated = BookingCounter.objects.filter(day=day, status=status).update(count=F('count') + delta)
+    if not updated:
+        # Строки ещё нет: создаём с нулём (параллельная вставка не мешает) и увеличиваем
+        BookingCounter.objects.bulk_create([BookingCounter(day=day, status=status, count=0)], ignore_conflicts=True)
+        BookingCounter.objects.filter(day=day, status=status).update(count=F('count') + delta)
+
+
+def record_booking_change(old=None, new=None):
+    """Переносит запись из счётчика old в new; ключ None означает, что записи нет"""
+    if old == new:
+        return
+    if old is not None:
+        _add(*old, -1)
+    if new is not None:
+        _add(*new, 1)
+
+
+def record_booking_changes(changes):
+    """Массовый вариант record_booking_change: changes - пары (old, new), по запросу на счётчик"""
+    deltas = Counter()
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old] -= 1
+        if new is not None:
+            deltas[new] += 1
+    for (day, status), delta in deltas.items():
+        if delta:
+            _add(day, status, delta)
+
+
+def compute_booking_statistics(today=None):
+    """
+    Статистика по записям одним запросом к таблице счётчиков.
+    Ближайшие 30 дней считаются по дням, начиная с сегодняшнего.
+    """
+    today = today or timezone.localdate()
+    rows = BookingCounter.objects.order_by().values('status').annotate(
+        total=Sum('count'),
+        upcoming=Sum('count', filter=Q(day__gte=today, day__lte=today + timedelta(days=UPCOMING_DAYS))),
+    )
+    by_status = {status: 0 for status, _ in Booking.STATUS_CHOICES}
+    upcoming = 0
+    for row in rows:
+        by_status[row['status']] = row['total'] or 0
+        if row['status'] in UPCOMING_STATUSES:
+            upcoming += row['upcoming'] or 0
+
+    return {
+        'total_bookings': sum(by_status.values()),
+        'pending': by_status['pending'],
+        'confirmed': by_status['confirmed'],
+        'completed': by_status['completed'],
+        'cancelled': by_status['cancelled'],
+        'upcoming_30_days': upcoming,
+    }
+
+
+def booking_statistics():
+    """Статистика из кэша; одновременные пересчёты объединяются в один"""
+    return coalesced_get(
+        STATISTICS_CACHE_KEY,
+        compute_booking_statistics,
+        settings.SALON_STATISTICS_CACHE_SECONDS,
+    )
+
+
+def actual_counters():
+    """Счётчики, посчитанные заново по текущим и архивным записям"""
+    rows = BookingRecord.objects.order_by().annotate(
+        day=TruncDate('appointment_datetime')
+    ).values('day', 'status').annotate(count=Count('pk'))
+    return {(row['day'], row['status']): row['count'] for row in rows}
+
+
+def reconcile_counters():
+    """Исправляет расхождения счётчиков с записями; возвращает {ключ: (было, стало)}"""
+    with transaction.atomic():
+        actual = actual_counters()
+        stored = {
+            (day, status): count
+            for day, status, count in BookingCounter.objects.values_list('day', 'status', 'count')
+        }
+        drift = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        for (day, status), (_, count) in drift.items():
+            BookingCounter.objects.update_or_create(day=day, status=status, defaults={'count': count})
+        BookingCounter.objects.filter(count=0).delete()
+    return drift
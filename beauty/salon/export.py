@@ -0,0 +1,109 @@
+"""
+Потоковая выгрузка записей (GET /api/bookings/export/) в CSV или NDJSON.
+
+Строки читаются через values_list().iterator() пачками по
+SALON_EXPORT_CHUNK_SIZE и сразу отдаются клиенту StreamingHttpResponse, поэтому
+память не растёт с числом строк, а модели и ресурсы import-export не создаются.
+Заголовок CSV уходит до выполнения запроса к БД, дальше клиент получает
+строки по мере чтения пачек.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+# (заголовок, поле queryset)
+EXPORT_COLUMNS = (
+    ('booking_id', 'booking_id'),
+    ('user_name', 'user__name'),
+    ('user_email', 'user__email'),
+    ('master', 'master__full_name'),
+    ('service', 'service__title'),
+    ('appointment_datetime', 'appointment_datetime'),
+    ('end_datetime', 'end_datetime'),
+    ('status', 'status'),
+    ('created_at', 'created_at'),
+)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Формат выгрузки для согласования содержимого (?format= или Accept).
+    Строки пишет сам поток; рендерер выводит только ответы с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        # Тот же формат, что у DateTimeField в API
+        value = timezone.localtime(value).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+    return value
+
+
+def _chunks(queryset):
+    chunk_size = settings.SALON_EXPORT_CHUNK_SIZE
+    rows = queryset.values_list(*[path for _, path in EXPORT_COLUMNS]).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield [[_value(value) for value in row] for row in chunk]
+
+
+def csv_stream(queryset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    yield flush()
+    for chunk in _chunks(queryset):
+        writer.writerows(chunk)
+        yield flush()
+
+
+def ndjson_stream(queryset):
+    headers = [header for header, _ in EXPORT_COLUMNS]
+    for chunk in _chunks(queryset):
+        yield ''.join(json.dumps(dict(zip(headers, row)), ensure_ascii=False) + '\n' for row in chunk)
+
+
+STREAMS = {'csv': csv_stream, 'ndjson': ndjson_stream}
+
+
+def export_response(queryset, renderer):
+    """StreamingHttpResponse с записями queryset в формате рендерера (csv или ndjson)"""
+    response = StreamingHttpResponse(
+        STREAMS[renderer.format](queryset),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}',
+    )
+    filename = f'bookings-{timezone.localtime():%Y%m%d-%H%M%S}.{renderer.format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
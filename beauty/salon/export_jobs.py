@@ -0,0 +1,235 @@
+"""
+Фоновые выгрузки из админки (ExportJob).
+
+Выгрузка import-export строит весь файл в памяти внутри запроса админки (для
+XLSX - книгу openpyxl целиком), поэтому на больших таблицах занимает воркер на
+минуты. Здесь запрос админки только сохраняет задание: параметры списка
+(фильтры, поиск и сортировка из адреса) и выбранные записи в JSON, ресурс,
+выбранные поля и формат. Queryset строится заново при выполнении тем же
+списком админки модели (export_queryset), поэтому задание не зависит от
+внутреннего устройства Query и версии Django. Выполняет его поток,
+запускаемый после фиксации транзакции, или команда run_export_jobs (если потоки
+отключены SALON_EXPORT_JOBS_IN_THREAD или процесс был перезапущен).
+
+Строки читаются пачками по SALON_EXPORT_CHUNK_SIZE, превращаются в значения
+методами ресурса (export_resource, то есть dehydrate_* и виджеты полей) и сразу
+дописываются в файл в SALON_EXPORT_DIR; XLSX пишется книгой openpyxl в режиме
+write_only. После каждой пачки в задании обновляется число выгруженных строк.
+"""
+import csv
+import json
+import threading
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ExportJob
+
+
+class CSVWriter:
+    delimiter = ','
+
+    def __init__(self, path, headers):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter=self.delimiter)
+        self.writer.writerow(headers)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class TSVWriter(CSVWriter):
+    delimiter = '\t'
+
+
+class JSONWriter:
+    """Массив объектов {заголовок: значение}, как JSON-формат import-export"""
+
+    def __init__(self, path, headers):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.headers = headers
+        self.separator = ''
+        self.file.write('[')
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.file.write(self.separator)
+            self.file.write(json.dumps(dict(zip(self.headers, row)), ensure_ascii=False, default=str))
+            self.separator = ', '
+
+    def close(self):
+        self.file.write(']')
+        self.file.close()
+
+
+class XLSXWriter:
+    """Книга openpyxl в режиме write_only: строки не накапливаются в памяти"""
+    native_values = True
+
+    def __init__(self, path, headers):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(headers)
+
+    def _cell(self, value):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        if isinstance(value, datetime) and timezone.is_aware(value):
+            # Excel не хранит часовой пояс - время записывается в текущем поясе
+            return timezone.make_naive(value)
+        if isinstance(value, str):
+            value = ILLEGAL_CHARACTERS_RE.sub('\N{REPLACEMENT CHARACTER}', value)
+            if value.startswith('='):
+                # Текст, а не формула
+                cell = WriteOnlyCell(self.sheet, value)
+                cell.data_type = 's'
+                return cell
+        return value
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.sheet.append([self._cell(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+WRITERS = {'csv': CSVWriter, 'tsv': TSVWriter, 'json': JSONWriter, 'xlsx': XLSXWriter}
+
+
+def export_dir():
+    path = Path(settings.SALON_EXPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def export_path(job):
+    """Путь к файлу готовой выгрузки"""
+    return Path(settings.SALON_EXPORT_DIR) / job.file_name
+
+
+def create_job(model, filters, resource_class, file_format, export_fields=None, user=None):
+    """
+    Сохраняет задание выгрузки списка админки model и запускает его после
+    фиксации транзакции. filters - {'params': {параметр: [значения]} из адреса
+    списка, 'pks': ID выбранных записей или None}.
+    """
+    if file_format not in WRITERS:
+        raise ValueError(f'Формат {file_format} не поддерживает фоновую выгрузку')
+    job = ExportJob.objects.create(
+        content_type=ContentType.objects.get_for_model(model),
+        resource=f'{resource_class.__module__}.{resource_class.__qualname__}',
+        export_fields=export_fields or None,
+        file_format=file_format,
+        filters={'params': filters.get('params') or {}, 'pks': filters.get('pks')},
+        created_by=user,
+    )
+    if settings.SALON_EXPORT_JOBS_IN_THREAD:
+        transaction.on_commit(lambda: ExportThread(job.pk).start())
+    return job
+
+
+class ExportThread(threading.Thread):
+    """Поток, выполняющий одно задание выгрузки"""
+
+    def __init__(self, job_id):
+        super().__init__(name=f'export-job-{job_id}', daemon=True)
+        self.job_id = job_id
+
+    def run(self):
+        try:
+            run_job(self.job_id)
+        finally:
+            # У потока своё соединение с БД
+            connection.close()
+
+
+def run_job(job_id):
+    """
+    Выполняет задание, если оно ещё в очереди (захват - атомарный UPDATE
+    статуса, поэтому поток и команда не выполнят его дважды). Возвращает
+    True, если задание выполнялось.
+    """
+    if not ExportJob.objects.filter(pk=job_id, status='pending').update(status='running'):
+        return False
+    job = ExportJob.objects.get(pk=job_id)
+    try:
+        write_file(job)
+    except Exception as error:
+        if job.file_name:
+            export_path(job).unlink(missing_ok=True)
+        ExportJob.objects.filter(pk=job_id).update(
+            status='failed', error=f'{type(error).__name__}: {error}', finished_at=timezone.now()
+        )
+    else:
+        ExportJob.objects.filter(pk=job_id).update(status='done', finished_at=timezone.now())
+    return True
+
+
+def export_queryset(job):
+    """
+    Queryset задания: список админки модели с сохранёнными параметрами, как его
+    строит выгрузка import-export (get_export_queryset), от имени автора задания
+    """
+    model = job.content_type.model_class()
+    model_admin = admin.site._registry[model]
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_export')
+    request.resolver_match = resolve(request.path)
+    request.GET = QueryDict(mutable=True)
+    for name, values in job.filters.get('params', {}).items():
+        request.GET.setlist(name, values)
+    request.user = job.created_by or AnonymousUser()
+    queryset = model_admin.get_export_queryset(request)
+    pks = job.filters.get('pks')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    return queryset
+
+
+def write_file(job):
+    model = job.content_type.model_class()
+    queryset = export_queryset(job)
+    resource = import_string(job.resource)()
+    selected = job.export_fields
+    queryset = resource.filter_export(queryset)
+
+    job.file_name = f'{model._meta.model_name}-{job.pk}-{timezone.localtime():%Y%m%d-%H%M%S}.{job.file_format}'
+    ExportJob.objects.filter(pk=job.pk).update(total_rows=queryset.count(), file_name=job.file_name)
+
+    writer_class = WRITERS[job.file_format]
+    writer = writer_class(export_dir() / job.file_name, resource.get_export_headers(selected_fields=selected))
+    native = getattr(writer_class, 'native_values', False)
+    chunk_size = settings.SALON_EXPORT_CHUNK_SIZE
+    rows = queryset.iterator(chunk_size=chunk_size)
+    processed = 0
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.write_rows(
+                resource.export_resource(obj, selected_fields=selected, force_native_type=native) for obj in chunk
+            )
+            processed += len(chunk)
+            ExportJob.objects.filter(pk=job.pk).update(processed_rows=processed)
+    finally:
+        writer.close()
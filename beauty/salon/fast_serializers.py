@@ -0,0 +1,199 @@
+"""
+Быстрое чтение списков без создания моделей.
+
+CompiledSerializer разбирает поля ModelSerializer один раз и превращает их в
+план: какие колонки выбрать через values_list() (со связями через "__") и как
+преобразовать значение каждой колонки. Строки приходят лёгкими именованными
+кортежами (values_list(named=True), __slots__ = ()), поэтому keyset-пагинация
+читает из них поля сортировки так же, как из объектов модели. Значения
+преобразуются теми же полями сериализатора, что и в обычном пути, поэтому JSON
+ответа совпадает побайтно.
+
+Сериализаторы с полями, которые нельзя выразить колонкой (методы модели,
+SerializerMethodField и т. п.), не компилируются - такие запросы идут обычным путём.
+"""
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from django.utils.encoding import force_str
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import empty
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class NotCompilable(Exception):
+    """Поле сериализатора не выражается колонкой модели"""
+
+
+def _convert(field):
+    """Преобразование непустого значения колонки полем сериализатора"""
+    to_representation = field.to_representation
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime(field)
+    return lambda value: None if value is None else to_representation(value)
+
+
+def _datetime(field):
+    """
+    DateTimeField.to_representation без поиска текущего часового пояса на
+    каждое значение: пояс определяется один раз при компиляции.
+    """
+    to_representation = field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return lambda value: None if value is None else to_representation(value)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return lambda value: None if value is None else to_representation(value)
+
+    def convert(value):
+        if not value or not isinstance(value, datetime) or not timezone.is_aware(value):
+            return to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _display(model_field, field):
+    """Аналог get_FOO_display() для колонки с choices"""
+    choices = dict(model_field.flatchoices)
+    to_representation = field.to_representation
+
+    def convert(value):
+        label = force_str(choices.get(value, value), strings_only=True)
+        return None if label is None else to_representation(label)
+    return convert
+
+
+class CompiledSerializer:
+    """
+    План сериализации для экземпляра ModelSerializer (с учётом его текущего
+    набора полей, например после ?fields=). extra_columns - колонки, которые
+    нужны строкам помимо выводимых полей (например, поля сортировки).
+    """
+
+    def __init__(self, serializer, extra_columns=()):
+        self.model = serializer.Meta.model
+        self.columns = []
+        self._indexes = {}
+        self.plan = self._compile(serializer, self.model, '')
+        for column in extra_columns:
+            self._column(column)
+
+    def _column(self, path):
+        if path not in self._indexes:
+            self._indexes[path] = len(self.columns)
+            self.columns.append(path)
+        return self._indexes[path]
+
+    def _compile(self, serializer, model, prefix):
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if source == '*' or '.' in source:
+                raise NotCompilable(name)
+            if isinstance(field, serializers.ListSerializer):
+                raise NotCompilable(name)
+            if isinstance(field, serializers.ModelSerializer):
+                if not model._meta.get_field(source).is_relation:
+                    raise NotCompilable(name)
+                nested_model = field.Meta.model
+                pk_index = self._column(f'{prefix}{source}__{nested_model._meta.pk.name}')
+                plan.append((name, pk_index, None, self._compile(field, nested_model, f'{prefix}{source}__')))
+                continue
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is not None:
+                if model_field.many_to_many or model_field.one_to_many:
+                    raise NotCompilable(name)
+                if model_field.is_relation:
+                    if not isinstance(field, PrimaryKeyRelatedField) or field.pk_field is not None:
+                        raise NotCompilable(name)
+                    # values_list() по имени связи возвращает первичный ключ связанного объекта
+                    plan.append((name, self._column(prefix + source), None, None))
+                else:
+                    plan.append((name, self._column(prefix + source), _convert(field), None))
+                continue
+            if source.startswith('get_') and source.endswith('_display'):
+                try:
+                    model_field = model._meta.get_field(source[len('get_'):-len('_display')])
+                except FieldDoesNotExist:
+                    model_field = None
+                if model_field is not None and model_field.choices:
+                    plan.append((name, self._column(prefix + model_field.name), _display(model_field, field), None))
+                    continue
+            if not hasattr(model, source) and not field.required and field.default is empty and not field.allow_null:
+                # Обычный путь пропускает такое поле (SkipField при отсутствии атрибута)
+                continue
+            raise NotCompilable(name)
+        return plan
+
+    def rows(self, queryset, columns=None):
+        """
+        Queryset строк-кортежей с нужными колонками; columns - поля queryset,
+        если они называются не так, как пути плана (по порядку self.columns)
+        """
+        return queryset.prefetch_related(None).values_list(*(columns or self.columns), named=True)
+
+    def render(self, row, plan=None):
+        data = {}
+        for name, index, convert, nested in plan if plan is not None else self.plan:
+            value = row[index]
+            if nested is not None:
+                data[name] = None if value is None else self.render(row, nested)
+            elif convert is None:
+                data[name] = value
+            else:
+                data[name] = convert(value)
+        return data
+
+    def render_many(self, rows):
+        render, plan = self.render, self.plan
+        return [render(row, plan) for row in rows]
+
+
+def compile_serializer(serializer, extra_columns=()):
+    """CompiledSerializer или None, если сериализатор не компилируется"""
+    try:
+        return CompiledSerializer(serializer, extra_columns)
+    except (NotCompilable, FieldDoesNotExist):
+        return None
+
+
+class CompiledListMixin:
+    """
+    Список через CompiledSerializer: values_list() вместо объектов моделей и
+    вложенных сериализаторов. Фильтрация, сортировка и пагинация те же.
+    """
+
+    def list(self, request, *args, **kwargs):
+        # Поля сортировки нужны строкам для курсоров keyset-пагинации
+        extra_columns = [self.get_serializer_class().Meta.model._meta.pk.name]
+        ordering_fields = getattr(self, 'ordering_fields', None)
+        if isinstance(ordering_fields, (list, tuple)):
+            extra_columns.extend(ordering_fields)
+        compiled = compile_serializer(self.get_serializer(), extra_columns)
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Число строк для номерной пагинации - без JOIN связей, нужных только выводу
+        self.count_queryset = queryset.select_related(None)
+        queryset = self.compiled_rows(compiled, queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compiled.render_many(page))
+        return Response(compiled.render_many(queryset))
+
+    def compiled_rows(self, compiled, queryset):
+        """Строки для плана compiled из отфильтрованного queryset"""
+        return compiled.rows(queryset)
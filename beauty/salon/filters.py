@@ -1,5 +1,5 @@
 import django_filters
-from .models import Booking, Master, Service, Review
+from .models import Booking, BookingListItem, BookingRecord, Master, Service, Review
 
 
 class BookingFilter(django_filters.FilterSet):
@@ -16,11 +16,27 @@ class BookingFilter(django_filters.FilterSet):
         fields = ['status', 'user', 'master', 'service']
 
 
+class BookingRecordFilter(BookingFilter):
+    """Тот же фильтр для текущих и архивных записей вместе"""
+    
+    class Meta(BookingFilter.Meta):
+        model = BookingRecord
+
+
+class BookingListItemFilter(BookingFilter):
+    """Тот же фильтр для плоской таблицы списков (связи - колонки ID, без JOIN)"""
+    
+    class Meta(BookingFilter.Meta):
+        model = BookingListItem
+
+
 class MasterFilter(django_filters.FilterSet):
     """Фильтр для модели Master"""
     min_experience = django_filters.NumberFilter(field_name='experience_years', lookup_expr='gte')
     max_experience = django_filters.NumberFilter(field_name='experience_years', lookup_expr='lte')
     specialization = django_filters.CharFilter(field_name='specialization', lookup_expr='icontains')
+    min_rating = django_filters.NumberFilter(field_name='rating__average', lookup_expr='gte')
+    min_reviews = django_filters.NumberFilter(field_name='rating__reviews_count', lookup_expr='gte')
     
     class Meta:
         model = Master
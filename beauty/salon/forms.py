@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User as DjangoUser
 from .models import Booking, User, Master, Service
@@ -54,11 +55,11 @@ class CustomUserCreationForm(UserCreationForm):
         user.first_name = self.cleaned_data['first_name']
         if commit:
             user.save()
-            # Создаем запись в модели User
-            User.objects.create(
-                name=user.first_name,
-                email=user.email,
-                role='client'
+            # Создаем запись в модели User (если сигнал ещё не связал учётную
+            # запись с пользователем салона с тем же email в другом регистре)
+            User.objects.get_or_create(
+                auth_user=user,
+                defaults={'name': user.first_name, 'email': user.email, 'role': 'client'}
             )
         return user
 
@@ -68,6 +69,8 @@ class BookingForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        # Пользователь салона приходит из request.salon_user; без него ищем по связи с учётной записью
+        salon_user = kwargs.pop('salon_user', None)
         super().__init__(*args, **kwargs)
         
         # Если пользователь не админ, скрываем поле статуса
@@ -77,16 +80,13 @@ class BookingForm(forms.ModelForm):
         
         # Если пользователь авторизован, автоматически выбираем его из модели User
         if self.user and self.user.is_authenticated:
-            try:
-                salon_user = User.objects.get(email=self.user.email)
-                self.fields['user'].initial = salon_user
-                # Делаем поле скрытым для обычных пользователей, видимым только для админов
-                if not self.user.is_staff:
-                    self.fields['user'].widget = forms.HiddenInput()
-            except User.DoesNotExist:
-                # Если пользователь не найден в модели User, скрываем поле для обычных пользователей
-                if not self.user.is_staff:
-                    self.fields['user'].widget = forms.HiddenInput()
+            if salon_user is None:
+                salon_user = User.objects.filter(auth_user_id=self.user.pk).first()
+            if salon_user:
+                self.fields['user'].initial = salon_user.pk
+            # Делаем поле скрытым для обычных пользователей, видимым только для админов
+            if not self.user.is_staff:
+                self.fields['user'].widget = forms.HiddenInput()
     
     class Meta:
         model = Booking
@@ -95,6 +95,7 @@ class BookingForm(forms.ModelForm):
             'appointment_datetime': forms.DateTimeInput(
                 attrs={
                     'type': 'datetime-local',
+                    'step': settings.SALON_SLOT_STEP_MINUTES * 60,
                     'class': 'form-control'
                 }
             ),
@@ -142,3 +143,24 @@ class BookingStatusUpdateForm(forms.ModelForm):
         labels = {
             'status': 'Статус',
         }
+
+
+class BookingBulkImportForm(forms.Form):
+    """Форма массового импорта записей в админке (salon.booking_import)"""
+    file = forms.FileField(
+        label='Файл',
+        help_text='CSV, XLSX или NDJSON с колонками выгрузки записей (user__email, user__name, '
+                  'master__full_name, service__title, appointment_datetime, status)'
+    )
+    create_users = forms.BooleanField(required=False, label='Создавать отсутствующих клиентов по email')
+    dry_run = forms.BooleanField(required=False, label='Только проверить, без сохранения')
+    
+    def clean_file(self):
+        """Формат файла определяется по расширению"""
+        from .booking_import import FORMATS
+        file = self.cleaned_data['file']
+        extension = file.name.rsplit('.', 1)[-1].lower() if '.' in file.name else ''
+        if extension not in FORMATS:
+            raise forms.ValidationError(f"Поддерживаются файлы {', '.join(FORMATS)}")
+        self.cleaned_data['file_format'] = extension
+        return file
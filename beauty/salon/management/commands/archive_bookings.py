@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from salon.booking_archive import archive_bookings, archive_cutoff, finished_before
+
+
+class Command(BaseCommand):
+    help = 'Переносит завершённые и отменённые записи старше срока в архив записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Возраст записи в днях вместо SALON_BOOKING_ARCHIVE_DAYS')
+        parser.add_argument('--batch-size', type=int, help='Записей в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько записей будет перенесено')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        before = archive_cutoff(options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'К переносу: {finished_before(before).count()} записей с приёмом до {before:%Y-%m-%d}')
+            return
+        moved = archive_bookings(
+            before, batch_size=options['batch_size'],
+            progress=lambda moved: self.stdout.write(f'  перенесено {moved}', ending='\r'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив записей: {moved} (приём до {before:%Y-%m-%d})'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from salon.archive import TABLES
+
+
+class Command(BaseCommand):
+    help = 'Переносит историю старше срока хранения в сжатый архив и удаляет её из БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', help=f'Таблицы: {", ".join(TABLES)} (по умолчанию - все)')
+        parser.add_argument('--days', type=int, help='Срок хранения в днях вместо SALON_HISTORY_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, help='Строк в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько строк будет перенесено')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        unknown = set(options['tables']) - set(TABLES)
+        if unknown:
+            raise CommandError(f'Неизвестные таблицы: {", ".join(sorted(unknown))}')
+        for name in options['tables'] or TABLES:
+            table = TABLES[name]
+            before = table.cutoff(options['days'])
+            if before is None:
+                self.stdout.write(f'{name}: срок хранения не ограничен')
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'{name}: к переносу {table.expired(before).count()} строк старше {before:%Y-%m-%d}')
+                continue
+            moved = table.archive(
+                before, batch_size=options['batch_size'],
+                progress=lambda moved: self.stdout.write(f'  {name}: перенесено {moved}', ending='\r'),
+            )
+            self.stdout.write(self.style.SUCCESS(f'{name}: перенесено в архив {moved} строк старше {before:%Y-%m-%d}'))
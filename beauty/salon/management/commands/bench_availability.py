@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from salon.availability import availability_index, get_schedule_versions
+from salon.models import Booking, Master, Service, User
+
+
+class Rollback(Exception):
+    """Откат тестовых данных после замера"""
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости поиска свободных слотов мастера (данные создаются во временной транзакции)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=100000, help='Количество записей')
+        parser.add_argument('--masters', type=int, default=50, help='Количество мастеров')
+        parser.add_argument('--days', type=int, default=14, help='Сколько дней проверять у каждого мастера')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+        availability_index.clear()
+
+    def run(self, options):
+        masters, service = self.populate(options['bookings'], options['masters'])
+        today = timezone.localdate()
+        days = [today + timedelta(days=offset) for offset in range(1, options['days'] + 1)]
+        now = timezone.now()
+
+        availability_index.clear()
+        versions = get_schedule_versions([master.pk for master in masters])
+        started = time.perf_counter()
+        for master in masters:
+            availability_index.get(master.pk, versions[master.pk])
+        build_ms = (time.perf_counter() - started) * 1000
+
+        timings = []
+        for master in masters:
+            for day in days:
+                started = time.perf_counter()
+                availability_index.free_slots(
+                    master.pk, day, service.duration_minutes, now=now, version=versions[master.pk]
+                )
+                timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+
+        self.stdout.write(self.style.SUCCESS('Поиск свободных слотов'))
+        self.stdout.write(f"  Записей: {options['bookings']}, мастеров: {len(masters)}")
+        self.stdout.write(f"  Построение индексов: {build_ms:.1f} мс ({build_ms / len(masters):.2f} мс на мастера)")
+        self.stdout.write(f"  Запросов мастер-день: {len(timings)}")
+        self.stdout.write(f"  Среднее: {sum(timings) / len(timings):.1f} мкс")
+        self.stdout.write(f"  p50: {timings[len(timings) // 2]:.1f} мкс, p99: {timings[int(len(timings) * 0.99)]:.1f} мкс")
+
+    def populate(self, bookings_count, masters_count):
+        """Создание мастеров и записей без сигналов через bulk_create"""
+        service = Service.objects.create(title='Бенчмарк', description='', price=1000, duration_minutes=60)
+        user = User.objects.create(name='Бенчмарк', email='bench@example.com')
+        masters = Master.objects.bulk_create([
+            Master(full_name=f'Мастер {i}', specialization='Бенчмарк', experience_years=1)
+            for i in range(masters_count)
+        ])
+        if masters[0].pk is None:
+            masters = list(Master.objects.filter(specialization='Бенчмарк'))
+
+        # Записи раскладываются по рабочим часам (9:00-21:00) на ближайшие дни вперёд
+        per_master = bookings_count // masters_count
+        start_of_tomorrow = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        batch = []
+        for master in masters:
+            for i in range(per_master):
+                day = start_of_tomorrow + timedelta(days=i // 8)
+                start = day + timedelta(hours=9 + (i % 8) * 1.5 + random.choice((0, 0.25, 0.5)))
+                batch.append(Booking(
+                    user=user,
+                    master=master,
+                    service=service,
+                    appointment_datetime=start,
+                    end_datetime=start + timedelta(minutes=service.duration_minutes),
+                    status=random.choice(('pending', 'confirmed', 'cancelled')),
+                ))
+                if len(batch) >= 5000:
+                    Booking.objects.bulk_create(batch)
+                    batch = []
+        if batch:
+            Booking.objects.bulk_create(batch)
+        return masters, service
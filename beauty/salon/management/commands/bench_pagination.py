@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from salon.models import Booking, Master, Service, User
+from salon.pagination import encode_cursor
+
+
+class Rollback(Exception):
+    """Откат тестовых данных после замера"""
+
+
+class Command(BaseCommand):
+    help = 'Сравнение задержки первой и дальней страницы /api/bookings/ в номерном и keyset-режимах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=60000, help='Количество записей')
+        parser.add_argument('--page', type=int, default=5000, help='Номер дальней страницы')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        self.populate(options['bookings'])
+        client = APIClient(SERVER_NAME='localhost')
+        page_size = 10
+        far_page = options['page']
+
+        # Курсор дальней страницы: позиция последней строки предыдущей страницы
+        last_row = Booking.objects.order_by('-appointment_datetime', '-booking_id').values_list(
+            'appointment_datetime', 'booking_id'
+        )[(far_page - 1) * page_size - 1]
+        far_cursor = encode_cursor(list(last_row))
+
+        cases = [
+            ('номерная, страница 1', '/api/bookings/?page=1'),
+            (f'номерная, страница {far_page}', f'/api/bookings/?page={far_page}'),
+            ('keyset, страница 1', '/api/bookings/?pagination=cursor'),
+            (f'keyset, страница {far_page}', f'/api/bookings/?cursor={far_cursor}'),
+        ]
+        self.stdout.write(self.style.SUCCESS(f"Пагинация /api/bookings/ ({options['bookings']} записей)"))
+        for title, url in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.content[:200]
+            self.stdout.write(f"  {title}: {statistics.median(timings):.2f} мс (медиана)")
+
+    def populate(self, bookings_count):
+        """Создание записей через bulk_create без сигналов"""
+        service = Service.objects.create(title='Бенчмарк', description='', price=1000)
+        user = User.objects.create(name='Бенчмарк', email='bench@example.com')
+        master = Master.objects.create(full_name='Мастер', specialization='Бенчмарк', experience_years=1)
+        start = timezone.now() + timedelta(days=1)
+        batch = []
+        for i in range(bookings_count):
+            # Каждое время повторяется дважды, чтобы проверить разрешение равных значений по ID
+            appointment = start + timedelta(minutes=30 * (i // 2))
+            batch.append(Booking(user=user, master=master, service=service, appointment_datetime=appointment,
+                                 end_datetime=appointment + timedelta(hours=1)))
+            if len(batch) >= 5000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        Booking.objects.bulk_create(batch)
@@ -0,0 +1,95 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from salon.fast_serializers import compile_serializer
+from salon.models import Booking, Master, Service, User
+from salon.serializers import BookingSerializer, RatedMasterSerializer, ServiceSerializer
+
+
+class Rollback(Exception):
+    """Откат тестовых данных после замера"""
+
+
+class Command(BaseCommand):
+    help = 'Сравнение стоимости сериализации строки списка: ModelSerializer и CompiledSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Строк на странице')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rows = options['rows']
+        self.populate(rows)
+        cases = [
+            ('Записи (/api/bookings/)', BookingSerializer,
+             Booking.objects.select_related('user', 'master', 'service').order_by('-appointment_datetime')),
+            # Тот же сериализатор и те же связи, что в MasterViewSet.list
+            ('Мастера (/api/masters/)', RatedMasterSerializer,
+             Master.objects.select_related('image', 'rating').prefetch_related('services').order_by('master_id')),
+            ('Услуги (/api/services/)', ServiceSerializer, Service.objects.order_by('title')),
+        ]
+        renderer = JSONRenderer()
+        self.stdout.write(self.style.SUCCESS(f'Сериализация страницы из {rows} строк (запрос + JSON)'))
+        for title, serializer_class, queryset in cases:
+            compiled = compile_serializer(serializer_class())
+            if compiled is None:
+                raise CommandError(f'{serializer_class.__name__} не компилируется')
+
+            def model_path():
+                return renderer.render(serializer_class(list(queryset[:rows]), many=True).data)
+
+            def compiled_path():
+                return renderer.render(compiled.render_many(compiled.rows(queryset)[:rows]))
+
+            if model_path() != compiled_path():
+                raise CommandError(f'{title}: JSON обычного и быстрого пути различается')
+            self.stdout.write(f'  {title}:')
+            for name, path in (('ModelSerializer', model_path), ('CompiledSerializer', compiled_path)):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    path()
+                    timings.append(time.perf_counter() - started)
+                median = statistics.median(timings)
+                self.stdout.write(f'    {name}: {median * 1000:.1f} мс, {median / rows * 1e6:.1f} мкс на строку')
+
+    def populate(self, rows):
+        """Создание данных через bulk_create без сигналов"""
+        users = User.objects.bulk_create(
+            User(name=f'Клиент {i}', email=f'bench{i}@example.com') for i in range(100)
+        )
+        masters = Master.objects.bulk_create(
+            Master(full_name=f'Мастер {i}', specialization='Бенчмарк', experience_years=i % 30)
+            for i in range(rows)
+        )
+        services = Service.objects.bulk_create(
+            Service(title=f'Услуга {i}', description='Описание услуги ' * 20, price=1000 + i, duration_minutes=60)
+            for i in range(rows)
+        )
+        start = timezone.now() + timedelta(days=1)
+        Booking.objects.bulk_create(
+            (
+                Booking(
+                    user=users[i % len(users)], master=masters[i % 50], service=services[i % 50],
+                    appointment_datetime=start + timedelta(hours=i),
+                    end_datetime=start + timedelta(hours=i + 1),
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.read_model import check, repair
+
+# Сколько ID каждого вида расхождений выводить
+SHOWN_IDS = 20
+LABELS = {
+    'missing': 'Нет строки для записей',
+    'extra': 'Строки удалённых записей',
+    'stale': 'Устаревшие строки',
+}
+
+
+class Command(BaseCommand):
+    help = 'Сверяет плоскую таблицу списков записей с записями (с --fix исправляет расхождения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Переписать и удалить расходящиеся строки')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        with transaction.atomic():
+            result = check()
+            if options['fix']:
+                repair(result)
+        if not any(result.values()):
+            self.stdout.write(self.style.SUCCESS('Плоская таблица совпадает с записями'))
+            return
+        for kind, label in LABELS.items():
+            pks = result[kind]
+            if pks:
+                shown = ', '.join(str(pk) for pk in pks[:SHOWN_IDS])
+                more = f' и ещё {len(pks) - SHOWN_IDS}' if len(pks) > SHOWN_IDS else ''
+                self.stdout.write(self.style.WARNING(f'{label}: {len(pks)} ({shown}{more})'))
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS('Расхождения исправлены'))
@@ -1,8 +1,10 @@
-from django.core.management.base import BaseCommand
-from django.db.models import Count, Avg, Q
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Avg, Q, Sum, Exists, OuterRef
 from django.utils import timezone
-from datetime import timedelta
-from salon.models import Booking, Master, Service, User
+from django.utils.dateparse import parse_date
+from datetime import date, timedelta
+from salon.models import BookingRecord, Master, Service, User
+from salon import rollups
 
 
 class Command(BaseCommand):
@@ -16,12 +18,49 @@ class Command(BaseCommand):
             choices=['console', 'json'],
             help='Формат вывода статистики',
         )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Пересчитать агрегаты за все дни начиная с даты (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Полностью перестроить дневные агрегаты',
+        )
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Статистика записей за месяц (YYYY-MM)',
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            help='Статистика записей за год',
+        )
 
     def handle(self, *args, **options):
         """Выполнение команды"""
         output_format = options['format']
+        date_from, date_to = self.get_period(options)
+        
+        # По умолчанию пересчитываются только дни, записи которых изменились
+        if options['backfill']:
+            written = rollups.backfill()
+            self.stdout.write(self.style.SUCCESS(f'Агрегаты перестроены: {written} строк'))
+        elif options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since должен быть в формате YYYY-MM-DD')
+            _, last = rollups.booking_day_range()
+            written = rollups.refresh_range(since, max(last or since, since))
+            self.stdout.write(self.style.SUCCESS(f'Агрегаты пересчитаны с {since}: {written} строк'))
+        else:
+            days = rollups.refresh_dirty_days()
+            if days:
+                self.stdout.write(self.style.SUCCESS(f'Агрегаты обновлены за дней: {len(days)}'))
         
-        stats = self.collect_statistics()
+        stats = self.collect_statistics(date_from, date_to)
         
         if output_format == 'json':
             self.stdout.write(self.style.SUCCESS('Статистика в формате JSON:'))
@@ -30,60 +69,92 @@ class Command(BaseCommand):
         else:
             self.print_console_statistics(stats)
 
-    def collect_statistics(self):
-        """Сбор статистики"""
+    def get_period(self, options):
+        """Период отчёта по записям из --month/--year (границы включительно)"""
+        if options['month'] and options['year']:
+            raise CommandError('Укажите либо --month, либо --year')
+        if options['month']:
+            try:
+                year, month = (int(part) for part in options['month'].split('-'))
+                date_from = date(year, month, 1)
+            except ValueError:
+                raise CommandError('--month должен быть в формате YYYY-MM')
+            next_month = date(year + month // 12, month % 12 + 1, 1)
+            return date_from, next_month - timedelta(days=1)
+        if options['year']:
+            return date(options['year'], 1, 1), date(options['year'], 12, 31)
+        return None, None
+
+    def collect_statistics(self, date_from=None, date_to=None):
+        """Сбор статистики; показатели записей берутся из дневных агрегатов"""
         stats = {}
+        period = rollups.rollups(date_from, date_to)
         
-        # Статистика по записям
+        # Статистика по записям: по статусам одним запросом, отдельные статусы берутся из него же
+        by_status = dict(period.values('status').annotate(count=Sum('bookings_count')).values_list('status', 'count'))
         stats['bookings'] = {
-            'total': Booking.objects.count(),
-            'by_status': dict(Booking.objects.values('status').annotate(count=Count('status')).values_list('status', 'count')),
-            'pending': Booking.objects.filter(status='pending').count(),
-            'confirmed': Booking.objects.filter(status='confirmed').count(),
-            'completed': Booking.objects.filter(status='completed').count(),
-            'cancelled': Booking.objects.filter(status='cancelled').count(),
+            'period': [date_from, date_to] if date_from else None,
+            'total': sum(by_status.values()),
+            'by_status': by_status,
+            'pending': by_status.get('pending', 0),
+            'confirmed': by_status.get('confirmed', 0),
+            'completed': by_status.get('completed', 0),
+            'cancelled': by_status.get('cancelled', 0),
+            'revenue': float(period.aggregate(total=Sum('revenue'))['total'] or 0),
         }
         
         # Статистика по мастерам
+        master_stats = Master.objects.aggregate(
+            total=Count('pk'),
+            average_experience=Avg('experience_years'),
+            experienced_masters=Count('pk', filter=Q(experience_years__gte=5)),
+        )
         stats['masters'] = {
-            'total': Master.objects.count(),
-            'with_bookings': Master.objects.annotate(booking_count=Count('bookings')).filter(booking_count__gt=0).count(),
-            'average_experience': Master.objects.aggregate(avg=Avg('experience_years'))['avg'] or 0,
-            'experienced_masters': Master.objects.filter(experience_years__gte=5).count(),
+            'total': master_stats['total'],
+            'with_bookings': period.values('master_id').distinct().count(),
+            'average_experience': master_stats['average_experience'] or 0,
+            'experienced_masters': master_stats['experienced_masters'],
         }
         
         # Статистика по услугам
+        popular = list(period.values('service_id', 'service__title').annotate(
+            booking_count=Sum('bookings_count')
+        ).order_by('-booking_count')[:5])
+        service_stats = Service.objects.aggregate(total=Count('pk'), average_price=Avg('price'))
         stats['services'] = {
-            'total': Service.objects.count(),
-            'average_price': float(Service.objects.aggregate(avg=Avg('price'))['avg'] or 0),
-            'most_popular': list(Service.objects.annotate(booking_count=Count('bookings'))
-                                .order_by('-booking_count')[:5]
-                                .values('title', 'booking_count')),
+            'total': service_stats['total'],
+            'average_price': float(service_stats['average_price'] or 0),
+            'most_popular': [
+                {'title': row['service__title'], 'booking_count': row['booking_count']} for row in popular
+            ],
         }
         
-        # Статистика по пользователям
+        # Статистика по пользователям (записи - текущие и архивные вместе)
+        user_stats = User.objects.aggregate(
+            total=Count('pk'),
+            clients=Count('pk', filter=Q(role='client')),
+            admins=Count('pk', filter=Q(role='admin')),
+        )
         stats['users'] = {
-            'total': User.objects.count(),
-            'clients': User.objects.filter(role='client').count(),
-            'admins': User.objects.filter(role='admin').count(),
-            'with_bookings': User.objects.annotate(booking_count=Count('bookings')).filter(booking_count__gt=0).count(),
+            'total': user_stats['total'],
+            'clients': user_stats['clients'],
+            'admins': user_stats['admins'],
+            'with_bookings': User.objects.filter(Exists(BookingRecord.objects.filter(user=OuterRef('pk')))).count(),
         }
         
         # Статистика за последние 30 дней
         thirty_days_ago = timezone.now() - timedelta(days=30)
         stats['last_30_days'] = {
-            'new_bookings': Booking.objects.filter(created_at__gte=thirty_days_ago).count(),
+            'new_bookings': BookingRecord.objects.filter(created_at__gte=thirty_days_ago).count(),
             'new_users': User.objects.filter(created_at__gte=thirty_days_ago).count(),
         }
         
-        # Сложный Q-запрос: записи в ближайшие 7 дней
-        future_date = timezone.now() + timedelta(days=7)
+        # Записи в ближайшие 7 дней (по дням, начиная с сегодняшнего)
+        today = timezone.localdate()
         stats['upcoming'] = {
-            'next_7_days': Booking.objects.filter(
-                Q(appointment_datetime__gte=timezone.now()) &
-                Q(appointment_datetime__lte=future_date) &
-                Q(status__in=['pending', 'confirmed'])
-            ).count(),
+            'next_7_days': rollups.rollups(today, today + timedelta(days=7)).filter(
+                status__in=['pending', 'confirmed']
+            ).aggregate(count=Sum('bookings_count'))['count'] or 0,
         }
         
         return stats
@@ -95,12 +166,17 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('='*60 + '\n'))
         
         # Записи
-        self.stdout.write(self.style.WARNING('ЗАПИСИ:'))
+        if stats['bookings']['period']:
+            date_from, date_to = stats['bookings']['period']
+            self.stdout.write(self.style.WARNING(f'ЗАПИСИ ЗА ПЕРИОД {date_from:%d.%m.%Y} - {date_to:%d.%m.%Y}:'))
+        else:
+            self.stdout.write(self.style.WARNING('ЗАПИСИ:'))
         self.stdout.write(f"  Всего записей: {stats['bookings']['total']}")
         self.stdout.write(f"  Ожидают подтверждения: {stats['bookings']['pending']}")
         self.stdout.write(f"  Подтверждены: {stats['bookings']['confirmed']}")
         self.stdout.write(f"  Завершены: {stats['bookings']['completed']}")
         self.stdout.write(f"  Отменены: {stats['bookings']['cancelled']}")
+        self.stdout.write(f"  Сумма по прайсу: {stats['bookings']['revenue']:.2f} руб.")
         
         # Мастера
         self.stdout.write(self.style.WARNING('\nМАСТЕРА:'))
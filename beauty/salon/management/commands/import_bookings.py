@@ -0,0 +1,55 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from salon.booking_import import DEFAULT_BATCH_SIZE, FORMATS, import_bookings, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт записей из CSV, XLSX или NDJSON пачками через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с записями')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Строк в пачке')
+        parser.add_argument('--workers', type=int, default=0, help='Процессов для разбора строк (0 - без пула)')
+        parser.add_argument('--changed-by', default='import_bookings', help='Автор изменений в журнале')
+        parser.add_argument('--create-users', action='store_true', help='Создавать отсутствующих клиентов по email')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, без сохранения')
+        parser.add_argument('--show-errors', type=int, default=20, help='Сколько ошибок вывести')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла, укажите --format ({", ".join(FORMATS)})')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        started = time.perf_counter()
+
+        def progress(report):
+            self.stdout.write(f'  строк: {report.rows}, записей: {report.created}, ошибок: {report.failed}', ending='\r')
+
+        with path.open('rb') as file:
+            report = import_bookings(
+                read_rows(file, file_format),
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                changed_by=options['changed_by'],
+                create_users=options['create_users'],
+                dry_run=options['dry_run'],
+                progress=progress,
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write('')
+        for line, errors in report.errors[:options['show_errors']]:
+            messages = '; '.join(f'{field}: {" ".join(map(str, texts))}' for field, texts in errors.items())
+            self.stdout.write(self.style.WARNING(f'  строка {line}: {messages}'))
+        action = 'прошли проверку' if options['dry_run'] else 'создано записей'
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {report.rows}, {action}: {report.created}, с ошибками: {report.failed}, '
+            f'создано клиентов: {report.users_created} за {elapsed:.1f} с ({report.rows / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
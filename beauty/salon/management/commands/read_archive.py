@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from salon.archive import TABLES
+
+
+class Command(BaseCommand):
+    help = 'Выводит строки архива истории (JSON по строке на запись)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(TABLES), help='Таблица архива')
+        parser.add_argument('--object-id', type=int, help='История одного объекта (ID записи или объекта журнала)')
+        parser.add_argument(
+            '--content-type', help='Тип объекта журнала изменений, например salon.booking (для change_history)'
+        )
+        parser.add_argument('--since', help='С даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--until', help='По дату, не включая её (ГГГГ-ММ-ДД)')
+
+    def _date(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Неверная дата {value}, ожидается ГГГГ-ММ-ДД')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        fields = {}
+        if options['content_type']:
+            app_label, _, model = options['content_type'].lower().partition('.')
+            try:
+                fields['content_type_id'] = ContentType.objects.get_by_natural_key(app_label, model).pk
+            except ContentType.DoesNotExist:
+                raise CommandError(f'Неизвестный тип {options["content_type"]}')
+        rows = TABLES[options['table']].read(
+            object_id=options['object_id'], since=self._date(options['since']), until=self._date(options['until']),
+            fields=fields,
+        )
+        for row in rows:
+            self.stdout.write(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.models import BookingListItem
+from salon.read_model import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает плоскую таблицу списков записей (BookingListItem) из текущих записей'
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Таблица перестроена, строк: {BookingListItem.objects.count()}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from salon.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги мастеров по таблице отзывов (после массовых операций в обход сигналов)'
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        masters = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Рейтинги пересчитаны, мастеров с отзывами: {masters}'))
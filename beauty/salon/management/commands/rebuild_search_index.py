@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from salon.search import INDEXES, enabled
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовые индексы записей, мастеров и услуг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('indexes', nargs='*', choices=sorted(INDEXES), help='Индексы (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        if not enabled():
+            raise CommandError('Полнотекстовый индекс доступен только для SQLite')
+        for name in options['indexes'] or sorted(INDEXES):
+            with transaction.atomic():
+                INDEXES[name].rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Индекс {name} перестроен'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.availability import ACTIVE_STATUSES
+from salon.models import Booking, MasterTimeSlot
+from salon.reservations import slot_starts
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает занятые ячейки расписания мастеров (например, после смены шага сетки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета вставки')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        batch_size = options['batch_size']
+        created = 0
+        conflicts = []
+        with transaction.atomic():
+            MasterTimeSlot.objects.all().delete()
+            # Записи идут по мастерам, поэтому занятые ячейки достаточно помнить для текущего мастера
+            current_master = None
+            taken = set()
+            batch = []
+            bookings = Booking.objects.filter(
+                status__in=ACTIVE_STATUSES,
+                end_datetime__isnull=False,
+            ).order_by('master_id', 'appointment_datetime', 'booking_id').values_list(
+                'booking_id', 'master_id', 'appointment_datetime', 'end_datetime'
+            )
+            for booking_id, master_id, start, end in bookings.iterator(chunk_size=batch_size):
+                if master_id != current_master:
+                    current_master = master_id
+                    taken = set()
+                for slot_start in slot_starts(start, end):
+                    if slot_start in taken:
+                        conflicts.append(booking_id)
+                        continue
+                    taken.add(slot_start)
+                    batch.append(MasterTimeSlot(master_id=master_id, booking_id=booking_id, slot_start=slot_start))
+                if len(batch) >= batch_size:
+                    MasterTimeSlot.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            MasterTimeSlot.objects.bulk_create(batch)
+            created += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Создано ячеек: {created}'))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f'Пересекающиеся записи (ячейки оставлены более ранней записи): {sorted(set(conflicts))}'
+            ))
@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from salon.counters import STATISTICS_CACHE_KEY, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики записей с таблицей записей и исправляет расхождения (запускать периодически)'
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        drift = reconcile_counters()
+        cache.delete(STATISTICS_CACHE_KEY)
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Счётчики записей совпадают с данными'))
+            return
+        self.stdout.write(self.style.WARNING(f'Исправлено расхождений: {len(drift)}'))
+        for (day, status), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f'  {day} {status}: {stored} -> {actual}')
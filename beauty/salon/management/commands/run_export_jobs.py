@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from salon.export_jobs import run_job
+from salon.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые выгрузки из очереди (если потоки отключены или процесс был перезапущен)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requeue-running', action='store_true',
+            help='Вернуть в очередь выгрузки, прерванные остановкой процесса (статус "Выполняется")',
+        )
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        if options['requeue_running']:
+            requeued = ExportJob.objects.filter(status='running').update(status='pending', processed_rows=0)
+            self.stdout.write(f'Возвращено в очередь: {requeued}')
+        done = failed = 0
+        for job_id in ExportJob.objects.filter(status='pending').order_by('created_at').values_list('pk', flat=True):
+            if not run_job(job_id):
+                continue
+            if ExportJob.objects.filter(pk=job_id, status='done').exists():
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Выгрузок выполнено: {done}, с ошибкой: {failed}'))
@@ -0,0 +1,128 @@
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User as DjangoUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from salon.models import Booking, ChangeHistory, Master, Service, User
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка: параллельное создание пересекающихся записей через API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Количество параллельных потоков')
+        parser.add_argument('--requests', type=int, default=25, help='Запросов на поток')
+        parser.add_argument('--slots', type=int, default=12, help='Количество пересекающихся вариантов времени')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        """Выполнение команды"""
+        # Отклонённые конфликты - ожидаемый результат, не засоряем вывод предупреждениями
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        auth_user, salon_user, master, service = self.setup()
+        # Варианты времени идут через полчаса при длительности услуги в час: соседние пересекаются
+        first = (timezone.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        candidates = [first + timedelta(minutes=30 * i) for i in range(options['slots'])]
+        results = {'created': 0, 'conflict': 0, 'error': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(auth_user)
+            local = {'created': 0, 'conflict': 0, 'error': 0}
+            try:
+                for _ in range(options['requests']):
+                    payload = {
+                        'user': salon_user.pk,
+                        'master': master.pk,
+                        'service': service.pk,
+                        'appointment_datetime': rng.choice(candidates).isoformat(),
+                    }
+                    try:
+                        response = client.post('/api/bookings/', payload, format='json')
+                    except Exception:
+                        local['error'] += 1
+                        continue
+                    if response.status_code == 201:
+                        local['created'] += 1
+                    elif response.status_code == 400:
+                        local['conflict'] += 1
+                    else:
+                        local['error'] += 1
+            finally:
+                connections.close_all()
+            with lock:
+                for key, value in local.items():
+                    results[key] += value
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        overlaps = self.count_overlaps(master)
+        total = options['threads'] * options['requests']
+        self.stdout.write(self.style.SUCCESS('Параллельное создание записей'))
+        self.stdout.write(f"  Потоков: {options['threads']}, запросов: {total}, время: {elapsed:.2f} с")
+        self.stdout.write(f"  Пропускная способность: {total / elapsed:.1f} запросов/с")
+        self.stdout.write(f"  Создано: {results['created']}, отклонено как конфликт: {results['conflict']}, "
+                          f"ошибок: {results['error']}")
+        style = self.style.SUCCESS if overlaps == 0 else self.style.ERROR
+        self.stdout.write(style(f"  Пересекающихся записей в БД: {overlaps}"))
+
+        if not options['keep']:
+            self.cleanup(auth_user, salon_user, master, service)
+
+    def setup(self):
+        """Создание пользователя, мастера и услуги для проверки"""
+        suffix = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        auth_user = DjangoUser.objects.create_user(username=f'stress_{suffix}', is_staff=True)
+        salon_user = User.objects.create(name='Нагрузка', email=f'stress_{suffix}@example.com')
+        master = Master.objects.create(full_name=f'Мастер нагрузки {suffix}', specialization='Нагрузка',
+                                       experience_years=1)
+        service = Service.objects.create(title=f'Нагрузка {suffix}', description='', price=1,
+                                         duration_minutes=60)
+        return auth_user, salon_user, master, service
+
+    def count_overlaps(self, master):
+        """Количество активных записей, начинающихся до окончания предыдущей"""
+        overlaps = 0
+        previous_end = None
+        bookings = Booking.objects.filter(master=master).exclude(status='cancelled').order_by(
+            'appointment_datetime'
+        ).values_list('appointment_datetime', 'end_datetime')
+        for start, end in bookings:
+            if previous_end is not None and start < previous_end:
+                overlaps += 1
+            previous_end = max(previous_end, end) if previous_end else end
+        return overlaps
+
+    def cleanup(self, auth_user, salon_user, master, service):
+        """Удаление созданных данных вместе с историей"""
+        booking_ids = list(Booking.objects.filter(master=master).values_list('pk', flat=True))
+        Booking.objects.filter(master=master).delete()
+        ChangeHistory.objects.filter(
+            content_type=ContentType.objects.get_for_model(Booking),
+            object_id__in=booking_ids,
+        ).delete()
+        ChangeHistory.objects.filter(
+            content_type=ContentType.objects.get_for_model(Master),
+            object_id=master.pk,
+        ).delete()
+        Booking.history.filter(master_id=master.pk).delete()
+        master.delete()
+        service.delete()
+        salon_user.delete()
+        auth_user.delete()
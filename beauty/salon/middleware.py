@@ -0,0 +1,29 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+
+
+def get_salon_user(request):
+    """Пользователь салона, связанный с учётной записью запроса (кэшируется на запрос)"""
+    if not hasattr(request, '_cached_salon_user'):
+        salon_user = None
+        if request.user.is_authenticated:
+            salon_user = User.objects.filter(auth_user_id=request.user.pk).first()
+        request._cached_salon_user = salon_user
+    return request._cached_salon_user
+
+
+class SalonUserMiddleware:
+    """
+    Добавляет в запрос request.salon_user - пользователя salon.User, связанного
+    с request.user. Поиск выполняется лениво, не более одного раза за запрос,
+    по уникальному индексу auth_user_id. Если связанного пользователя нет,
+    объект ведёт себя как None в логических проверках (if request.salon_user).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.salon_user = SimpleLazyObject(lambda: get_salon_user(request))
+        return self.get_response(request)
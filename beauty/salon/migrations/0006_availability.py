@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:24
+
+import django.core.validators
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_end_datetime(apps, schema_editor):
+    """Заполняем окончание существующих записей по длительности услуги"""
+    Booking = apps.get_model('salon', 'Booking')
+    batch = []
+    for booking in Booking.objects.select_related('service').only(
+        'booking_id', 'appointment_datetime', 'service__duration_minutes'
+    ).iterator(chunk_size=2000):
+        booking.end_datetime = booking.appointment_datetime + timedelta(minutes=booking.service.duration_minutes)
+        batch.append(booking)
+        if len(batch) >= 2000:
+            Booking.objects.bulk_update(batch, ['end_datetime'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['end_datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0005_historicalbooking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('working_hours_id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID расписания')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')], verbose_name='День недели')),
+                ('start_time', models.TimeField(verbose_name='Начало работы')),
+                ('end_time', models.TimeField(verbose_name='Окончание работы')),
+            ],
+            options={
+                'verbose_name': 'Рабочее время',
+                'verbose_name_plural': 'Рабочее время',
+                'ordering': ['master', 'weekday'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='end_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата и время окончания'),
+        ),
+        migrations.AddField(
+            model_name='historicalbooking',
+            name='end_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата и время окончания'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=60, validators=[django.core.validators.MinValueValidator(5)], verbose_name='Длительность (мин)'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['master', 'appointment_datetime'], name='salon_booki_master__1ef88e_idx'),
+        ),
+        migrations.AddField(
+            model_name='workinghours',
+            name='master',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='salon.master', verbose_name='Мастер'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='workinghours',
+            unique_together={('master', 'weekday')},
+        ),
+        migrations.RunPython(backfill_end_datetime, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_time_slots(apps, schema_editor):
+    """Занимаем ячейки расписания для уже существующих активных записей"""
+    Booking = apps.get_model('salon', 'Booking')
+    MasterTimeSlot = apps.get_model('salon', 'MasterTimeSlot')
+    step = settings.SALON_SLOT_STEP_MINUTES * 60
+    batch = []
+    bookings = Booking.objects.filter(
+        status__in=['pending', 'confirmed', 'completed'],
+        end_datetime__isnull=False,
+    ).values_list('booking_id', 'master_id', 'appointment_datetime', 'end_datetime')
+    for booking_id, master_id, start, end in bookings.iterator(chunk_size=2000):
+        first = int(start.timestamp()) // step * step
+        for ts in range(first, int(end.timestamp()), step):
+            batch.append(MasterTimeSlot(
+                master_id=master_id,
+                booking_id=booking_id,
+                slot_start=datetime.fromtimestamp(ts, tz=timezone.utc),
+            ))
+        if len(batch) >= 5000:
+            # Уже существующие пересечения не исправляем: первая запись сохраняет ячейку
+            MasterTimeSlot.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        MasterTimeSlot.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0006_availability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterTimeSlot',
+            fields=[
+                ('slot_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID ячейки')),
+                ('slot_start', models.DateTimeField(verbose_name='Начало ячейки')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_slots', to='salon.booking', verbose_name='Запись')),
+                ('master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_slots', to='salon.master', verbose_name='Мастер')),
+            ],
+            options={
+                'verbose_name': 'Занятое время мастера',
+                'verbose_name_plural': 'Занятое время мастеров',
+                'ordering': ['master', 'slot_start'],
+                'constraints': [models.UniqueConstraint(fields=('master', 'slot_start'), name='unique_master_time_slot')],
+            },
+        ),
+        migrations.RunPython(backfill_time_slots, migrations.RunPython.noop),
+    ]
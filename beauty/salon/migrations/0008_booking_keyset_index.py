@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0007_master_time_slots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['appointment_datetime', 'booking_id'], name='salon_booki_appoint_1969af_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_auth_users(apps, schema_editor):
+    """Связываем существующих пользователей салона с учётными записями по email"""
+    AuthUser = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    User = apps.get_model('salon', 'User')
+    linked = []
+    linked_pks = set()
+    for auth_user_id, email in AuthUser.objects.exclude(email='').values_list('pk', 'email').iterator():
+        # Дубликаты email возможны: связываем самого раннего пользователя салона.
+        # Связи сохраняются только в конце, поэтому уже выбранных в этом проходе
+        # исключаем сами, иначе две учётные записи с одним email (в любом
+        # регистре) получили бы одного пользователя и нарушили уникальность связи
+        salon_user = User.objects.filter(
+            email__iexact=email, auth_user__isnull=True
+        ).exclude(pk__in=linked_pks).order_by('created_at', 'user_id').first()
+        if salon_user is not None:
+            salon_user.auth_user_id = auth_user_id
+            linked.append(salon_user)
+            linked_pks.add(salon_user.pk)
+    User.objects.bulk_update(linked, ['auth_user'], batch_size=1000)
+
+
+def unlink_auth_users(apps, schema_editor):
+    User = apps.get_model('salon', 'User')
+    User.objects.update(auth_user=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0008_booking_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='auth_user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='salon_user', to=settings.AUTH_USER_MODEL, verbose_name='Учётная запись'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(db_index=True, max_length=254, verbose_name='Email'),
+        ),
+        migrations.RunPython(link_auth_users, unlink_auth_users),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:33
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_counters(apps, schema_editor):
+    """Начальное заполнение счётчиков по существующим записям"""
+    Booking = apps.get_model('salon', 'Booking')
+    BookingCounter = apps.get_model('salon', 'BookingCounter')
+    rows = Booking.objects.order_by().annotate(
+        day=TruncDate('appointment_datetime')
+    ).values('day', 'status').annotate(count=Count('pk'))
+    BookingCounter.objects.bulk_create(
+        [BookingCounter(day=row['day'], status=row['status'], count=row['count']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0009_user_auth_link'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingCounter',
+            fields=[
+                ('counter_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID счётчика')),
+                ('day', models.DateField(verbose_name='День записи')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('completed', 'Завершена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+            ],
+            options={
+                'verbose_name': 'Счётчик записей',
+                'verbose_name_plural': 'Счётчики записей',
+                'ordering': ['-day', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='unique_booking_counter')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
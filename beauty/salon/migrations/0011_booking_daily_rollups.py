@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def mark_existing_days(apps, schema_editor):
+    """Помечает все дни с записями; агрегаты построит generate_statistics"""
+    Booking = apps.get_model('salon', 'Booking')
+    RollupDirtyDay = apps.get_model('salon', 'RollupDirtyDay')
+    days = Booking.objects.order_by().annotate(
+        day=TruncDate('appointment_datetime')
+    ).values_list('day', flat=True).distinct()
+    RollupDirtyDay.objects.bulk_create(
+        [RollupDirtyDay(day=day) for day in days],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0010_booking_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingDailyRollup',
+            fields=[
+                ('rollup_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID агрегата')),
+                ('day', models.DateField(verbose_name='День записи')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('completed', 'Завершена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('bookings_count', models.PositiveIntegerField(default=0, verbose_name='Количество записей')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма по прайсу')),
+            ],
+            options={
+                'verbose_name': 'Дневной агрегат записей',
+                'verbose_name_plural': 'Дневные агрегаты записей',
+                'ordering': ['-day', 'master', 'service', 'status'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('dirty_day_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID отметки')),
+                ('day', models.DateField(unique=True, verbose_name='День записи')),
+            ],
+            options={
+                'verbose_name': 'День для пересчёта агрегатов',
+                'verbose_name_plural': 'Дни для пересчёта агрегатов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at'], name='salon_booki_created_f0e341_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookingdailyrollup',
+            name='master',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='salon.master', verbose_name='Мастер'),
+        ),
+        migrations.AddField(
+            model_name='bookingdailyrollup',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='salon.service', verbose_name='Услуга'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookingdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'master', 'service', 'status'), name='unique_booking_daily_rollup'),
+        ),
+        migrations.RunPython(mark_existing_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Replace
+
+# (таблица, модель, поля документа) - как в salon.search на момент миграции
+SEARCH_TABLES = (
+    ('salon_search_booking', 'Booking', ('user__name', 'user__email', 'master__full_name', 'service__title')),
+    ('salon_search_master', 'Master', ('full_name', 'specialization')),
+    ('salon_search_service', 'Service', ('title', 'description')),
+)
+
+
+def create_search_tables(apps, schema_editor):
+    """Создаёт таблицы FTS5 и заполняет их существующими объектами (только SQLite)"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, model_name, fields in SEARCH_TABLES:
+        model = apps.get_model('salon', model_name)
+        columns = [field.replace('__', '_') for field in fields]
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"{', '.join(columns)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+        expressions = {
+            f'_search_{column}': Replace(
+                Replace(F(field), Value('ё'), Value('е'), output_field=TextField()),
+                Value('Ё'), Value('Е'), output_field=TextField(),
+            )
+            for column, field in zip(columns, fields)
+        }
+        source = model.objects.order_by().annotate(**expressions).values_list('pk', *expressions)
+        sql, params = source.query.sql_with_params()
+        schema_editor.execute(f"INSERT INTO {table}(rowid, {', '.join(columns)}) {sql}", params)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, _, _ in SEARCH_TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0012_booking_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    """Рейтинги мастеров по уже существующим отзывам"""
+    Review = apps.get_model('salon', 'Review')
+    MasterRating = apps.get_model('salon', 'MasterRating')
+    rows = Review.objects.order_by().values('master_id').annotate(
+        reviews_count=Count('pk'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{value}': Count('pk', filter=Q(rating=value)) for value in range(1, 6)},
+    )
+    MasterRating.objects.bulk_create([
+        MasterRating(average=row['rating_sum'] / row['reviews_count'], **row)
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterRating',
+            fields=[
+                ('rating_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID рейтинга')),
+                ('reviews_count', models.IntegerField(default=0, verbose_name='Количество отзывов')),
+                ('rating_sum', models.IntegerField(default=0, verbose_name='Сумма оценок')),
+                ('average', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Средняя оценка')),
+                ('rating_1', models.IntegerField(default=0, verbose_name='Оценок 1')),
+                ('rating_2', models.IntegerField(default=0, verbose_name='Оценок 2')),
+                ('rating_3', models.IntegerField(default=0, verbose_name='Оценок 3')),
+                ('rating_4', models.IntegerField(default=0, verbose_name='Оценок 4')),
+                ('rating_5', models.IntegerField(default=0, verbose_name='Оценок 5')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('master', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating', to='salon.master', verbose_name='Мастер')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг мастера',
+                'verbose_name_plural': 'Рейтинги мастеров',
+            },
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
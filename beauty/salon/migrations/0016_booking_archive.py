@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BOOKING_COLUMNS = (
+    'booking_id, user_id, master_id, service_id, appointment_datetime, end_datetime, status, created_at, updated_at'
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0015_export_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingRecord',
+            fields=[
+                ('booking_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID записи')),
+                ('appointment_datetime', models.DateTimeField(verbose_name='Дата и время записи')),
+                ('end_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время окончания')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('completed', 'Завершена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('archived', models.BooleanField(verbose_name='В архиве')),
+            ],
+            options={
+                'verbose_name': 'Запись',
+                'verbose_name_plural': 'Записи',
+                'db_table': 'salon_booking_record',
+                'ordering': ['-appointment_datetime'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('booking_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID записи')),
+                ('appointment_datetime', models.DateTimeField(verbose_name='Дата и время записи')),
+                ('end_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время окончания')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('completed', 'Завершена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата переноса в архив')),
+                ('master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='salon.master', verbose_name='Мастер')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='salon.service', verbose_name='Услуга')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='salon.user', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивная запись',
+                'verbose_name_plural': 'Архив записей',
+                'ordering': ['-appointment_datetime'],
+                'indexes': [models.Index(fields=['master', 'appointment_datetime'], name='salon_archi_master__3bd894_idx'), models.Index(fields=['appointment_datetime', 'booking_id'], name='salon_archi_appoint_07f6e4_idx')],
+            },
+        ),
+        # Текущие и архивные записи вместе (модель BookingRecord). SQLite не даёт
+        # пересоздать таблицу, на которую ссылается представление, поэтому миграции,
+        # меняющие колонки salon_booking или salon_archivedbooking, должны удалить
+        # представление до изменения и создать заново после
+        migrations.RunSQL(
+            f"CREATE VIEW salon_booking_record AS "
+            f"SELECT {BOOKING_COLUMNS}, FALSE AS archived FROM salon_booking "
+            f"UNION ALL SELECT {BOOKING_COLUMNS}, TRUE AS archived FROM salon_archivedbooking",
+            'DROP VIEW salon_booking_record',
+        ),
+    ]
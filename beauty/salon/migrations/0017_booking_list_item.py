@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+# Колонка плоской таблицы -> поле записи, как в salon.read_model на момент миграции
+SOURCES = (
+    ('booking_id', 'booking_id'),
+    ('user_id', 'user_id'),
+    ('master_id', 'master_id'),
+    ('service_id', 'service_id'),
+    ('user_name', 'user__name'),
+    ('user_email', 'user__email'),
+    ('master_name', 'master__full_name'),
+    ('master_specialization', 'master__specialization'),
+    ('service_title', 'service__title'),
+    ('service_price', 'service__price'),
+    ('appointment_datetime', 'appointment_datetime'),
+    ('end_datetime', 'end_datetime'),
+    ('status', 'status'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+
+def fill_booking_list(apps, schema_editor):
+    """Заполняет плоскую таблицу текущими записями одним INSERT ... SELECT"""
+    Booking = apps.get_model('salon', 'Booking')
+    BookingListItem = apps.get_model('salon', 'BookingListItem')
+    source = Booking.objects.order_by().annotate(
+        _synced_at=Value(timezone.now(), output_field=DateTimeField())
+    ).values_list(*[path for _, path in SOURCES], '_synced_at')
+    sql, params = source.query.sql_with_params()
+    columns = ', '.join([column for column, _ in SOURCES] + ['synced_at'])
+    schema_editor.execute(f'INSERT INTO {BookingListItem._meta.db_table} ({columns}) {sql}', params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0016_booking_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingListItem',
+            fields=[
+                ('booking_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID записи')),
+                ('user_name', models.CharField(max_length=255, verbose_name='Имя клиента')),
+                ('user_email', models.CharField(max_length=254, verbose_name='Email клиента')),
+                ('master_name', models.CharField(max_length=255, verbose_name='Мастер')),
+                ('master_specialization', models.CharField(max_length=255, verbose_name='Специализация мастера')),
+                ('service_title', models.CharField(max_length=255, verbose_name='Услуга')),
+                ('service_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('appointment_datetime', models.DateTimeField(verbose_name='Дата и время записи')),
+                ('end_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время окончания')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтверждена'), ('completed', 'Завершена'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('synced_at', models.DateTimeField(verbose_name='Дата синхронизации')),
+                ('master', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salon.master', verbose_name='Мастер')),
+                ('service', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salon.service', verbose_name='Услуга')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salon.user', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Строка списка записей',
+                'verbose_name_plural': 'Строки списка записей',
+                'ordering': ['-appointment_datetime'],
+                'indexes': [models.Index(fields=['appointment_datetime', 'booking_id'], name='salon_booki_appoint_927152_idx'), models.Index(fields=['user', 'appointment_datetime'], name='salon_booki_user_id_e35620_idx'), models.Index(fields=['status', 'created_at'], name='salon_booki_status_40ed03_idx')],
+            },
+        ),
+        migrations.RunPython(fill_booking_list, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    """Строки версий для существующих мастеров"""
+    Master = apps.get_model('salon', 'Master')
+    MasterScheduleVersion = apps.get_model('salon', 'MasterScheduleVersion')
+    MasterScheduleVersion.objects.bulk_create(
+        [MasterScheduleVersion(master_id=master_id) for master_id in Master.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0017_booking_list_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterScheduleVersion',
+            fields=[
+                ('master', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule_version', serialize=False, to='salon.master', verbose_name='Мастер')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия расписания мастера',
+                'verbose_name_plural': 'Версии расписаний мастеров',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
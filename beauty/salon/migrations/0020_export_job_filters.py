@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:09
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    """Задания в очереди хранят запрос в старом формате (pickle) - их нужно поставить заново"""
+    ExportJob = apps.get_model('salon', 'ExportJob')
+    ExportJob.objects.filter(status__in=['pending', 'running']).update(
+        status='failed', error='Задание создано до обновления формата, повторите выгрузку', finished_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0019_review_rating_min_one'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='exportjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='filters',
+            field=models.JSONField(default=dict, verbose_name='Фильтры'),
+        ),
+    ]
@@ -1,10 +1,95 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.prefetch import GenericPrefetch
 from simple_history.models import HistoricalRecords
 
 
+class FieldTrackerMixin(models.Model):
+    """
+    Запоминает значения полей tracked_fields (attname) при загрузке из БД и
+    после каждого сохранения, чтобы сигналы могли получить прежние значения
+    без повторного SELECT той же строки.
+    """
+    tracked_fields = ()
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+    
+    def _snapshot_tracked_fields(self, fields=None):
+        """Сохраняет текущие значения полей (отложенные поля пропускаются)"""
+        if not hasattr(self, '_original_values'):
+            self._original_values = {}
+        for attname in self.tracked_fields if fields is None else fields:
+            if attname in self.__dict__:
+                self._original_values[attname] = self.__dict__[attname]
+    
+    def get_original_values(self):
+        """Значения отслеживаемых полей на момент загрузки или последнего сохранения"""
+        original = dict(getattr(self, '_original_values', {}))
+        missing = [attname for attname in self.tracked_fields if attname not in original]
+        if missing and self.pk is not None:
+            # Объект создан не из БД или поля были отложены - дочитываем только недостающее
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            if row is None:
+                return {}
+            original.update(row)
+        return {attname: original[attname] for attname in self.tracked_fields}
+    
+    def has_changed(self, *attnames):
+        """Изменилось ли хотя бы одно из полей с момента загрузки"""
+        original = getattr(self, '_original_values', {})
+        return any(
+            attname not in original or original[attname] != getattr(self, attname)
+            for attname in attnames
+        )
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._snapshot_tracked_fields()
+        else:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            self._snapshot_tracked_fields([attname for attname in self.tracked_fields if attname in saved])
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Дочитывание отложенного поля не должно затирать снимок уже изменённых полей
+        if fields is None:
+            self._snapshot_tracked_fields()
+        else:
+            refreshed = {self._meta.get_field(name).attname for name in fields}
+            self._snapshot_tracked_fields([attname for attname in self.tracked_fields if attname in refreshed])
+
+
+class ChangeHistoryQuerySet(models.QuerySet):
+    
+    def with_content_objects(self):
+        """
+        Предзагрузка объектов журнала: один запрос на тип объекта вместо запроса
+        на строку. Для моделей с str_select_related в том же запросе загружаются
+        связи, нужные их __str__. Для удалённых объектов content_object - None.
+        """
+        querysets = [
+            model._base_manager.select_related(*model.str_select_related)
+            for model in self.model._meta.app_config.get_models()
+            if getattr(model, 'str_select_related', ())
+        ]
+        return self.prefetch_related(GenericPrefetch('content_object', querysets))
+
+
 class ChangeHistory(models.Model):
     """Модель для сохранения истории изменений объектов"""
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
@@ -20,6 +105,8 @@ class ChangeHistory(models.Model):
     changes = models.JSONField(default=dict, verbose_name='Изменения')
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')
     
+    objects = ChangeHistoryQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'История изменений'
         verbose_name_plural = 'История изменений'
@@ -28,22 +115,42 @@ class ChangeHistory(models.Model):
             models.Index(fields=['content_type', 'object_id']),
         ]
     
+    def get_object_display(self):
+        """Название объекта или его тип и ID, если объект удалён"""
+        content_object = self.content_object
+        if content_object is not None:
+            return str(content_object)
+        model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        name = model._meta.verbose_name if model is not None else 'Объект'
+        return f"{name} #{self.object_id} (удалён)"
+    
     def __str__(self):
-        return f"{self.get_action_display()} - {self.content_object} ({self.timestamp})"
+        return f"{self.get_action_display()} - {self.get_object_display()} ({self.timestamp})"
 
 
-class User(models.Model):
+class User(FieldTrackerMixin, models.Model):
     """Модель пользователя"""
+    # Поля, попадающие в поисковый индекс и плоскую таблицу записей
+    tracked_fields = ('name', 'email')
     ROLE_CHOICES = [
         ('client', 'Клиент'),
         ('admin', 'Администратор'),
     ]
     
     user_id = models.AutoField(primary_key=True, verbose_name='ID пользователя')
+    auth_user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='salon_user',
+        verbose_name='Учётная запись'
+    )
     name = models.CharField(max_length=255, verbose_name='Имя')
-    email = models.EmailField(verbose_name='Email')
+    email = models.EmailField(db_index=True, verbose_name='Email')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='client', verbose_name='Роль')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
     class Meta:
         verbose_name = 'Пользователь'
@@ -69,12 +176,19 @@ class Image(models.Model):
         return f"Изображение {self.image_id}"
 
 
-class Service(models.Model):
+class Service(FieldTrackerMixin, models.Model):
     """Модель услуги"""
+    # Поля, попадающие в поисковые индексы услуг и записей и в плоскую таблицу записей
+    tracked_fields = ('title', 'description', 'price')
     service_id = models.AutoField(primary_key=True, verbose_name='ID услуги')
     title = models.CharField(max_length=255, verbose_name='Название')
     description = models.TextField(verbose_name='Описание')
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    duration_minutes = models.PositiveIntegerField(
+        default=60,
+        validators=[MinValueValidator(5)],
+        verbose_name='Длительность (мин)'
+    )
     # Дополнительное поле для демонстрации filter_horizontal
     related_services = models.ManyToManyField(
         'self',
@@ -94,8 +208,10 @@ class Service(models.Model):
         return f"{self.title} - {self.price} руб."
 
 
-class Master(models.Model):
+class Master(FieldTrackerMixin, models.Model):
     """Модель мастера"""
+    tracked_fields = ('full_name', 'specialization', 'experience_years')
+    
     master_id = models.AutoField(primary_key=True, verbose_name='ID мастера')
     full_name = models.CharField(max_length=255, verbose_name='Полное имя')
     specialization = models.CharField(max_length=255, verbose_name='Специализация')
@@ -126,8 +242,44 @@ class Master(models.Model):
         return f"{self.full_name} - {self.specialization}"
 
 
+class WorkingHours(models.Model):
+    """Модель рабочего времени мастера по дням недели"""
+    # Связи, которые читает __str__ (для предзагрузки в журнале изменений)
+    str_select_related = ('master',)
+    WEEKDAY_CHOICES = [
+        (0, 'Понедельник'),
+        (1, 'Вторник'),
+        (2, 'Среда'),
+        (3, 'Четверг'),
+        (4, 'Пятница'),
+        (5, 'Суббота'),
+        (6, 'Воскресенье'),
+    ]
+    
+    working_hours_id = models.AutoField(primary_key=True, verbose_name='ID расписания')
+    master = models.ForeignKey(
+        Master,
+        on_delete=models.CASCADE,
+        related_name='working_hours',
+        verbose_name='Мастер'
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name='День недели')
+    start_time = models.TimeField(verbose_name='Начало работы')
+    end_time = models.TimeField(verbose_name='Окончание работы')
+    
+    class Meta:
+        verbose_name = 'Рабочее время'
+        verbose_name_plural = 'Рабочее время'
+        unique_together = ['master', 'weekday']
+        ordering = ['master', 'weekday']
+    
+    def __str__(self):
+        return f"{self.master.full_name}: {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+
 class MasterService(models.Model):
     """Модель связи многие-ко-многим между мастерами и услугами"""
+    str_select_related = ('master', 'service')
     master_service_id = models.AutoField(primary_key=True, verbose_name='ID связи')
     master = models.ForeignKey(
         Master,
@@ -152,8 +304,12 @@ class MasterService(models.Model):
         return f"{self.master.full_name} - {self.service.title}"
 
 
-class Booking(models.Model):
+class Booking(FieldTrackerMixin, models.Model):
     """Модель записи клиента"""
+    tracked_fields = ('status', 'appointment_datetime', 'master_id', 'service_id')
+    # Связи, которые читает __str__ (ChangeHistory.objects.with_content_objects)
+    str_select_related = ('user', 'master')
+    
     STATUS_CHOICES = [
         ('pending', 'Ожидает подтверждения'),
         ('confirmed', 'Подтверждена'),
@@ -181,6 +337,12 @@ class Booking(models.Model):
         verbose_name='Услуга'
     )
     appointment_datetime = models.DateTimeField(verbose_name='Дата и время записи')
+    end_datetime = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Дата и время окончания'
+    )
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -188,6 +350,7 @@ class Booking(models.Model):
         verbose_name='Статус'
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
     # История изменений через django-simple-history
     history = HistoricalRecords()
@@ -196,13 +359,305 @@ class Booking(models.Model):
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
         ordering = ['-appointment_datetime']
+        indexes = [
+            models.Index(fields=['master', 'appointment_datetime']),
+            # Ключ keyset-пагинации списка записей
+            models.Index(fields=['appointment_datetime', 'booking_id']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Запись {self.user.name} к {self.master.full_name} на {self.appointment_datetime}"
+    
+    def compute_end_datetime(self):
+        """Окончание записи по длительности услуги"""
+        if self.appointment_datetime is None or self.service_id is None:
+            return None
+        return self.appointment_datetime + timedelta(minutes=self.service.duration_minutes)
+    
+    def clean(self):
+        """Проверка, что время мастера не занято другой записью"""
+        from .reservations import check_alignment, check_availability
+        super().clean()
+        if self.appointment_datetime:
+            try:
+                check_alignment(self.appointment_datetime)
+            except ValidationError as error:
+                raise ValidationError({'appointment_datetime': error})
+        if self.appointment_datetime and self.master_id and self.service_id:
+            self.end_datetime = self.compute_end_datetime()
+            check_availability(self)
+    
+    def save(self, *args, **kwargs):
+        from .audit import shared_buffer
+        from .reservations import sync_time_slots
+        # Длительность фиксируется в записи, чтобы изменение услуги не сдвигало уже занятое время
+        if self.end_datetime is None or self.has_changed('appointment_datetime', 'service_id'):
+            self.end_datetime = self.compute_end_datetime()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # auto_now не обновляется, если поля нет в update_fields
+            extra = {'updated_at'}
+            if {'appointment_datetime', 'service'} & set(update_fields):
+                extra.add('end_datetime')
+            kwargs['update_fields'] = set(update_fields) | extra
+        # Запись и занятые ею ячейки расписания сохраняются атомарно
+        adding = self._state.adding
+        original_values = dict(getattr(self, '_original_values', {}))
+        try:
+            # Журнал изменений записи пишется пачкой вызывающей транзакции
+            with shared_buffer(), transaction.atomic():
+                super().save(*args, **kwargs)
+                sync_time_slots(self, created=adding)
+        except Exception:
+            # Транзакция откатилась - прежние значения остаются актуальными
+            self._original_values = original_values
+            raise
+
+
+class ArchivedBooking(models.Model):
+    """
+    Завершённая или отменённая запись, перенесённая из Booking командой
+    archive_bookings (salon.booking_archive). ID записи сохраняется.
+    """
+    booking_id = models.IntegerField(primary_key=True, verbose_name='ID записи')
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_bookings',
+        verbose_name='Пользователь'
+    )
+    master = models.ForeignKey(
+        Master,
+        on_delete=models.CASCADE,
+        related_name='archived_bookings',
+        verbose_name='Мастер'
+    )
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='archived_bookings',
+        verbose_name='Услуга'
+    )
+    appointment_datetime = models.DateTimeField(verbose_name='Дата и время записи')
+    end_datetime = models.DateTimeField(null=True, blank=True, verbose_name='Дата и время окончания')
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата переноса в архив')
+    
+    class Meta:
+        verbose_name = 'Архивная запись'
+        verbose_name_plural = 'Архив записей'
+        ordering = ['-appointment_datetime']
+        indexes = [
+            models.Index(fields=['master', 'appointment_datetime']),
+            models.Index(fields=['appointment_datetime', 'booking_id']),
+        ]
+    
+    def __str__(self):
+        return f"Запись {self.user.name} к {self.master.full_name} на {self.appointment_datetime} (архив)"
+
+
+class BookingRecord(models.Model):
+    """
+    Текущие и архивные записи вместе: представление salon_booking_record
+    (UNION ALL таблиц Booking и ArchivedBooking, миграция 0016), только для
+    чтения. Используется, когда запрошенный период заходит в архив. Новые
+    колонки записи нужно добавить и в ArchivedBooking, и в представление.
+    """
+    booking_id = models.IntegerField(primary_key=True, verbose_name='ID записи')
+    # DO_NOTHING: строки представления удаляются вместе со строками таблиц
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+', verbose_name='Пользователь')
+    master = models.ForeignKey(Master, on_delete=models.DO_NOTHING, related_name='+', verbose_name='Мастер')
+    service = models.ForeignKey(Service, on_delete=models.DO_NOTHING, related_name='+', verbose_name='Услуга')
+    appointment_datetime = models.DateTimeField(verbose_name='Дата и время записи')
+    end_datetime = models.DateTimeField(null=True, blank=True, verbose_name='Дата и время окончания')
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+    archived = models.BooleanField(verbose_name='В архиве')
+    
+    class Meta:
+        managed = False
+        db_table = 'salon_booking_record'
+        verbose_name = 'Запись'
+        verbose_name_plural = 'Записи'
+        ordering = ['-appointment_datetime']
     
     def __str__(self):
         return f"Запись {self.user.name} к {self.master.full_name} на {self.appointment_datetime}"
 
 
-class Review(models.Model):
+class BookingListItem(models.Model):
+    """
+    Плоская строка текущей записи для списков (salon.read_model): имена клиента
+    и мастера, название и цена услуги копируются из связанных таблиц, поэтому
+    списки читают одну таблицу без JOIN. Поддерживается сигналами.
+    """
+    booking_id = models.IntegerField(primary_key=True, verbose_name='ID записи')
+    # Без ограничений БД: строки удаляются и обновляются вместе с записью
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name='Пользователь'
+    )
+    master = models.ForeignKey(
+        Master, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name='Мастер'
+    )
+    service = models.ForeignKey(
+        Service, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name='Услуга'
+    )
+    user_name = models.CharField(max_length=255, verbose_name='Имя клиента')
+    user_email = models.CharField(max_length=254, verbose_name='Email клиента')
+    master_name = models.CharField(max_length=255, verbose_name='Мастер')
+    master_specialization = models.CharField(max_length=255, verbose_name='Специализация мастера')
+    service_title = models.CharField(max_length=255, verbose_name='Услуга')
+    service_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    appointment_datetime = models.DateTimeField(verbose_name='Дата и время записи')
+    end_datetime = models.DateTimeField(null=True, blank=True, verbose_name='Дата и время окончания')
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+    # Время последнего обновления строки, в том числе после переименования клиента, мастера или услуги
+    synced_at = models.DateTimeField(verbose_name='Дата синхронизации')
+    
+    class Meta:
+        verbose_name = 'Строка списка записей'
+        verbose_name_plural = 'Строки списка записей'
+        ordering = ['-appointment_datetime']
+        indexes = [
+            models.Index(fields=['appointment_datetime', 'booking_id']),
+            models.Index(fields=['user', 'appointment_datetime']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Запись {self.user_name} к {self.master_name} на {self.appointment_datetime}"
+
+
+class BookingCounter(models.Model):
+    """Количество записей по дню приёма и статусу (поддерживается сигналами)"""
+    counter_id = models.BigAutoField(primary_key=True, verbose_name='ID счётчика')
+    day = models.DateField(verbose_name='День записи')
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name='Статус')
+    count = models.IntegerField(default=0, verbose_name='Количество')
+    
+    class Meta:
+        verbose_name = 'Счётчик записей'
+        verbose_name_plural = 'Счётчики записей'
+        ordering = ['-day', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_booking_counter'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count}"
+
+
+class BookingDailyRollup(models.Model):
+    """Агрегат записей за день по мастеру, услуге и статусу (строится generate_statistics)"""
+    rollup_id = models.BigAutoField(primary_key=True, verbose_name='ID агрегата')
+    day = models.DateField(verbose_name='День записи')
+    master = models.ForeignKey(
+        Master,
+        on_delete=models.CASCADE,
+        related_name='daily_rollups',
+        verbose_name='Мастер'
+    )
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='daily_rollups',
+        verbose_name='Услуга'
+    )
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES, verbose_name='Статус')
+    bookings_count = models.PositiveIntegerField(default=0, verbose_name='Количество записей')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма по прайсу')
+    
+    class Meta:
+        verbose_name = 'Дневной агрегат записей'
+        verbose_name_plural = 'Дневные агрегаты записей'
+        ordering = ['-day', 'master', 'service', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'master', 'service', 'status'], name='unique_booking_daily_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.master_id}/{self.service_id} {self.status}: {self.bookings_count}"
+
+
+class RollupDirtyDay(models.Model):
+    """День, записи которого изменились после последнего построения агрегатов"""
+    dirty_day_id = models.BigAutoField(primary_key=True, verbose_name='ID отметки')
+    day = models.DateField(unique=True, verbose_name='День записи')
+    
+    class Meta:
+        verbose_name = 'День для пересчёта агрегатов'
+        verbose_name_plural = 'Дни для пересчёта агрегатов'
+    
+    def __str__(self):
+        return str(self.day)
+
+
+class MasterScheduleVersion(models.Model):
+    """
+    Версия расписания мастера для индекса свободного времени (salon.availability):
+    увеличивается в той же транзакции, что и запись или рабочие часы мастера.
+    """
+    master = models.OneToOneField(
+        Master,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='schedule_version',
+        verbose_name='Мастер'
+    )
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+    
+    class Meta:
+        verbose_name = 'Версия расписания мастера'
+        verbose_name_plural = 'Версии расписаний мастеров'
+    
+    def __str__(self):
+        return f"{self.master_id}: {self.version}"
+
+
+class MasterTimeSlot(models.Model):
+    """Ячейка сетки расписания мастера, занятая записью.
+    
+    Уникальность (master, slot_start) гарантирует на уровне БД, что две записи
+    не займут одно и то же время мастера даже при параллельном создании.
+    """
+    slot_id = models.BigAutoField(primary_key=True, verbose_name='ID ячейки')
+    master = models.ForeignKey(
+        Master,
+        on_delete=models.CASCADE,
+        related_name='time_slots',
+        verbose_name='Мастер'
+    )
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE,
+        related_name='time_slots',
+        verbose_name='Запись'
+    )
+    slot_start = models.DateTimeField(verbose_name='Начало ячейки')
+    
+    class Meta:
+        verbose_name = 'Занятое время мастера'
+        verbose_name_plural = 'Занятое время мастеров'
+        ordering = ['master', 'slot_start']
+        constraints = [
+            models.UniqueConstraint(fields=['master', 'slot_start'], name='unique_master_time_slot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.master_id}: {self.slot_start}"
+
+
+class Review(FieldTrackerMixin, models.Model):
     """Модель отзыва"""
+    # Поля, от которых зависит рейтинг мастера (MasterRating)
+    tracked_fields = ('master_id', 'rating')
+    str_select_related = ('user', 'master')
     review_id = models.AutoField(primary_key=True, verbose_name='ID отзыва')
     user = models.ForeignKey(
         User,
@@ -217,7 +672,7 @@ class Review(models.Model):
         verbose_name='Мастер'
     )
     rating = models.PositiveIntegerField(
-        validators=[MinValueValidator(0), MaxValueValidator(5)],
+        validators=[MinValueValidator(1), MaxValueValidator(5)],
         verbose_name='Рейтинг'
     )
     comment = models.TextField(blank=True, null=True, verbose_name='Комментарий')
@@ -230,3 +685,76 @@ class Review(models.Model):
     
     def __str__(self):
         return f"Отзыв от {self.user.name} на {self.master.full_name} ({self.rating}/5)"
+
+
+class MasterRating(models.Model):
+    """
+    Рейтинг мастера по отзывам: количество, сумма оценок и число оценок 1-5.
+    Поддерживается сигналами отзывов в той же транзакции, что и отзыв.
+    """
+    rating_id = models.BigAutoField(primary_key=True, verbose_name='ID рейтинга')
+    master = models.OneToOneField(
+        Master,
+        on_delete=models.CASCADE,
+        related_name='rating',
+        verbose_name='Мастер'
+    )
+    reviews_count = models.IntegerField(default=0, verbose_name='Количество отзывов')
+    rating_sum = models.IntegerField(default=0, verbose_name='Сумма оценок')
+    average = models.FloatField(null=True, blank=True, db_index=True, verbose_name='Средняя оценка')
+    rating_1 = models.IntegerField(default=0, verbose_name='Оценок 1')
+    rating_2 = models.IntegerField(default=0, verbose_name='Оценок 2')
+    rating_3 = models.IntegerField(default=0, verbose_name='Оценок 3')
+    rating_4 = models.IntegerField(default=0, verbose_name='Оценок 4')
+    rating_5 = models.IntegerField(default=0, verbose_name='Оценок 5')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    
+    class Meta:
+        verbose_name = 'Рейтинг мастера'
+        verbose_name_plural = 'Рейтинги мастеров'
+    
+    def __str__(self):
+        return f"{self.master_id}: {self.average} ({self.reviews_count})"
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка из админки через ресурс import-export: параметры списка
+    и выбранные записи (JSON), ресурс, выбранные поля, формат и ход работы
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    job_id = models.BigAutoField(primary_key=True, verbose_name='ID выгрузки')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name='Модель')
+    resource = models.CharField(max_length=255, verbose_name='Ресурс')
+    export_fields = models.JSONField(null=True, blank=True, verbose_name='Поля')
+    file_format = models.CharField(max_length=10, verbose_name='Формат')
+    filters = models.JSONField(default=dict, verbose_name='Фильтры')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    total_rows = models.PositiveIntegerField(null=True, blank=True, verbose_name='Всего строк')
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name='Выгружено строк')
+    file_name = models.CharField(max_length=255, blank=True, verbose_name='Файл')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='salon_export_jobs',
+        verbose_name='Автор'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+    
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Выгрузка {self.job_id} ({self.get_status_display()})"
@@ -0,0 +1,223 @@
+"""
+Keyset (курсорная) пагинация.
+
+Страница выбирается условием "строго после позиции последней показанной строки"
+по ключу сортировки, дополненному первичным ключом, поэтому не нужны ни COUNT(*),
+ни растущий OFFSET: стоимость любой страницы одинакова. Курсор кодирует значения
+ключа и направление просмотра, так что листать можно и вперёд, и назад.
+Режим включается по запросу клиента (?pagination=cursor или ?cursor=...),
+по умолчанию остаётся обычная номерная пагинация.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_PARAM = 'cursor'
+MODE_PARAM = 'pagination'
+
+
+class InvalidCursor(Exception):
+    """Курсор повреждён или не соответствует текущей сортировке"""
+
+
+def is_keyset_request(params):
+    """Запросил ли клиент keyset-режим"""
+    return params.get(MODE_PARAM) == 'cursor' or bool(params.get(CURSOR_PARAM))
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(position, reverse=False):
+    payload = json.dumps({'p': [_json_value(value) for value in position], 'r': int(reverse)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return list(payload['p']), bool(payload.get('r'))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor()
+
+
+class KeysetPage:
+    """Страница keyset-пагинации (совместима с page_obj в шаблонах)"""
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _keyset_condition(keys, position):
+    """Строки строго после позиции в лексикографическом порядке ключей"""
+    condition = None
+    equal = Q()
+    for (field, descending), value in zip(keys, position):
+        step = Q(**{f'{field}__{"lt" if descending else "gt"}': value}) & equal
+        condition = step if condition is None else condition | step
+        equal &= Q(**{field: value})
+    # Диапазон по первому полю позволяет БД начать с нужного места индекса
+    first_field, first_descending = keys[0]
+    bound = Q(**{f'{first_field}__{"lte" if first_descending else "gte"}': position[0]})
+    return bound & condition
+
+
+def keyset_paginate(queryset, ordering, page_size, cursor=None):
+    """
+    Возвращает KeysetPage для queryset, отсортированного по ordering
+    (список полей с необязательным '-'), начиная с позиции курсора.
+    """
+    model = queryset.model
+    pk_name = model._meta.pk.name
+    keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering if name.lstrip('-') != pk_name]
+    # Первичный ключ делает порядок однозначным при равных значениях
+    keys.append((pk_name, keys[0][1] if keys else False))
+
+    position, reverse = None, False
+    if cursor:
+        position, reverse = decode_cursor(cursor)
+        if len(position) != len(keys):
+            raise InvalidCursor()
+        try:
+            position = [model._meta.get_field(field).to_python(value) for (field, _), value in zip(keys, position)]
+        except (FieldDoesNotExist, ValidationError):
+            raise InvalidCursor()
+
+    # При движении назад читаем в обратном порядке и разворачиваем страницу
+    scan_keys = [(field, descending != reverse) for field, descending in keys]
+    queryset = queryset.order_by(*[f'-{field}' if descending else field for field, descending in scan_keys])
+    if position is not None:
+        queryset = queryset.filter(_keyset_condition(scan_keys, position))
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+        has_previous, has_next = has_more, position is not None
+    else:
+        has_previous, has_next = position is not None, has_more
+
+    def position_of(row):
+        return [getattr(row, field) for field, _ in keys]
+
+    next_cursor = encode_cursor(position_of(rows[-1])) if has_next and rows else None
+    previous_cursor = encode_cursor(position_of(rows[0]), reverse=True) if has_previous and rows else None
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """Опциональный keyset-режим для ListView"""
+    keyset_ordering = ('-appointment_datetime',)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not is_keyset_request(self.request.GET):
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = keyset_paginate(queryset, self.keyset_ordering, page_size, self.request.GET.get(CURSOR_PARAM))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор')
+        return None, page, page.object_list, False
+
+
+class CountQuerysetPaginator(Paginator):
+    """
+    Номерная пагинация, которая считает строки по отдельному queryset: строки
+    страницы читаются values_list со связями, а COUNT(*) по ним повторял бы
+    все JOIN, хотя число строк от связей не зависит.
+    """
+
+    def __init__(self, object_list, per_page, count_queryset=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        if self.count_queryset is not None:
+            return self.count_queryset.count()
+        return super().count
+
+
+class BookingPagination(PageNumberPagination):
+    """Номерная пагинация по умолчанию и keyset-режим без COUNT(*) по запросу клиента"""
+    keyset_ordering = ('-appointment_datetime',)
+
+    def django_paginator_class(self, object_list, per_page):
+        # Подсчёт по queryset без колонок связей, если представление его задало
+        return CountQuerysetPaginator(object_list, per_page, self.count_queryset)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = is_keyset_request(request.query_params)
+        if not self.keyset:
+            self.count_queryset = getattr(view, 'count_queryset', None)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering = self.get_keyset_ordering(request, queryset, view)
+        try:
+            self.page = keyset_paginate(
+                queryset, ordering, self.get_page_size(request), request.query_params.get(CURSOR_PARAM)
+            )
+        except InvalidCursor:
+            raise NotFound('Некорректный курсор')
+        return list(self.page)
+
+    def get_keyset_ordering(self, request, queryset, view):
+        """Сортировка из OrderingFilter (ordering_fields представления) или по умолчанию"""
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    return ordering
+        return self.keyset_ordering
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_cursor_link(self.page.next_cursor),
+            'previous': self.get_cursor_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, CURSOR_PARAM, cursor)
@@ -0,0 +1,88 @@
+"""
+Рейтинги мастеров по отзывам.
+
+Сигналы отзыва изменяют MasterRating в той же транзакции, что и сам отзыв:
+количество, сумма и число оценок каждого значения меняются одним UPDATE с
+F-выражениями, средняя оценка считается в том же UPDATE. Поэтому список
+мастеров сортируется и фильтруется по рейтингу через JOIN с маленькой
+таблицей, без GROUP BY по отзывам.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
+
+from .models import MasterRating, Review
+from .response_cache import bump_generation_on_commit
+
+RATING_VALUES = range(1, 6)
+
+
+def _apply(master_id, deltas):
+    """Прибавляет deltas ({поле: приращение}) к рейтингу мастера"""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    # В UPDATE правые части видят старые значения строки
+    count = F('reviews_count') + deltas.get('reviews_count', 0)
+    total = F('rating_sum') + deltas.get('rating_sum', 0)
+    changes['average'] = Cast(total, FloatField()) / NullIf(count, Value(0))
+    changes['updated_at'] = timezone.now()
+    updated = MasterRating.objects.filter(master_id=master_id).update(**changes)
+    if not updated and deltas.get('reviews_count', 0) > 0:
+        # Строки ещё нет: создаём с нулями (параллельная вставка не мешает) и применяем.
+        # При одних вычитаниях строку не создаём - например, при каскадном удалении мастера
+        MasterRating.objects.bulk_create([MasterRating(master_id=master_id)], ignore_conflicts=True)
+        MasterRating.objects.filter(master_id=master_id).update(**changes)
+
+
+def record_review_changes(changes):
+    """
+    Переносит оценки между рейтингами: changes - пары (old, new), где ключ -
+    (ID мастера, оценка) или None, если отзыва нет. Один UPDATE на мастера.
+    """
+    deltas = defaultdict(Counter)
+    for old, new in changes:
+        if old == new:
+            continue
+        for key, sign in ((old, -1), (new, 1)):
+            if key is None:
+                continue
+            master_id, rating = key
+            deltas[master_id]['reviews_count'] += sign
+            deltas[master_id]['rating_sum'] += sign * rating
+            if rating in RATING_VALUES:
+                deltas[master_id][f'rating_{rating}'] += sign
+    for master_id, master_deltas in deltas.items():
+        _apply(master_id, master_deltas)
+    if deltas:
+        bump_generation_on_commit(MasterRating)
+
+
+def review_key(master_id, rating):
+    return None if master_id is None or rating is None else (master_id, rating)
+
+
+def actual_ratings():
+    """Рейтинги, посчитанные заново по таблице отзывов: {ID мастера: {поле: значение}}"""
+    rows = Review.objects.order_by().values('master_id').annotate(
+        reviews_count=Count('pk'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{value}': Count('pk', filter=Q(rating=value)) for value in RATING_VALUES},
+    )
+    return {row.pop('master_id'): row for row in rows}
+
+
+def rebuild_ratings():
+    """Пересчитывает все рейтинги по отзывам; возвращает число мастеров с отзывами"""
+    with transaction.atomic():
+        actual = actual_ratings()
+        MasterRating.objects.exclude(master_id__in=actual).delete()
+        for master_id, values in actual.items():
+            MasterRating.objects.update_or_create(master_id=master_id, defaults={
+                **values, 'average': values['rating_sum'] / values['reviews_count'],
+            })
+        bump_generation_on_commit(MasterRating)
+    return len(actual)
@@ -0,0 +1,148 @@
+"""
+Плоская таблица текущих записей для списков (BookingListItem).
+
+Список записей на сайте, страница подтверждения записей и список API
+показывают имя и email клиента, имя мастера, название и цену услуги, поэтому
+каждый их запрос соединял Booking с User, Master и Service. В строке
+BookingListItem эти значения уже скопированы: фильтры по клиенту, мастеру и
+статусу, сортировка и пагинация идут по одной таблице и её индексам.
+
+Строки обновляются в той же транзакции, что и источник:
+- сохранение и удаление записи (сигналы), массовое создание
+  (bookings_bulk_created), смена статуса пачкой (transitions) и перенос в
+  архив (booking_archive) переписывают или удаляют строки этих записей;
+- переименование клиента, мастера или услуги (а также смена email,
+  специализации, цены) обновляет их строки одним UPDATE по индексу связи.
+
+Изменения в обход сигналов (queryset.update, bulk_create без
+bookings_bulk_created) находит команда check_booking_read_model (с --fix
+исправляет), целиком таблица перестраивается командой rebuild_booking_read_model.
+"""
+from django.db import connection
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+from .models import Booking, BookingListItem, Master, Service, User
+from .response_cache import bump_generation_on_commit
+
+# Колонка плоской таблицы -> поле записи
+SOURCES = {
+    'booking_id': 'booking_id',
+    'user_id': 'user_id',
+    'master_id': 'master_id',
+    'service_id': 'service_id',
+    'user_name': 'user__name',
+    'user_email': 'user__email',
+    'master_name': 'master__full_name',
+    'master_specialization': 'master__specialization',
+    'service_title': 'service__title',
+    'service_price': 'service__price',
+    'appointment_datetime': 'appointment_datetime',
+    'end_datetime': 'end_datetime',
+    'status': 'status',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+# Модель -> (колонка связи, {поле модели: колонка плоской таблицы})
+RELATED_COLUMNS = {
+    User: ('user_id', {'name': 'user_name', 'email': 'user_email'}),
+    Master: ('master_id', {'full_name': 'master_name', 'specialization': 'master_specialization'}),
+    Service: ('service_id', {'title': 'service_title', 'price': 'service_price'}),
+}
+# Путь поля от Booking (как в сериализаторе и фильтрах) -> поле плоской таблицы
+FIELD_PATHS = {
+    **{path: column for column, path in SOURCES.items()},
+    'user': 'user',
+    'master': 'master',
+    'service': 'service',
+    'user__user_id': 'user_id',
+    'master__master_id': 'master_id',
+    'service__service_id': 'service_id',
+}
+CHECK_CHUNK_SIZE = 2000
+
+
+def read_columns(paths):
+    """Поля плоской таблицы для путей полей Booking или None, если какого-то из них в ней нет"""
+    try:
+        return [FIELD_PATHS[path] for path in paths]
+    except KeyError:
+        return None
+
+
+def _insert(cursor, queryset):
+    """INSERT ... SELECT строк для записей queryset"""
+    source = queryset.order_by().annotate(
+        _synced_at=Value(timezone.now(), output_field=DateTimeField())
+    ).values_list(*SOURCES.values(), '_synced_at')
+    sql, params = source.query.sql_with_params()
+    columns = ', '.join([*SOURCES, 'synced_at'])
+    cursor.execute(f'INSERT INTO {BookingListItem._meta.db_table} ({columns}) {sql}', params)
+
+
+def refresh_items(pks):
+    """Переписывает строки записей с ID из pks (строки удалённых записей убираются)"""
+    pks = list(pks)
+    if not pks:
+        return
+    BookingListItem.objects.filter(pk__in=pks).delete()
+    with connection.cursor() as cursor:
+        _insert(cursor, Booking._base_manager.filter(pk__in=pks))
+
+
+def remove_items(pks):
+    pks = list(pks)
+    if pks:
+        BookingListItem.objects.filter(pk__in=pks).delete()
+
+
+def sync_related(instance):
+    """
+    Копирует изменённые поля клиента, мастера или услуги в строки их записей
+    (вызывается из post_save, пока снимок полей хранит прежние значения).
+    Возвращает число обновлённых строк.
+    """
+    relation, columns = RELATED_COLUMNS[type(instance)]
+    if not instance.has_changed(*columns):
+        return 0
+    values = {column: getattr(instance, field) for field, column in columns.items()}
+    return BookingListItem.objects.filter(**{relation: instance.pk}).update(synced_at=timezone.now(), **values)
+
+
+def rebuild():
+    """Полная перестройка таблицы"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {BookingListItem._meta.db_table}')
+        _insert(cursor, Booking._base_manager.all())
+    bump_generation_on_commit(Booking)
+
+
+def check():
+    """
+    Сверяет таблицу с записями одним проходом по обеим таблицам в порядке ID.
+    Возвращает {'missing': ID записей без строки, 'extra': строки без записи,
+    'stale': строки с устаревшими значениями}.
+    """
+    source = Booking._base_manager.order_by('pk').values_list(*SOURCES.values()).iterator(CHECK_CHUNK_SIZE)
+    stored = BookingListItem.objects.order_by('pk').values_list(*SOURCES).iterator(CHECK_CHUNK_SIZE)
+    result = {'missing': [], 'extra': [], 'stale': []}
+    source_row, stored_row = next(source, None), next(stored, None)
+    while source_row is not None or stored_row is not None:
+        if stored_row is None or source_row is not None and source_row[0] < stored_row[0]:
+            result['missing'].append(source_row[0])
+            source_row = next(source, None)
+        elif source_row is None or stored_row[0] < source_row[0]:
+            result['extra'].append(stored_row[0])
+            stored_row = next(stored, None)
+        else:
+            if source_row != stored_row:
+                result['stale'].append(source_row[0])
+            source_row, stored_row = next(source, None), next(stored, None)
+    return result
+
+
+def repair(result):
+    """Исправляет расхождения, найденные check()"""
+    refresh_items(result['missing'] + result['stale'])
+    remove_items(result['extra'])
+    bump_generation_on_commit(Booking)
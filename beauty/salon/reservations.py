@@ -0,0 +1,106 @@
+"""
+Резервирование времени мастера.
+
+Каждая активная запись занимает ячейки сетки расписания (шаг SALON_SLOT_STEP_MINUTES)
+в таблице MasterTimeSlot с уникальным ключом (master, slot_start). Проверка в форме,
+сериализаторе и админке лишь заранее показывает понятную ошибку, а гарантию даёт
+уникальный индекс: из двух параллельных транзакций, претендующих на одну ячейку,
+вторая получит IntegrityError, которая превращается в BookingConflict. Конфликтуют
+только ячейки одного мастера, вся таблица при этом не блокируется.
+
+Начало записи должно лежать на сетке (check_alignment; та же сетка, по которой
+availability предлагает слоты): тогда две записи делят
+ячейку ровно тогда, когда их интервалы пересекаются. Окончание на сетку не
+выравнивается - последняя ячейка занята частично, но следующее допустимое начало
+всё равно не раньше её конца.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+
+from .availability import ACTIVE_STATUSES, grid_step, on_grid
+from .models import MasterTimeSlot
+
+CONFLICT_MESSAGE = 'Мастер уже занят в это время. Выберите другое время.'
+
+
+class BookingConflict(ValidationError):
+    """Время мастера уже занято другой записью"""
+
+    def __init__(self, message=CONFLICT_MESSAGE):
+        super().__init__(message, code='booking_conflict')
+
+
+def check_alignment(start):
+    """Бросает ValidationError, если начало записи не на сетке SALON_SLOT_STEP_MINUTES"""
+    if not on_grid(start):
+        raise ValidationError(
+            f'Время записи должно быть кратно {settings.SALON_SLOT_STEP_MINUTES} минутам.', code='off_grid'
+        )
+
+
+def slot_starts(start, end):
+    """Начала ячеек сетки, которые пересекает интервал [start, end)"""
+    step = grid_step()
+    first = int(start.timestamp()) // step * step
+    return [
+        datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+        for ts in range(first, int(end.timestamp()), step)
+    ]
+
+
+def occupies_time(booking):
+    """Занимает ли запись время мастера"""
+    return bool(
+        booking.status in ACTIVE_STATUSES
+        and booking.appointment_datetime
+        and booking.end_datetime
+    )
+
+
+def check_availability(booking):
+    """Бросает BookingConflict, если ячейки, нужные записи, уже заняты другой записью"""
+    if not occupies_time(booking):
+        return
+    taken = MasterTimeSlot.objects.filter(
+        master_id=booking.master_id,
+        slot_start__in=slot_starts(booking.appointment_datetime, booking.end_datetime),
+    )
+    if booking.pk:
+        taken = taken.exclude(booking_id=booking.pk)
+    if taken.exists():
+        raise BookingConflict()
+
+
+def sync_time_slots(booking, created=False):
+    """
+    Приводит занятые ячейки в соответствие со временем, мастером и статусом записи.
+    Вызывается внутри транзакции сохранения записи.
+    """
+    wanted = set()
+    if occupies_time(booking):
+        wanted = set(slot_starts(booking.appointment_datetime, booking.end_datetime))
+
+    existing = {}
+    if not created:
+        existing = dict(
+            MasterTimeSlot.objects.filter(booking_id=booking.pk).values_list('slot_start', 'master_id')
+        )
+    stale = [
+        start for start, master_id in existing.items()
+        if master_id != booking.master_id or start not in wanted
+    ]
+    if stale:
+        MasterTimeSlot.objects.filter(booking_id=booking.pk, slot_start__in=stale).delete()
+
+    missing = [start for start in wanted if existing.get(start) != booking.master_id]
+    if missing:
+        try:
+            MasterTimeSlot.objects.bulk_create([
+                MasterTimeSlot(master_id=booking.master_id, booking_id=booking.pk, slot_start=start)
+                for start in missing
+            ])
+        except IntegrityError:
+            raise BookingConflict()
@@ -0,0 +1,145 @@
+"""
+Кэш ответов чтения API с инвалидацией по поколениям моделей.
+
+У каждой модели есть счётчик поколения в кэше; сигналы увеличивают его после
+фиксации транзакции при сохранении и удалении объектов. Ключ закэшированного
+ответа включает нормализованные параметры запроса, формат ответа, область
+пользователя (для выборок вида my_bookings=true) и текущие поколения тех
+моделей, от которых зависит ответ. Поэтому запись услуги делает устаревшими
+только ответы, зависящие от услуг, а запись в Booking - только списки записей:
+старые ответы просто перестают находиться и истекают по TTL.
+
+Поколения видны всем процессам, только если кэш default общий (Redis,
+Memcached, база данных). С локальным кэшем процесса (LocMemCache, настройка по
+умолчанию) запись сбрасывает ответы только в том процессе, который её
+обработал, поэтому при нескольких процессах нужен общий кэш; об этом
+предупреждает manage.py check --deploy (salon.W001).
+
+Попадания и промахи считаются в памяти процесса и отдаются через
+/api/cache/stats/.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _generation_key(model):
+    return f'response-cache:generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    """Текущие поколения моделей (одним обращением к кэшу)"""
+    keys = [_generation_key(model) for model in models]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Счётчик вытеснен из кэша - начинаем с нового значения, а не с нуля,
+            # чтобы не совпасть со старыми ключами ответов
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump_generation(model):
+    """Делает устаревшими закэшированные ответы, зависящие от модели"""
+    key = _generation_key(model)
+    if not cache.add(key, time.time_ns(), None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_generation_on_commit(model):
+    transaction.on_commit(lambda: bump_generation(model))
+
+
+def record(name, event):
+    with _stats_lock:
+        _stats[(name, event)] += 1
+
+
+def stats():
+    """{имя ViewSet: {'hits': ..., 'misses': ...}}"""
+    with _stats_lock:
+        items = list(_stats.items())
+    result = {}
+    for (name, event), count in items:
+        result.setdefault(name, {'hits': 0, 'misses': 0})[event] = count
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class CachedResponseMixin:
+    """
+    Кэширование ответов list и retrieve. cache_dependencies - модели, от которых
+    зависит ответ; cache_user_params - параметры запроса, делающие ответ личным.
+    """
+    cache_dependencies = ()
+    cache_user_params = ()
+    # Параметры, не влияющие на ответ
+    cache_ignored_params = ('_',)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def response_cache_key(self, request):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name not in self.cache_ignored_params
+            for value in values
+        )
+        user_scope = None
+        if any(request.query_params.get(name) for name in self.cache_user_params):
+            user_scope = request.user.pk
+        parts = [
+            # Ссылки пагинации в ответе абсолютные и зависят от адреса сайта
+            request.build_absolute_uri('/'),
+            self.basename, self.action, sorted(self.kwargs.items()), params,
+            request.accepted_renderer.format, user_scope,
+            get_generations(self.cache_dependencies),
+        ]
+        return 'response-cache:' + hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+    def cached_response(self, request, view, *args, **kwargs):
+        key = self.response_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            record(self.basename, 'hits')
+            data, headers = entry
+            # Пока поколение не сменилось, сохранённые валидаторы остаются верными
+            last_modified = parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None
+            not_modified = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+            response = not_modified if not_modified is not None else Response(data)
+            for name in ('ETag', 'Last-Modified'):
+                if name in headers:
+                    response[name] = headers[name]
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record(self.basename, 'misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name] for name in ('ETag', 'Last-Modified') if response.has_header(name)}
+            cache.set(key, (response.data, headers), settings.SALON_RESPONSE_CACHE_SECONDS)
+        response['X-Cache'] = 'MISS'
+        return response
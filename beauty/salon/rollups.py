@@ -0,0 +1,128 @@
+"""
+Дневные агрегаты записей (BookingDailyRollup).
+
+Сигналы записи (и смена цены услуги) помечают изменившиеся дни в
+RollupDirtyDay, а команда generate_statistics пересчитывает агрегаты только
+для этих дней; пометка снимается в транзакции пересчёта дня. Отчёты за
+месяц или год суммируют несколько сотен строк агрегатов вместо просмотра
+всех записей за период. Агрегаты считаются по текущим и архивным записям
+(BookingRecord).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BookingDailyRollup, BookingRecord, RollupDirtyDay
+
+# Сколько дней пересчитывается за один запрос агрегации
+CHUNK_DAYS = 31
+
+
+def mark_days_dirty(days):
+    """Помечает дни для пересчёта агрегатов"""
+    RollupDirtyDay.objects.bulk_create(
+        [RollupDirtyDay(day=day) for day in set(days)],
+        ignore_conflicts=True,
+    )
+
+
+def mark_service_days_dirty(service_id):
+    """Помечает дни с записями на услугу: выручка в агрегатах считается по её текущей цене"""
+    mark_days_dirty(
+        BookingRecord.objects.order_by().filter(service_id=service_id).annotate(
+            day=TruncDate('appointment_datetime')
+        ).values_list('day', flat=True).distinct()
+    )
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def refresh_days(days):
+    """Пересчитывает агрегаты за указанные дни; возвращает число записанных строк"""
+    days = sorted(set(days))
+    written = 0
+    for i in range(0, len(days), CHUNK_DAYS):
+        chunk = days[i:i + CHUNK_DAYS]
+        # Диапазон по appointment_datetime использует индекс, точный список дней - фильтр по TruncDate
+        rows = BookingRecord.objects.order_by().filter(
+            appointment_datetime__gte=_start_of(chunk[0]),
+            appointment_datetime__lt=_start_of(chunk[-1] + timedelta(days=1)),
+        ).annotate(
+            day=TruncDate('appointment_datetime')
+        ).filter(day__in=chunk).values('day', 'master_id', 'service_id', 'status').annotate(
+            bookings_count=Count('pk'),
+            revenue=Sum('service__price'),
+        )
+        with transaction.atomic():
+            # Пометки дней снимаются в транзакции пересчёта и до чтения записей: если
+            # пересчёт упадёт, они останутся, а изменение, пришедшее после чтения,
+            # пометит день заново
+            RollupDirtyDay.objects.filter(day__in=chunk).delete()
+            rows = list(rows)
+            BookingDailyRollup.objects.filter(day__in=chunk).delete()
+            created = BookingDailyRollup.objects.bulk_create([
+                BookingDailyRollup(
+                    day=row['day'],
+                    master_id=row['master_id'],
+                    service_id=row['service_id'],
+                    status=row['status'],
+                    bookings_count=row['bookings_count'],
+                    revenue=row['revenue'] or 0,
+                )
+                for row in rows
+            ], batch_size=1000)
+        written += len(created)
+    return written
+
+
+def refresh_range(start_day, end_day):
+    """Пересчитывает агрегаты за все дни периода [start_day, end_day]"""
+    days = []
+    day = start_day
+    while day <= end_day:
+        days.append(day)
+        day += timedelta(days=1)
+    return refresh_days(days)
+
+
+def refresh_dirty_days():
+    """Пересчитывает помеченные дни; возвращает список обработанных дней"""
+    days = list(RollupDirtyDay.objects.values_list('day', flat=True))
+    refresh_days(days)
+    return days
+
+
+def booking_day_range():
+    """Первый и последний день, на которые есть записи"""
+    dates = BookingRecord.objects.order_by()
+    first = dates.order_by('appointment_datetime').values_list('appointment_datetime', flat=True).first()
+    last = dates.order_by('-appointment_datetime').values_list('appointment_datetime', flat=True).first()
+    if first is None:
+        return None, None
+    return timezone.localdate(first), timezone.localdate(last)
+
+
+def backfill():
+    """Полное перестроение агрегатов; возвращает число записанных строк"""
+    first, last = booking_day_range()
+    with transaction.atomic():
+        RollupDirtyDay.objects.all().delete()
+        BookingDailyRollup.objects.all().delete()
+    if first is None:
+        return 0
+    return refresh_range(first, last)
+
+
+def rollups(date_from=None, date_to=None):
+    """Агрегаты за период (границы включительно)"""
+    queryset = BookingDailyRollup.objects.order_by()
+    if date_from:
+        queryset = queryset.filter(day__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(day__lte=date_to)
+    return queryset
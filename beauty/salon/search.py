@@ -0,0 +1,199 @@
+"""
+Полнотекстовый поиск по записям, мастерам и услугам (SQLite FTS5).
+
+Для каждой модели есть своя виртуальная таблица FTS5, rowid строки равен
+первичному ключу объекта. Документ записи содержит имя и email клиента, имя
+мастера и название услуги, поэтому поиск по записям не делает JOIN и LIKE
+'%...%' по четырём таблицам. Таблицы заполняются одним INSERT ... SELECT из
+основных таблиц и обновляются сигналами в той же транзакции, что и объект
+(переименование клиента, мастера или услуги переиндексирует их записи).
+
+Регистр (в том числе кириллицы) сворачивает токенизатор unicode61; "ё"
+заменяется на "е" и в документе, и в запросе. Слова запроса приводятся к основе
+отбрасыванием типичных русских окончаний и ищутся по префиксу, так что
+"стрижки" находит "стрижка", а "Иванова" - "Иванов". Результаты упорядочены по
+bm25, их число ограничено SALON_SEARCH_MAX_RESULTS.
+
+Плоская таблица списков записей (BookingListItem) ищется по тому же индексу
+записей: её первичный ключ - ID записи.
+
+На других СУБД поиск работает как обычный SearchFilter по search_fields.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, IntegerField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Replace
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+from .models import Booking, BookingListItem, Master, Service
+
+
+class SearchIndex:
+    """
+    Таблица FTS5 для модели: колонки индекса берутся из полей fields (с путями через __).
+    read_models - {модель с тем же первичным ключом: её поля для поиска без индекса}.
+    """
+
+    def __init__(self, name, model, fields, read_models=None):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.read_models = read_models or {}
+        self.table = f'salon_search_{name}'
+        self.columns = [field.replace('__', '_') for field in fields]
+
+    def covers(self, model):
+        """Можно ли фильтровать queryset модели по этому индексу"""
+        return model is self.model or model in self.read_models
+
+    def source(self, queryset):
+        """values_list документов: первичный ключ и текст колонок с заменой ё на е"""
+        expressions = {
+            f'_search_{column}': Replace(
+                Replace(F(field), Value('ё'), Value('е'), output_field=TextField()),
+                Value('Ё'), Value('Е'), output_field=TextField(),
+            )
+            for column, field in zip(self.columns, self.fields)
+        }
+        return queryset.order_by().annotate(**expressions).values_list('pk', *expressions)
+
+    def _insert(self, cursor, queryset):
+        sql, params = self.source(queryset).query.sql_with_params()
+        cursor.execute(f"INSERT INTO {self.table}(rowid, {', '.join(self.columns)}) {sql}", params)
+
+    def reindex(self, queryset):
+        """Перестраивает документы объектов queryset (удалённые объекты из индекса убираются)"""
+        if not enabled():
+            return
+        pks_sql, pks_params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({pks_sql})', pks_params)
+            self._insert(cursor, queryset)
+
+    def remove(self, pks):
+        if not enabled() or not pks:
+            return
+        pks = list(pks)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(pks))})", pks)
+
+    def rebuild(self):
+        """Полная перестройка таблицы"""
+        if not enabled():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            self._insert(cursor, self.model._base_manager.all())
+
+    def search(self, query, limit=None):
+        """ID объектов, подходящих под запрос, от самых релевантных"""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        limit = limit or settings.SALON_SEARCH_MAX_RESULTS
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s',
+                [expression, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query, pks=None):
+        """
+        Объекты queryset, подходящие под запрос, с аннотацией search_rank (меньше - лучше).
+        pks - уже найденные search() ID, если запрос выполнялся раньше.
+        """
+        if not enabled():
+            condition = Q()
+            for field in self.read_models.get(queryset.model, self.fields):
+                condition |= Q(**{f'{field}__icontains': query})
+            return queryset.filter(condition).annotate(search_rank=Value(0, output_field=IntegerField()))
+        if pks is None:
+            pks = self.search(query)
+        if not pks:
+            return queryset.annotate(search_rank=Value(0, output_field=IntegerField())).none()
+        # Ранг - позиция ID в упорядоченном списке: одно выражение вместо CASE на тысячу ветвей
+        opts = queryset.model._meta
+        pk_column = f'"{opts.db_table}"."{opts.pk.column}"'
+        ranking = ',' + ','.join(str(pk) for pk in pks) + ','
+        return queryset.filter(pk__in=pks).annotate(search_rank=RawSQL(
+            f"instr(%s, ',' || {pk_column} || ',')", [ranking], output_field=IntegerField()
+        ))
+
+
+BOOKING_INDEX = SearchIndex(
+    'booking', Booking, ('user__name', 'user__email', 'master__full_name', 'service__title'),
+    read_models={BookingListItem: ('user_name', 'user_email', 'master_name', 'service_title')},
+)
+MASTER_INDEX = SearchIndex('master', Master, ('full_name', 'specialization'))
+SERVICE_INDEX = SearchIndex('service', Service, ('title', 'description'))
+INDEXES = {index.name: index for index in (BOOKING_INDEX, MASTER_INDEX, SERVICE_INDEX)}
+
+
+def enabled():
+    """FTS5-индекс есть только в SQLite"""
+    return connection.vendor == 'sqlite'
+
+
+# Окончания существительных и прилагательных, от длинных к коротким
+RUSSIAN_ENDINGS = sorted((
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ием',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ую', 'юю', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ие', 'ия', 'ии',
+    'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+), key=len, reverse=True)
+# Основа короче не обрезается, чтобы запрос не становился слишком общим
+MIN_STEM_LENGTH = 3
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def stem(token):
+    """Основа слова без русского окончания (латиница и цифры не меняются)"""
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+    return token
+
+
+def match_expression(query):
+    """Выражение MATCH: все слова запроса по префиксу основы или None для пустого запроса"""
+    tokens = TOKEN_RE.findall(normalize(query))
+    if not tokens:
+        return None
+    return ' '.join(f'"{stem(token)}"*' for token in tokens)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Поиск по ?search= через FTS5-индекс представления (search_index). Если
+    клиент не задал ?ordering=, результаты упорядочены по релевантности,
+    поэтому фильтр должен стоять после OrderingFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        index = INDEXES.get(getattr(view, 'search_index', None))
+        # Архивных записей (BookingRecord) в индексе нет - для них поиск по search_fields
+        if index is None or not enabled() or not index.covers(queryset.model):
+            return super().filter_queryset(request, queryset, view)
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        # Представление фильтрует queryset несколько раз за запрос (валидаторы, список) -
+        # обращение к индексу выполняется один раз
+        found = getattr(request, '_search_results', None)
+        if found is None:
+            found = request._search_results = {}
+        if (index.name, query) not in found:
+            found[index.name, query] = index.search(query)
+        queryset = index.filter(queryset, query, found[index.name, query])
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.order_by('search_rank', *queryset.query.order_by)
@@ -1,8 +1,33 @@
 from rest_framework import serializers
-from .models import Booking, Master, Service, User, Review
+from rest_framework.exceptions import ParseError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from .models import Booking, Master, MasterRating, Service, User, Review
+from .reservations import BookingConflict, check_alignment, check_availability
 from django.utils import timezone
 
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связь по первичному ключу, которая сначала ищет объект среди заранее
+    загруженных (context['preloaded'] = {модель: {pk: объект}}), чтобы при
+    массовой валидации не делать запрос на каждый элемент.
+    """
+    
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in preloaded:
+            self.fail('does_not_exist', pk_value=data)
+        return preloaded[pk]
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели User"""
     
@@ -17,7 +42,7 @@ class ServiceSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Service
-        fields = ['service_id', 'title', 'description', 'price', 'created_at', 'updated_at']
+        fields = ['service_id', 'title', 'description', 'price', 'duration_minutes', 'created_at', 'updated_at']
         read_only_fields = ['service_id', 'created_at', 'updated_at']
 
 
@@ -34,8 +59,95 @@ class MasterSerializer(serializers.ModelSerializer):
         read_only_fields = ['master_id', 'created_at', 'updated_at']
 
 
+class SparseFieldset:
+    """
+    Выборка полей из параметров запроса: ?fields=a,b,detail.x ограничивает
+    поля ответа (в том числе вложенные), ?expand=user,service включает вложенные
+    представления связей. Без обоих параметров ответ полный.
+    """
+    
+    def __init__(self, serializer_class, fields=None, expand=()):
+        self.serializer_class = serializer_class
+        self.declared = serializer_class().fields
+        expandable = serializer_class.expandable_fields
+        details = {detail: relation for relation, detail in expandable.items()}
+        self.fields = None
+        self.nested = {}
+        self.expand = set()
+        for name in expand:
+            if name not in expandable:
+                raise ParseError(f'Unknown expand value: {name}')
+            self.expand.add(name)
+        if fields is not None:
+            self.fields = set()
+            for name in fields:
+                top, _, nested = name.partition('.')
+                if top not in self.declared or (nested and top not in details):
+                    raise ParseError(f'Unknown field: {name}')
+                self.fields.add(top)
+                if top in details:
+                    self.expand.add(details[top])
+                if nested:
+                    if nested not in self.declared[top].fields:
+                        raise ParseError(f'Unknown field: {name}')
+                    self.nested.setdefault(top, set()).add(nested)
+    
+    @classmethod
+    def from_params(cls, serializer_class, params):
+        """SparseFieldset из ?fields= и ?expand= или None, если их нет"""
+        fields, expand = params.get('fields'), params.get('expand')
+        if fields is None and expand is None:
+            return None
+        split = lambda value: [part.strip() for part in value.split(',') if part.strip()]  # noqa: E731
+        return cls(serializer_class, split(fields) if fields is not None else None, split(expand or ''))
+    
+    def includes(self, name):
+        """Выводится ли поле верхнего уровня"""
+        expandable = self.serializer_class.expandable_fields
+        if name in expandable.values():
+            return any(expandable[relation] == name for relation in self.expand)
+        return self.fields is None or name in self.fields
+    
+    def columns(self):
+        """Аргументы для queryset.only(): только колонки, нужные выбранным полям"""
+        model = self.serializer_class.Meta.model
+        columns = {model._meta.pk.name}
+        for name, field in self.declared.items():
+            if not self.includes(name):
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                source = field.source
+                nested_model = field.Meta.model
+                wanted = self.nested.get(name)
+                columns.add(f'{source}__{nested_model._meta.pk.name}')
+                for nested_name, nested_field in field.fields.items():
+                    if wanted is None or nested_name in wanted:
+                        column = _model_column(nested_model, nested_field)
+                        if column:
+                            columns.add(f'{source}__{column}')
+                continue
+            column = _model_column(model, field)
+            if column:
+                columns.add(column)
+        return columns
+
+
+def _model_column(model, field):
+    """Поле модели, из которого берётся значение поля сериализатора (или None)"""
+    source = field.source.split('.')[0]
+    if source.startswith('get_') and source.endswith('_display'):
+        source = source[len('get_'):-len('_display')]
+    try:
+        return model._meta.get_field(source).name
+    except FieldDoesNotExist:
+        return None
+
+
 class BookingSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Booking с валидацией"""
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+    # Вложенные представления связей, выводимые по ?expand=
+    expandable_fields = {'user': 'user_detail', 'master': 'master_detail', 'service': 'service_detail'}
     user_detail = UserSerializer(source='user', read_only=True)
     master_detail = MasterSerializer(source='master', read_only=True)
     service_detail = ServiceSerializer(source='service', read_only=True)
@@ -45,24 +157,75 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = [
             'booking_id', 'user', 'user_detail', 'master', 'master_detail',
-            'service', 'service_detail', 'appointment_datetime', 'status',
-            'status_display', 'created_at'
+            'service', 'service_detail', 'appointment_datetime', 'end_datetime', 'status',
+            'status_display', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['booking_id', 'created_at']
+        read_only_fields = ['booking_id', 'end_datetime', 'created_at', 'updated_at']
+    
+    def get_fields(self):
+        """Поля с учётом SparseFieldset из контекста (context['sparse'])"""
+        fields = super().get_fields()
+        sparse = self.context.get('sparse')
+        if sparse is None:
+            return fields
+        for name in list(fields):
+            if not sparse.includes(name):
+                del fields[name]
+        for name, wanted in sparse.nested.items():
+            nested = fields[name]
+            for nested_name in list(nested.fields):
+                if nested_name not in wanted:
+                    del nested.fields[nested_name]
+        return fields
     
     def validate_appointment_datetime(self, value):
-        """Валидация: дата записи должна быть в будущем"""
+        """Валидация: дата записи должна быть в будущем и на сетке расписания"""
         now = timezone.now()
         # Сравниваем с учетом timezone
         if value <= now:
             raise serializers.ValidationError(
                 "Дата и время записи должны быть в будущем. Выберите дату позже текущего момента."
             )
+        try:
+            check_alignment(value)
+        except ValidationError as error:
+            raise serializers.ValidationError(error.messages)
         return value
+    
+    def validate(self, attrs):
+        """Валидация: время мастера не должно быть занято другой записью"""
+        if self.context.get('bulk'):
+            # При массовом создании занятость проверяется сразу для всей пачки (salon.bulk)
+            return attrs
+        booking = Booking(pk=self.instance.pk if self.instance else None)
+        for field in ('master', 'service', 'appointment_datetime', 'status'):
+            value = attrs.get(field, getattr(self.instance, field, None))
+            if value is not None:
+                setattr(booking, field, value)
+        if booking.master_id and booking.service_id and booking.appointment_datetime:
+            booking.end_datetime = booking.compute_end_datetime()
+            try:
+                check_availability(booking)
+            except BookingConflict as error:
+                raise serializers.ValidationError(error.messages)
+        return attrs
+    
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except BookingConflict as error:
+            # Время заняли параллельным запросом уже после валидации
+            raise serializers.ValidationError(error.messages)
+    
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except BookingConflict as error:
+            raise serializers.ValidationError(error.messages)
 
 
 class ReviewSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели Review (без валидации, так как не используется на сайте)"""
+    """Сериализатор для модели Review"""
     user_detail = UserSerializer(source='user', read_only=True)
     master_detail = MasterSerializer(source='master', read_only=True)
     
@@ -72,4 +235,30 @@ class ReviewSerializer(serializers.ModelSerializer):
             'review_id', 'user', 'user_detail', 'master', 'master_detail',
             'rating', 'comment', 'created_at'
         ]
-        read_only_fields = ['review_id', 'created_at']
+        # Автор отзыва - пользователь салона из запроса (ReviewViewSet.perform_create)
+        read_only_fields = ['review_id', 'user', 'created_at']
+    
+    def validate_rating(self, value):
+        """Оценка от 1 до 5 (по этим значениям ведётся распределение в рейтинге мастера)"""
+        if not 1 <= value <= 5:
+            raise serializers.ValidationError("Оценка должна быть от 1 до 5")
+        return value
+
+
+class MasterRatingSerializer(serializers.ModelSerializer):
+    """Рейтинг мастера: количество отзывов, средняя оценка и распределение оценок"""
+    
+    class Meta:
+        model = MasterRating
+        fields = [
+            'reviews_count', 'average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class RatedMasterSerializer(MasterSerializer):
+    """Мастер с рейтингом по отзывам (для /api/masters/)"""
+    rating = MasterRatingSerializer(read_only=True)
+    
+    class Meta(MasterSerializer.Meta):
+        fields = MasterSerializer.Meta.fields + ['rating']
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.db import transaction
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from .models import Booking, Master, ChangeHistory
+from .models import ArchivedBooking, Booking, Master, Service, User, ChangeHistory, WorkingHours, Review, ExportJob
+from .audit import record
+from .availability import bump_schedule_versions
+from .counters import counter_key, record_booking_change, record_booking_changes
+from .export_jobs import export_path
+from .response_cache import bump_generation_on_commit
+from .ratings import record_review_changes, review_key
+from .read_model import refresh_items, remove_items, sync_related
+from .rollups import mark_days_dirty, mark_service_days_dirty
+from .search import BOOKING_INDEX, MASTER_INDEX, SERVICE_INDEX
 
 
 def save_change_history(instance, action, changed_by='', old_values=None):
-    """Функция для сохранения истории изменений"""
+    """Функция для сохранения истории изменений (запись откладывается до фиксации транзакции)"""
     content_type = ContentType.objects.get_for_model(instance)
     changes = {}
     
@@ -18,29 +30,56 @@ def save_change_history(instance, action, changed_by='', old_values=None):
                     'new': str(new_value)
                 }
     
-    ChangeHistory.objects.create(
+    # Запись попадёт в журнал одной пачкой после фиксации транзакции
+    record(ChangeHistory(
         content_type=content_type,
         object_id=instance.pk,
         action=action,
         changed_by=changed_by,
         changes=changes
-    )
+    ))
+
+
+def invalidate_availability(master_ids, deleted=False):
+    """Индексы свободного времени устаревают вместе с фиксацией транзакции (версия расписания в БД)"""
+    bump_schedule_versions(master_ids, create=not deleted)
+
+
+@receiver(pre_save, sender=User)
+def link_new_salon_user(sender, instance, **kwargs):
+    """
+    Новый пользователь салона без учётной записи (из админки, импорта)
+    связывается с учётной записью с тем же email, у которой связи ещё нет,
+    как пользователь, созданный при регистрации
+    """
+    if instance._state.adding and instance.auth_user_id is None and instance.email:
+        instance.auth_user = get_user_model().objects.filter(
+            email__iexact=instance.email, salon_user__isnull=True
+        ).order_by('pk').first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def link_new_auth_user(sender, instance, created, **kwargs):
+    """
+    Новая учётная запись (из админки, createsuperuser) связывается с самым ранним
+    пользователем салона с тем же email без учётной записи - по тому же правилу,
+    что и в миграции 0009
+    """
+    if not created or not instance.email:
+        return
+    salon_user = User.objects.filter(
+        email__iexact=instance.email, auth_user__isnull=True
+    ).order_by('created_at', 'user_id').first()
+    if salon_user is not None:
+        salon_user.auth_user = instance
+        salon_user.save(update_fields=['auth_user', 'updated_at'])
 
 
 @receiver(pre_save, sender=Booking)
 def booking_pre_save(sender, instance, **kwargs):
-    """Сохраняем старые значения перед обновлением"""
+    """Сохраняем старые значения перед обновлением (из снимка, без запроса к БД)"""
     if instance.pk:
-        try:
-            old_instance = Booking.objects.get(pk=instance.pk)
-            instance._old_values = {
-                'status': old_instance.status,
-                'appointment_datetime': old_instance.appointment_datetime,
-                'master_id': old_instance.master_id,
-                'service_id': old_instance.service_id,
-            }
-        except Booking.DoesNotExist:
-            instance._old_values = {}
+        instance._old_values = instance.get_original_values()
 
 
 @receiver(post_save, sender=Booking)
@@ -49,27 +88,73 @@ def booking_post_save(sender, instance, created, **kwargs):
     action = 'created' if created else 'updated'
     old_values = getattr(instance, '_old_values', None)
     save_change_history(instance, action, old_values=old_values)
+    
+    # Счётчики статистики меняются в той же транзакции, что и запись
+    old_key = None
+    if not created and old_values:
+        old_key = counter_key(old_values['appointment_datetime'], old_values['status'])
+    new_key = counter_key(instance.appointment_datetime, instance.status)
+    record_booking_change(old_key, new_key)
+    mark_days_dirty({new_key[0], old_key[0]} if old_key else {new_key[0]})
+    
+    master_ids = {instance.master_id}
+    if old_values and old_values.get('master_id'):
+        master_ids.add(old_values['master_id'])
+    invalidate_availability(master_ids)
+
+
+def bookings_bulk_created(bookings, changed_by=''):
+    """
+    То же, что booking_post_save для созданных записей, но для пачки,
+    вставленной через bulk_create (сигналы при этом не отправляются)
+    """
+    if not bookings:
+        return
+    Booking.history.bulk_history_create(bookings)
+    for booking in bookings:
+        save_change_history(booking, 'created', changed_by=changed_by)
+    keys = [counter_key(booking.appointment_datetime, booking.status) for booking in bookings]
+    record_booking_changes((None, key) for key in keys)
+    mark_days_dirty({day for day, _ in keys})
+    invalidate_availability({booking.master_id for booking in bookings})
+    bump_generation_on_commit(Booking)
+    BOOKING_INDEX.reindex(Booking.objects.filter(pk__in=[booking.pk for booking in bookings]))
+    refresh_items(booking.pk for booking in bookings)
 
 
 @receiver(post_delete, sender=Booking)
 def booking_post_delete(sender, instance, **kwargs):
     """Сохраняем историю изменений после удаления записи"""
     save_change_history(instance, 'deleted')
+    old_key = counter_key(instance.appointment_datetime, instance.status)
+    record_booking_change(old_key, None)
+    mark_days_dirty({old_key[0]})
+    invalidate_availability({instance.master_id}, deleted=True)
+
+
+@receiver(post_delete, sender=ArchivedBooking)
+def archived_booking_post_delete(sender, instance, **kwargs):
+    """
+    Архивная запись, удалённая вместе с клиентом, мастером или услугой (каскадом),
+    вычитается из счётчиков и дневных агрегатов в той же транзакции
+    """
+    old_key = counter_key(instance.appointment_datetime, instance.status)
+    record_booking_change(old_key, None)
+    mark_days_dirty({old_key[0]})
+
+
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+def working_hours_changed(sender, instance, **kwargs):
+    """Изменение расписания мастера сбрасывает его индекс свободного времени"""
+    invalidate_availability({instance.master_id}, deleted='created' not in kwargs)
 
 
 @receiver(pre_save, sender=Master)
 def master_pre_save(sender, instance, **kwargs):
-    """Сохраняем старые значения перед обновлением"""
+    """Сохраняем старые значения перед обновлением (из снимка, без запроса к БД)"""
     if instance.pk:
-        try:
-            old_instance = Master.objects.get(pk=instance.pk)
-            instance._old_values = {
-                'full_name': old_instance.full_name,
-                'specialization': old_instance.specialization,
-                'experience_years': old_instance.experience_years,
-            }
-        except Master.DoesNotExist:
-            instance._old_values = {}
+        instance._old_values = instance.get_original_values()
 
 
 @receiver(post_save, sender=Master)
@@ -79,3 +164,114 @@ def master_post_save(sender, instance, created, **kwargs):
     old_values = getattr(instance, '_old_values', None)
     save_change_history(instance, action, old_values=old_values)
 
+
+@receiver(pre_save, sender=Review)
+def review_pre_save(sender, instance, **kwargs):
+    """Сохраняем прежние мастера и оценку (из снимка, без запроса к БД)"""
+    if instance.pk:
+        instance._old_values = instance.get_original_values()
+
+
+@receiver(post_save, sender=Review)
+def review_post_save(sender, instance, created, **kwargs):
+    """Рейтинг мастера меняется в той же транзакции, что и отзыв"""
+    old = None
+    old_values = getattr(instance, '_old_values', None)
+    if not created and old_values:
+        old = review_key(old_values['master_id'], old_values['rating'])
+    record_review_changes([(old, review_key(instance.master_id, instance.rating))])
+
+
+@receiver(post_delete, sender=Review)
+def review_post_delete(sender, instance, **kwargs):
+    """Удалённый отзыв вычитается из рейтинга мастера"""
+    record_review_changes([(review_key(instance.master_id, instance.rating), None)])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=ArchivedBooking)
+@receiver(post_save, sender=Master)
+@receiver(post_delete, sender=Master)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_response_cache(sender, **kwargs):
+    """Закэшированные ответы API и списки админки, зависящие от модели, становятся устаревшими"""
+    bump_generation_on_commit(sender)
+
+
+@receiver(post_save, sender=Booking)
+def index_booking(sender, instance, **kwargs):
+    """Документ записи в поисковом индексе обновляется в той же транзакции"""
+    BOOKING_INDEX.reindex(Booking.objects.filter(pk=instance.pk))
+
+
+# Модель: (свой поисковый индекс, поля, входящие в документ записи, связь записи с моделью)
+RELATED_SEARCH_DOCUMENTS = {
+    Master: (MASTER_INDEX, ('full_name',), 'master'),
+    Service: (SERVICE_INDEX, ('title',), 'service'),
+    User: (None, ('name', 'email'), 'user'),
+}
+
+
+@receiver(post_save, sender=Master)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=User)
+def index_related(sender, instance, created, **kwargs):
+    """
+    Переиндексация мастера или услуги, а при смене имени клиента, мастера или
+    названия услуги - и их записей (снимок полей ещё хранит прежние значения)
+    """
+    own_index, booking_fields, relation = RELATED_SEARCH_DOCUMENTS[sender]
+    if own_index is not None and (created or instance.has_changed(*own_index.fields)):
+        own_index.reindex(sender.objects.filter(pk=instance.pk))
+    if not created and instance.has_changed(*booking_fields):
+        BOOKING_INDEX.reindex(Booking.objects.filter(**{relation: instance.pk}))
+
+
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Master)
+@receiver(post_delete, sender=Service)
+def unindex(sender, instance, **kwargs):
+    """Удалённый объект убирается из поискового индекса"""
+    index = {Booking: BOOKING_INDEX, Master: MASTER_INDEX, Service: SERVICE_INDEX}[sender]
+    index.remove([instance.pk])
+
+
+@receiver(post_save, sender=Booking)
+def sync_booking_list_item(sender, instance, **kwargs):
+    """Строка записи в плоской таблице списков переписывается в той же транзакции"""
+    refresh_items([instance.pk])
+
+
+@receiver(post_delete, sender=Booking)
+def remove_booking_list_item(sender, instance, **kwargs):
+    remove_items([instance.pk])
+
+
+@receiver(post_save, sender=Master)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=User)
+def sync_related_list_items(sender, instance, created, **kwargs):
+    """Переименование клиента, мастера или услуги обновляет строки их записей"""
+    if not created:
+        sync_related(instance)
+
+
+@receiver(post_save, sender=Service)
+def service_price_changed(sender, instance, created, **kwargs):
+    """Смена цены услуги меняет выручку в дневных агрегатах её записей"""
+    if not created and instance.has_changed('price'):
+        mark_service_days_dirty(instance.pk)
+
+
+@receiver(post_delete, sender=ExportJob)
+def remove_export_file(sender, instance, **kwargs):
+    """Файл удалённой выгрузки удаляется после фиксации транзакции"""
+    if instance.file_name:
+        path = export_path(instance)
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
@@ -1,3 +1,1667 @@
-from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+import threading
+from datetime import time, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User as AuthUser
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+from .admin import UserResource
+from .archive import TABLES, ArchivedTable
+from .availability import AvailabilityIndex, from_timestamp
+from .booking_archive import archive_bookings
+from .booking_import import import_bookings, read_rows
+from .counters import actual_counters, compute_booking_statistics, reconcile_counters
+from .export_jobs import create_job, run_job
+from .models import (
+    ArchivedBooking, Booking, BookingCounter, BookingDailyRollup, BookingListItem, BookingRecord, ChangeHistory,
+    ExportJob, Master, MasterRating, MasterService, MasterTimeSlot, Review, RollupDirtyDay, Service, User, WorkingHours,
+)
+from .pagination import BookingPagination, keyset_paginate
+from .ratings import RATING_VALUES, actual_ratings
+from .read_model import check
+from .rollups import refresh_dirty_days
+from .search import match_expression, stem
+from .signals import bookings_bulk_created
+from .reservations import CONFLICT_MESSAGE, BookingConflict
+from .transitions import TransitionError, transition_bookings
+
+
+def selects_from(queries, table):
+    """SELECT-запросы к таблице из перехваченных запросов"""
+    return [
+        query['sql'] for query in queries
+        if query['sql'].lstrip().upper().startswith('SELECT') and f'FROM "{table}"' in query['sql']
+    ]
+
+
+class FieldTrackingTests(TestCase):
+    """Отслеживание изменений полей без повторного чтения строки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            cls.user = User.objects.create(name='Клиент', email='client@example.com')
+            cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            cls.other_master = Master.objects.create(full_name='Другой', specialization='Стилист', experience_years=5)
+            cls.appointment = timezone.now().replace(microsecond=0) + timedelta(days=1)
+            cls.booking = Booking.objects.create(
+                user=cls.user, master=cls.master, service=cls.service, appointment_datetime=cls.appointment
+            )
+
+    def save(self, instance, **kwargs):
+        """Сохранение с выполнением on_commit-обработчиков (запись журнала)"""
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save(**kwargs)
+
+    def last_history(self, instance):
+        return ChangeHistory.objects.filter(
+            content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk
+        ).order_by('-pk').first()
+
+    def test_booking_save_does_not_reselect_row(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        booking.status = 'confirmed'
+        with CaptureQueriesContext(connection) as ctx:
+            booking.save()
+        self.assertEqual(selects_from(ctx.captured_queries, Booking._meta.db_table), [])
+
+    def test_master_save_does_not_reselect_row(self):
+        master = Master.objects.get(pk=self.master.pk)
+        master.experience_years = 4
+        with CaptureQueriesContext(connection) as ctx:
+            master.save()
+        self.assertEqual(selects_from(ctx.captured_queries, Master._meta.db_table), [])
+
+    def test_booking_history_diff(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        booking.status = 'confirmed'
+        booking.master = self.other_master
+        self.save(booking)
+        history = self.last_history(booking)
+        self.assertEqual(history.action, 'updated')
+        self.assertEqual(history.changes, {
+            'status': {'old': 'pending', 'new': 'confirmed'},
+            'master_id': {'old': str(self.master.pk), 'new': str(self.other_master.pk)},
+        })
+
+        # Следующее сохранение сравнивается с последним сохранённым состоянием
+        booking.status = 'completed'
+        self.save(booking)
+        self.assertEqual(self.last_history(booking).changes, {
+            'status': {'old': 'confirmed', 'new': 'completed'},
+        })
+
+    def test_master_history_diff(self):
+        master = Master.objects.get(pk=self.master.pk)
+        master.full_name = 'Новое имя'
+        self.save(master)
+        self.assertEqual(self.last_history(master).changes, {
+            'full_name': {'old': 'Мастер', 'new': 'Новое имя'},
+        })
+
+    def test_update_fields_keeps_unsaved_changes_tracked(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        booking.status = 'confirmed'
+        booking.master = self.other_master
+        self.save(booking, update_fields=['status'])
+        self.save(booking)
+        self.assertEqual(self.last_history(booking).changes, {
+            'master_id': {'old': str(self.master.pk), 'new': str(self.other_master.pk)},
+        })
+
+    def test_instance_not_loaded_from_db_falls_back_to_query(self):
+        booking = Booking(
+            pk=self.booking.pk, user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.appointment, end_datetime=self.booking.end_datetime,
+            created_at=self.booking.created_at, status='cancelled',
+        )
+        self.save(booking)
+        self.assertEqual(self.last_history(booking).changes, {
+            'status': {'old': 'pending', 'new': 'cancelled'},
+        })
+
+    def test_deferred_fields_are_read_on_save(self):
+        booking = Booking.objects.only('booking_id', 'status').get(pk=self.booking.pk)
+        booking.status = 'confirmed'
+        self.save(booking)
+        self.assertEqual(self.last_history(booking).changes, {
+            'status': {'old': 'pending', 'new': 'confirmed'},
+        })
+
+
+class AuditWriterTests(TestCase):
+    """Журнал изменений пишется одной пачкой после фиксации транзакции"""
+
+    def setUp(self):
+        # Журнал данных теста пишется сразу, дальше буфер уровня транзакции пуст
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            self.user = User.objects.create(name='Клиент', email='client@example.com')
+            self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def create_bookings(self, count, offset=0):
+        for i in range(offset, offset + count):
+            Booking.objects.create(
+                user=self.user, master=self.master, service=self.service,
+                appointment_datetime=self.start + timedelta(hours=i),
+            )
+
+    def test_history_written_in_one_batch_on_commit(self):
+        history_table = ChangeHistory._meta.db_table
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                self.create_bookings(20)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith(f'INSERT INTO "{history_table}"')]
+        self.assertEqual(inserts, [])
+        booking_type = ContentType.objects.get_for_model(Booking)
+        self.assertFalse(ChangeHistory.objects.filter(content_type=booking_type).exists())
+
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith(f'INSERT INTO "{history_table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ChangeHistory.objects.filter(content_type=booking_type, action='created').count(), 20)
+
+    def test_rolled_back_savepoint_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_bookings(1)
+            try:
+                with transaction.atomic():
+                    self.create_bookings(1, offset=1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        booking_type = ContentType.objects.get_for_model(Booking)
+        self.assertEqual(ChangeHistory.objects.filter(content_type=booking_type).count(), 1)
+
+    def test_failed_booking_save_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_bookings(1)
+            with self.assertRaises(BookingConflict):
+                self.create_bookings(1)
+        booking_type = ContentType.objects.get_for_model(Booking)
+        self.assertEqual(ChangeHistory.objects.filter(content_type=booking_type).count(), 1)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов страницы списка в админке не зависит от числа строк"""
+
+    # Запросов на страницу: сессия и пользователь, COUNT(*) пагинатора, строки,
+    # предзагрузки, варианты фильтров и date_hierarchy
+    QUERY_BUDGETS = {
+        'salon_service': 9,
+        'salon_master': 9,
+        'salon_masterservice': 7,
+        'salon_booking': 9,
+        'salon_review': 9,
+        'salon_changehistory': 10,
+    }
+
+    def setUp(self):
+        self.admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.created = 0
+
+    def populate(self, count):
+        """count новых клиентов, мастеров, услуг, записей и отзывов со связями между ними"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                i = self.created
+                self.created += 1
+                user = User.objects.create(name=f'Клиент {i}', email=f'client{i}@example.com')
+                master = Master.objects.create(full_name=f'Мастер {i}', specialization='Стилист', experience_years=i)
+                service = Service.objects.create(title=f'Услуга {i}', description='', price=1000 + i)
+                MasterService.objects.create(master=master, service=service)
+                Booking.objects.create(
+                    user=user, master=master, service=service, appointment_datetime=self.start + timedelta(hours=i)
+                )
+                Review.objects.create(user=user, master=master, rating=i % 5 + 1, comment='Отзыв')
+
+    def changelist_queries(self, name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'admin:{name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_query_budget(self):
+        self.populate(5)
+        few = {name: self.changelist_queries(name) for name in self.QUERY_BUDGETS}
+        self.populate(45)
+        for name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(changelist=name):
+                queries = self.changelist_queries(name)
+                self.assertEqual(queries, few[name])
+                self.assertLessEqual(queries, budget)
+
+    def test_change_history_shows_deleted_objects(self):
+        self.populate(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(master__full_name='Мастер 1').delete()
+        response = self.client.get(reverse('admin:salon_changehistory_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Запись #2 (удалён)')
+        self.assertContains(response, 'Запись Клиент 0 к Мастер 0')
+
+    def test_annotated_counts_are_sortable(self):
+        self.populate(3)
+        master = Master.objects.get(full_name='Мастер 0')
+        Booking.objects.create(
+            user=User.objects.first(), master=master, service=Service.objects.first(),
+            appointment_datetime=self.start + timedelta(days=1),
+        )
+        # Сортировка по колонке "Записи" (восьмая в list_display)
+        response = self.client.get(reverse('admin:salon_master_changelist'), {'o': '-8'})
+        self.assertEqual(response.status_code, 200)
+        masters = list(response.context['cl'].result_list)
+        self.assertEqual(masters[0], master)
+        self.assertEqual(masters[0].bookings_total, 2)
+
+
+class CachedChangelistTests(TestCase):
+    """Количество строк, варианты фильтров и даты списка записей - из кэша и счётчиков"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            self.user = User.objects.create(name='Клиент', email='client@example.com')
+            self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            for i in range(3):
+                self.book(i, status='confirmed' if i else 'pending')
+
+    def book(self, hours, **kwargs):
+        return Booking.objects.create(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.start + timedelta(hours=2 * hours), **kwargs
+        )
+
+    def changelist(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:salon_booking_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl'], queries
+
+    def counts(self, queries, table):
+        return [query for query in queries if 'COUNT(' in query['sql'] and f'FROM "{table}"' in query['sql']]
+
+    def test_repeated_page_reuses_counts_filters_and_dates(self):
+        cl, first = self.changelist()
+        self.assertEqual(cl.result_count, 3)
+        cl, second = self.changelist()
+        self.assertEqual(cl.result_count, 3)
+        self.assertEqual(self.counts(second, Booking._meta.db_table), [])
+        # Варианты фильтров по мастеру и услуге и даты date_hierarchy не читаются повторно
+        self.assertEqual(selects_from(second, Master._meta.db_table), [])
+        self.assertEqual(selects_from(second, Service._meta.db_table), [])
+        self.assertLess(len(second), len(first))
+
+    def test_write_invalidates_cached_count(self):
+        self.changelist()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(5)
+        cl, queries = self.changelist()
+        self.assertEqual(cl.result_count, 4)
+        self.assertEqual(len(self.counts(queries, Booking._meta.db_table)), 1)
+
+    def test_archive_list_counts_from_counters(self):
+        cl, queries = self.changelist({'archive': 'include', 'status__exact': 'confirmed'})
+        self.assertEqual(cl.result_count, 2)
+        sums = [query for query in queries if f'SUM("{BookingCounter._meta.db_table}"."count")' in query['sql']]
+        self.assertEqual(len(sums), 1)
+        self.assertEqual(self.counts(queries, BookingRecord._meta.db_table), [])
+        # Поиск агрегаты не учитывают - количество считается по записям
+        cl, _ = self.changelist({'archive': 'include', 'q': 'Клиент'})
+        self.assertEqual(cl.result_count, 3)
+
+
+class BookingListItemTests(TestCase):
+    """Плоская таблица списков записей следует за записями и их связями"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        cls.bookings = [
+            Booking.objects.create(
+                user=cls.user, master=cls.master, service=cls.service, appointment_datetime=start + timedelta(hours=2 * i)
+            )
+            for i in range(3)
+        ]
+
+    def assertConsistent(self):
+        self.assertEqual(check(), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_renames_are_copied(self):
+        self.user.name = 'Клиентка'
+        self.user.save()
+        self.master.full_name = 'Новый мастер'
+        self.master.save()
+        self.service.price = 1500
+        self.service.save()
+        rows = set(BookingListItem.objects.values_list('user_name', 'master_name', 'service_price'))
+        self.assertEqual(rows, {('Клиентка', 'Новый мастер', 1500)})
+        self.assertConsistent()
+
+    def test_status_changes_and_deletes(self):
+        transition_bookings(Booking.objects.filter(pk=self.bookings[0].pk), 'confirmed')
+        self.bookings[1].delete()
+        self.assertEqual(BookingListItem.objects.get(pk=self.bookings[0].pk).status, 'confirmed')
+        self.assertFalse(BookingListItem.objects.filter(pk=self.bookings[1].pk).exists())
+        self.assertConsistent()
+
+    def test_check_finds_updates_bypassing_signals(self):
+        Booking.objects.filter(pk=self.bookings[2].pk).update(status='cancelled')
+        self.assertEqual(check()['stale'], [self.bookings[2].pk])
+
+    def test_list_views_do_not_join(self):
+        admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        for url in (reverse('salon:booking_list'), reverse('salon:admin_pending_bookings')):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+                self.assertContains(response, 'Клиент')
+                self.assertEqual([query['sql'] for query in ctx.captured_queries if ' JOIN ' in query['sql']], [])
+
+    def api_list(self, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('booking-list'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], [query['sql'] for query in ctx.captured_queries]
+
+    def test_api_default_list_query_count(self):
+        # Полный ответ выводит поля связей, которых нет в плоской таблице: строки
+        # страницы читаются одним запросом со связями, подсчёт - без JOIN
+        results, queries = self.api_list()
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(queries), 3)
+        count = [sql for sql in queries if 'COUNT(*)' in sql]
+        self.assertEqual(len(count), 1)
+        self.assertNotIn(' JOIN ', count[0])
+
+        start = self.bookings[-1].appointment_datetime + timedelta(days=1)
+        for i in range(5):
+            Booking.objects.create(
+                user=self.user, master=self.master, service=self.service, appointment_datetime=start + timedelta(hours=2 * i)
+            )
+        results, queries = self.api_list()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results[0]['user_detail']['name'], 'Клиент')
+        self.assertEqual(len(queries), 3)
+
+    def test_api_sparse_list_reads_flat_table(self):
+        results, queries = self.api_list({'fields': 'booking_id,user_detail.name,service_detail.title'})
+        self.assertEqual(results[0]['service_detail'], {'title': 'Стрижка'})
+        self.assertEqual(selects_from([{'sql': sql} for sql in queries], Booking._meta.db_table), [])
+        self.assertEqual([sql for sql in queries if ' JOIN ' in sql], [])
+
+
+class AvailabilityIndexTests(TestCase):
+    """Индекс свободного времени сверяет версию расписания мастера с БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000, duration_minutes=60)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        cls.day = timezone.localdate() + timedelta(days=2)
+
+    def test_booking_from_other_process_invalidates_index(self):
+        index = AvailabilityIndex()
+        slots = index.free_slots(self.master.pk, self.day, 60)
+        start = from_timestamp(slots[0])
+        Booking.objects.create(user=self.user, master=self.master, service=self.service, appointment_datetime=start)
+        # Кэш процесса не участвует в проверке: версия читается из БД
+        cache.clear()
+        self.assertNotIn(slots[0], index.free_slots(self.master.pk, self.day, 60))
+
+    def test_deleted_booking_frees_time(self):
+        index = AvailabilityIndex()
+        start = from_timestamp(index.free_slots(self.master.pk, self.day, 60)[0])
+        booking = Booking.objects.create(
+            user=self.user, master=self.master, service=self.service, appointment_datetime=start
+        )
+        self.assertNotIn(int(start.timestamp()), index.free_slots(self.master.pk, self.day, 60))
+        booking.delete()
+        self.assertIn(int(start.timestamp()), index.free_slots(self.master.pk, self.day, 60))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Параллельные записи к одному мастеру на одно время: ровно одна проходит"""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Стрижка', description='', price=1000, duration_minutes=60)
+        self.user = User.objects.create(name='Клиент', email='client@example.com')
+        self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def book_concurrently(self, starts):
+        barrier = threading.Barrier(len(starts))
+        outcomes = []
+
+        def worker(start):
+            try:
+                barrier.wait()
+                Booking.objects.create(
+                    user_id=self.user.pk, master_id=self.master.pk, service_id=self.service.pk,
+                    appointment_datetime=start,
+                )
+                outcomes.append('created')
+            except BookingConflict:
+                outcomes.append('conflict')
+            except Exception as error:
+                outcomes.append(repr(error))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(start,)) for start in starts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def assertNoOverlaps(self):
+        intervals = sorted(Booking.objects.filter(master=self.master).values_list('appointment_datetime', 'end_datetime'))
+        for (_, previous_end), (start, _) in zip(intervals, intervals[1:]):
+            self.assertLessEqual(previous_end, start)
+
+    def test_same_time_has_one_winner(self):
+        outcomes = self.book_concurrently([self.start] * self.THREADS)
+        self.assertEqual(sorted(outcomes), ['conflict'] * (self.THREADS - 1) + ['created'])
+        self.assertEqual(Booking.objects.filter(master=self.master).count(), 1)
+        self.assertNoOverlaps()
+
+    def test_overlapping_times_do_not_overlap(self):
+        # Сдвиг на шаг сетки при часовой услуге: соседние варианты пересекаются
+        starts = [self.start + timedelta(minutes=15 * (i % 4)) for i in range(self.THREADS)]
+        outcomes = self.book_concurrently(starts)
+        self.assertEqual(outcomes.count('created') + outcomes.count('conflict'), self.THREADS, outcomes)
+        self.assertEqual(outcomes.count('created'), 1)
+        self.assertNoOverlaps()
+
+
+class SlotGridTests(TestCase):
+    """Начало записи на сетке: соседние записи не конфликтуют"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000, duration_minutes=45)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def test_off_grid_start_is_rejected(self):
+        booking = Booking(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.start + timedelta(minutes=10),
+        )
+        with self.assertRaises(ValidationError) as raised:
+            booking.full_clean()
+        self.assertIn('appointment_datetime', raised.exception.message_dict)
+
+    def test_booking_right_after_partial_cell_is_allowed(self):
+        # 45 минут: последняя ячейка занята частично, следующее начало на сетке - через час
+        Booking.objects.create(user=self.user, master=self.master, service=self.service, appointment_datetime=self.start)
+        following = Booking(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.start + timedelta(minutes=45),
+        )
+        following.full_clean()
+        following.save()
+
+    def test_every_offered_slot_can_be_booked_when_day_opens_off_grid(self):
+        day = self.start.date() + timedelta(days=1)
+        WorkingHours.objects.create(
+            master=self.master, weekday=day.weekday(), start_time=time(9, 10), end_time=time(12, 10),
+        )
+        index = AvailabilityIndex()
+        booked = []
+        while slots := index.free_slots(self.master.pk, day, self.service.duration_minutes):
+            booking = Booking(
+                user=self.user, master=self.master, service=self.service,
+                appointment_datetime=from_timestamp(slots[0]),
+            )
+            booking.full_clean()
+            booking.save()
+            booked.append(booking.appointment_datetime.time())
+        # Первый слот - ближайшая точка сетки после открытия, последний кончается до закрытия
+        self.assertEqual(booked, [time(9, 15), time(10, 0), time(10, 45)])
+
+
+class LateBookingConflictTests(TestCase):
+    """Время, занятое уже после проверки формы, показывается ошибкой, а не ответом 500"""
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        self.user = User.objects.create(name='Клиент', email='client@example.com')
+        self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        self.start = timezone.localtime().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        Booking.objects.create(user=self.user, master=self.master, service=self.service, appointment_datetime=self.start)
+        self.client.force_login(AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        # Параллельная запись появляется между проверкой формы и сохранением
+        patcher = mock.patch('salon.reservations.check_availability')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_data(self):
+        return {'user': self.user.pk, 'master': self.master.pk, 'service': self.service.pk, 'status': 'pending'}
+
+    def test_admin_add(self):
+        url = reverse('admin:salon_booking_add')
+        response = self.client.post(url, {
+            **self.post_data(),
+            'appointment_datetime_0': self.start.strftime('%Y-%m-%d'),
+            'appointment_datetime_1': self.start.strftime('%H:%M:%S'),
+        }, follow=True)
+        self.assertEqual(response.redirect_chain, [(url, 302)])
+        self.assertIn(CONFLICT_MESSAGE, [str(message) for message in response.context['messages']])
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_booking_form(self):
+        response = self.client.post(reverse('salon:booking_create'), {
+            **self.post_data(), 'appointment_datetime': self.start.strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(CONFLICT_MESSAGE, response.context['form'].non_field_errors())
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class AuthUserLinkMigrationTests(TestCase):
+    """Связывание пользователей салона с учётными записями в миграции 0009"""
+
+    def link(self):
+        migration = import_module('salon.migrations.0009_user_auth_link')
+        migration.link_auth_users(apps, None)
+
+    def test_duplicate_auth_emails_link_distinct_users(self):
+        AuthUser.objects.create(username='one', email='client@example.com')
+        AuthUser.objects.create(username='two', email='Client@Example.com')
+        # bulk_create без сигналов: связи ставит только миграция
+        first, = User.objects.bulk_create([User(name='Первый', email='client@example.com')])
+        self.link()
+        first.refresh_from_db()
+        self.assertIsNotNone(first.auth_user_id)
+        self.assertEqual(User.objects.filter(auth_user__isnull=False).count(), 1)
+
+    def test_duplicates_on_both_sides_are_paired(self):
+        one = AuthUser.objects.create(username='one', email='client@example.com')
+        two = AuthUser.objects.create(username='two', email='client@EXAMPLE.com')
+        User.objects.bulk_create([
+            User(name='Первый', email='client@example.com'),
+            User(name='Второй', email='CLIENT@example.com'),
+        ])
+        self.link()
+        self.assertCountEqual(
+            User.objects.filter(auth_user__isnull=False).values_list('auth_user_id', flat=True), [one.pk, two.pk]
+        )
+
+
+class AuthUserLinkTests(TestCase):
+    """Пользователи салона и учётные записи, созданные в админке, связываются как при регистрации"""
+
+    def setUp(self):
+        self.admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def test_salon_user_added_in_admin_is_linked(self):
+        account = AuthUser.objects.create_user('client', 'client@example.com', 'password')
+        response = self.client.post(reverse('admin:salon_user_add'), {
+            'name': 'Клиент', 'email': 'Client@Example.com', 'role': 'client', 'auth_user': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(User.objects.get(email='Client@Example.com').auth_user, account)
+
+    def test_account_added_later_links_earliest_salon_user(self):
+        first = User.objects.create(name='Первый', email='client@example.com')
+        User.objects.create(name='Второй', email='client@example.com')
+        account = AuthUser.objects.create_user('client', 'CLIENT@example.com', 'password')
+        first.refresh_from_db()
+        self.assertEqual(first.auth_user, account)
+        self.assertEqual(User.objects.filter(auth_user__isnull=False).count(), 1)
+
+    def test_existing_link_is_kept(self):
+        other = AuthUser.objects.create_user('other', 'other@example.com', 'password')
+        salon_user = User.objects.create(name='Клиент', email='client@example.com', auth_user=other)
+        AuthUser.objects.create_user('client', 'client@example.com', 'password')
+        salon_user.refresh_from_db()
+        self.assertEqual(salon_user.auth_user, other)
+
+    def test_registration_reuses_salon_user_linked_by_signal(self):
+        self.client.logout()
+        salon_user = User.objects.create(name='Клиент', email='Client@Example.com')
+        response = self.client.post(reverse('salon:register'), {
+            'username': 'client', 'first_name': 'Клиент', 'email': 'client@example.com',
+            'password1': 'Sup3r-secret-pass', 'password2': 'Sup3r-secret-pass',
+        })
+        self.assertEqual(response.status_code, 302)
+        salon_user.refresh_from_db()
+        self.assertEqual(salon_user.auth_user.username, 'client')
+        self.assertEqual(User.objects.count(), 1)
+
+
+class HistoryArchiveTests(TestCase):
+    """Перенос журнала изменений в gzip-сегменты: чтение, фильтры, повторы и сбои"""
+
+    def setUp(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        patcher = override_settings(SALON_ARCHIVE_DIR=archive_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.table = TABLES['change_history']
+        self.content_type = ContentType.objects.get_for_model(Master)
+        now = timezone.now()
+        self.entries = [
+            self.entry(object_id, now - timedelta(days=days))
+            for object_id, days in ((1, 500), (2, 500), (1, 400), (3, 10))
+        ]
+        self.before = now - timedelta(days=365)
+
+    def entry(self, object_id, timestamp):
+        entry = ChangeHistory.objects.create(
+            content_type=self.content_type, object_id=object_id, action='updated',
+            changes={'full_name': {'old': 'Мастер', 'new': f'Мастер {object_id}'}},
+        )
+        ChangeHistory.objects.filter(pk=entry.pk).update(timestamp=timestamp)
+        entry.refresh_from_db()
+        return entry
+
+    def test_archive_and_read_round_trip(self):
+        self.assertEqual(self.table.archive(self.before, batch_size=2), 3)
+        self.assertEqual(list(ChangeHistory.objects.values_list('pk', flat=True)), [self.entries[3].pk])
+        self.assertEqual(len(self.table.segments()), 2)
+        rows = list(self.table.read())
+        self.assertEqual([row['id'] for row in rows], [entry.pk for entry in self.entries[:3]])
+        self.assertEqual(parse_datetime(rows[0]['timestamp']), self.entries[0].timestamp)
+        self.assertEqual(rows[0]['changes'], self.entries[0].changes)
+
+    def test_read_filters(self):
+        self.table.archive(self.before)
+        self.assertEqual(
+            [row['id'] for row in self.table.read(object_id=1)], [self.entries[0].pk, self.entries[2].pk],
+        )
+        since = self.entries[2].timestamp - timedelta(days=1)
+        self.assertEqual([row['id'] for row in self.table.read(since=since)], [self.entries[2].pk])
+        self.assertEqual(list(self.table.read(object_id=2, since=since)), [])
+
+    def test_rerun_after_interrupted_delete_is_deduplicated(self):
+        # Пачка записана в архив, но удаление из БД не состоялось
+        self.table.append(list(self.table.expired(self.before).values()))
+        self.assertEqual(ChangeHistory.objects.count(), 4)
+        self.assertEqual(self.table.archive(self.before), 3)
+        self.assertEqual([row['id'] for row in self.table.read()], [entry.pk for entry in self.entries[:3]])
+
+    def test_rows_stay_when_append_fails(self):
+        with mock.patch.object(ArchivedTable, 'append', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.table.archive(self.before)
+        self.assertEqual(ChangeHistory.objects.count(), 4)
+        self.assertEqual(list(self.table.read()), [])
+
+    def test_commands(self):
+        out = StringIO()
+        call_command('archive_history', 'change_history', days=365, stdout=out)
+        self.assertIn('перенесено в архив 3', out.getvalue())
+        out = StringIO()
+        call_command('read_archive', 'change_history', object_id=2, content_type='salon.master', stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()], [self.entries[1].pk])
+
+
+class BookingArchiveTests(TestCase):
+    """Перенос в архив без сигналов удаления и просмотр архивной записи"""
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        self.user = User.objects.create(name='Клиент', email='client@example.com')
+        self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking = Booking.objects.create(
+                user=self.user, master=self.master, service=self.service,
+                appointment_datetime=start, status='completed',
+            )
+            archive_bookings(timezone.now())
+
+    def test_archived_without_delete_signals(self):
+        self.assertFalse(Booking.objects.filter(pk=self.booking.pk).exists())
+        self.assertTrue(ArchivedBooking.objects.filter(pk=self.booking.pk).exists())
+        self.assertFalse(ChangeHistory.objects.filter(object_id=self.booking.pk, action='deleted').exists())
+
+    def test_api_detail_falls_back_to_archive(self):
+        response = self.client.get(reverse('booking-detail', args=[self.booking.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['booking_id'], self.booking.pk)
+        self.assertEqual(self.client.get(reverse('booking-detail', args=[self.booking.pk + 1])).status_code, 404)
+
+    def test_html_detail_falls_back_to_archive(self):
+        response = self.client.get(reverse('salon:booking_detail', args=[self.booking.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Запись в архиве')
+
+    def test_cascade_delete_of_archived_booking_updates_counters(self):
+        refresh_dirty_days()
+        self.assertEqual(compute_booking_statistics()['completed'], 1)
+        self.assertEqual(sum(BookingDailyRollup.objects.values_list('bookings_count', flat=True)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(ArchivedBooking.objects.exists())
+        self.assertEqual(compute_booking_statistics()['completed'], 0)
+        self.assertEqual(reconcile_counters(), {})
+        refresh_dirty_days()
+        self.assertFalse(BookingDailyRollup.objects.exists())
+
+    def test_statistics_count_archived_bookings(self):
+        stats = import_module('salon.management.commands.generate_statistics').Command().collect_statistics()
+        self.assertEqual(stats['users']['with_bookings'], 1)
+        self.assertEqual(stats['last_30_days']['new_bookings'], 1)
+
+
+class BulkBookingTests(TestCase):
+    """Массовое создание записей: связи загружаются заранее, занятость проверяется для всей пачки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.masters = [
+            Master.objects.create(full_name=f'Мастер {i}', specialization='Стилист', experience_years=i)
+            for i in range(2)
+        ]
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        cls.admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def item(self, master, hours=0):
+        return {
+            'user': self.user.pk, 'master': master.pk, 'service': self.service.pk,
+            'appointment_datetime': (self.start + timedelta(hours=hours)).isoformat(),
+        }
+
+    def post(self, items):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('booking-bulk'), items, content_type='application/json')
+        return response, queries
+
+    def statuses(self, response):
+        return [result['status'] for result in response.json()['results']]
+
+    def test_batch_conflicting_with_existing_booking(self):
+        Booking.objects.create(
+            user=self.user, master=self.masters[0], service=self.service, appointment_datetime=self.start,
+        )
+        items = [self.item(self.masters[0]), self.item(self.masters[0], 2), self.item(self.masters[1])]
+        response, queries = self.post(items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(self.statuses(response), ['error', 'created', 'created'])
+        self.assertEqual(response.json()['results'][0]['errors'], {'non_field_errors': [CONFLICT_MESSAGE]})
+        # Связи и занятость читаются одним запросом на пачку
+        self.assertEqual(len(selects_from(queries, Master._meta.db_table)), 1)
+        self.assertEqual(len(selects_from(queries, MasterTimeSlot._meta.db_table)), 1)
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_duplicates_inside_batch(self):
+        items = [self.item(self.masters[0]), self.item(self.masters[0]), self.item(self.masters[1])]
+        response, _ = self.post(items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(self.statuses(response), ['created', 'error', 'created'])
+        self.assertEqual(
+            MasterTimeSlot.objects.filter(master=self.masters[0]).values('booking').distinct().count(), 1,
+        )
+        self.assertEqual(check(), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_unknown_related_pk(self):
+        response, _ = self.post([
+            {**self.item(self.masters[0]), 'master': 999999},
+            {**self.item(self.masters[0]), 'user': 'x'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertIn('master', results[0]['errors'])
+        self.assertIn('user', results[1]['errors'])
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingImportTests(TestCase):
+    """Потоковый импорт записей: поиск связей через кэш пачками, ошибки по номерам строк"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        cls.start = timezone.localtime().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def csv_file(self, rows):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['user__name', 'user__email', 'master__full_name', 'service__title',
+                         'appointment_datetime', 'status'])
+        writer.writerows(rows)
+        return BytesIO(buffer.getvalue().encode())
+
+    def row(self, hours, email='client@example.com', master='Мастер', status='В ожидании', minutes=0):
+        moment = self.start + timedelta(hours=hours, minutes=minutes)
+        return ['Клиент', email, master, 'Стрижка', moment.strftime('%d.%m.%Y %H:%M'), status]
+
+    def test_csv_import_with_errors_by_line(self):
+        rows = [
+            self.row(0),
+            self.row(2, status='Подтверждена'),
+            self.row(4, master='Неизвестный'),
+            self.row(6, minutes=10),
+            self.row(0),  # то же время, что в строке 2
+            self.row(8, status='потерян'),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            report = import_bookings(read_rows(self.csv_file(rows), 'csv'), batch_size=2)
+        self.assertEqual((report.rows, report.created, report.failed), (6, 2, 4))
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6, 7])
+        self.assertEqual(set(report.errors[0][1]), {'master'})
+        self.assertEqual(set(report.errors[1][1]), {'appointment_datetime'})
+        self.assertEqual(report.errors[2][1], {'non_field_errors': [CONFLICT_MESSAGE]})
+        self.assertEqual(set(report.errors[3][1]), {'status'})
+        self.assertEqual(
+            sorted(Booking.objects.values_list('status', flat=True)), ['confirmed', 'pending'],
+        )
+        # Мастер ищется запросом только для новых имён пачки, а не на каждую строку
+        self.assertEqual(len(selects_from(queries, Master._meta.db_table)), 2)
+        self.assertEqual(check(), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_ndjson_export_columns_and_new_users(self):
+        lines = [
+            json.dumps({
+                'user_name': 'Новый клиент', 'user_email': 'new@example.com', 'master': 'Мастер',
+                'service': 'Стрижка', 'appointment_datetime': self.start.isoformat(), 'status': 'confirmed',
+            }),
+        ]
+        file = BytesIO('\n'.join(lines).encode())
+        report = import_bookings(read_rows(file, 'ndjson'), create_users=True)
+        self.assertEqual((report.created, report.users_created), (1, 1))
+        booking = Booking.objects.get()
+        self.assertEqual((booking.user.name, booking.status), ('Новый клиент', 'confirmed'))
+        self.assertEqual(booking.end_datetime, self.start + timedelta(minutes=self.service.duration_minutes))
+
+    def test_dry_run_writes_nothing(self):
+        report = import_bookings(
+            read_rows(self.csv_file([self.row(0), self.row(2, email='new@example.com')]), 'csv'),
+            create_users=True, dry_run=True,
+        )
+        self.assertEqual((report.created, report.failed), (1, 1))
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
+
+    def test_admin_bulk_import(self):
+        self.client.force_login(AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        upload = SimpleUploadedFile('bookings.csv', self.csv_file([self.row(0), self.row(0)]).getvalue())
+        response = self.client.post(reverse('admin:salon_booking_bulk_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual((report.created, report.failed), (1, 1))
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class BookingTransitionTests(TestCase):
+    """Массовая смена статуса: разрешённые переходы одним UPDATE, побочные эффекты пачкой"""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            self.user = User.objects.create(name='Клиент', email='client@example.com')
+            self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+            self.bookings = [
+                Booking.objects.create(
+                    user=self.user, master=self.master, service=self.service,
+                    appointment_datetime=start + timedelta(hours=2 * i), status=status,
+                )
+                for i, status in enumerate(['pending', 'pending', 'completed'])
+            ]
+        self.day = timezone.localdate(self.bookings[0].appointment_datetime)
+        self.booking_type = ContentType.objects.get_for_model(Booking)
+
+    def transition(self, new_status, bookings=None):
+        pks = [booking.pk for booking in bookings or self.bookings]
+        with self.captureOnCommitCallbacks(execute=True):
+            return transition_bookings(Booking.objects.filter(pk__in=pks), new_status, changed_by='admin')
+
+    def test_allowed_transition_updates_rows_and_side_effects(self):
+        history_before = Booking.history.count()
+        with CaptureQueriesContext(connection) as queries:
+            result = self.transition('confirmed')
+        moved = [booking.pk for booking in self.bookings[:2]]
+        self.assertEqual(result, {'updated': moved, 'skipped': [(self.bookings[2].pk, 'completed')]})
+        updates = [query for query in queries if query['sql'].startswith(f'UPDATE "{Booking._meta.db_table}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            dict(Booking.objects.values_list('pk', 'status')),
+            {moved[0]: 'confirmed', moved[1]: 'confirmed', self.bookings[2].pk: 'completed'},
+        )
+        history = ChangeHistory.objects.filter(content_type=self.booking_type, action='updated')
+        self.assertEqual(
+            sorted((entry.object_id, entry.changed_by, entry.changes['status']['new']) for entry in history),
+            [(pk, 'admin', 'confirmed') for pk in moved],
+        )
+        self.assertEqual(Booking.history.count(), history_before + 2)
+        self.assertEqual(
+            dict(BookingCounter.objects.filter(day=self.day, count__gt=0).values_list('status', 'count')),
+            {'confirmed': 2, 'completed': 1},
+        )
+        self.assertEqual(check(), {'missing': [], 'extra': [], 'stale': []})
+
+    def test_rejected_transition_changes_nothing(self):
+        history_before = ChangeHistory.objects.count()
+        result = self.transition('pending')
+        self.assertEqual(result['updated'], [])
+        self.assertEqual(
+            result['skipped'],
+            [(booking.pk, booking.status) for booking in self.bookings],
+        )
+        self.assertEqual(ChangeHistory.objects.count(), history_before)
+        with self.assertRaises(TransitionError):
+            self.transition('archived')
+
+    def test_cancel_frees_master_time(self):
+        self.assertTrue(MasterTimeSlot.objects.filter(booking=self.bookings[0]).exists())
+        self.transition('cancelled', self.bookings[:1])
+        self.assertFalse(MasterTimeSlot.objects.filter(booking=self.bookings[0]).exists())
+        # Освободившееся время можно занять новой записью
+        Booking.objects.create(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.bookings[0].appointment_datetime,
+        )
+
+
+class BookingCounterTests(TestCase):
+    """Счётчики записей по дню и статусу меняются вместе с записями"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        cls.user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        cls.day = timezone.localdate(cls.start)
+
+    def book(self, offset_hours=0, **kwargs):
+        return Booking.objects.create(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.start + timedelta(hours=offset_hours), **kwargs
+        )
+
+    def counters(self):
+        return dict(BookingCounter.objects.filter(count__gt=0).values_list('status', 'count'))
+
+    def assertCountersActual(self):
+        stored = {
+            (day, status): count
+            for day, status, count in BookingCounter.objects.filter(count__gt=0).values_list('day', 'status', 'count')
+        }
+        self.assertEqual(stored, actual_counters())
+
+    def test_create_status_change_and_delete(self):
+        booking = self.book()
+        self.book(2)
+        self.assertEqual(self.counters(), {'pending': 2})
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.counters(), {'pending': 1, 'confirmed': 1})
+        booking.appointment_datetime += timedelta(days=1)
+        booking.save()
+        self.assertEqual(
+            BookingCounter.objects.get(day=self.day + timedelta(days=1), status='confirmed').count, 1,
+        )
+        self.assertCountersActual()
+        booking.delete()
+        self.assertEqual(self.counters(), {'pending': 1})
+        self.assertCountersActual()
+
+    def test_bulk_created(self):
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user=self.user, master=self.master, service=self.service, status=status,
+                appointment_datetime=self.start + timedelta(hours=hours),
+            )
+            for hours, status in zip(range(0, 12, 2), ['pending', 'pending', 'confirmed'] * 2)
+        ])
+        self.assertEqual(self.counters(), {})
+        with CaptureQueriesContext(connection) as queries:
+            bookings_bulk_created(bookings)
+        # Запросы на счётчик, а не на запись: UPDATE и после создания строки ещё один
+        self.assertEqual(
+            len([query for query in queries if query['sql'].startswith(f'UPDATE "{BookingCounter._meta.db_table}"')]),
+            4,
+        )
+        self.assertEqual(self.counters(), {'pending': 4, 'confirmed': 2})
+        self.assertCountersActual()
+
+    def test_statistics_and_reconcile(self):
+        self.book(status='confirmed')
+        self.book(2)
+        stats = compute_booking_statistics()
+        self.assertEqual((stats['total_bookings'], stats['pending'], stats['confirmed']), (2, 1, 1))
+        self.assertEqual(stats['upcoming_30_days'], 2)
+        # Изменение в обход сигналов находит и исправляет сверка
+        Booking.objects.filter(status='pending').update(status='cancelled')
+        drift = reconcile_counters()
+        self.assertEqual(drift, {(self.day, 'pending'): (1, 0), (self.day, 'cancelled'): (0, 1)})
+        self.assertCountersActual()
+
+
+class RollupRefreshTests(TestCase):
+    """Пометки дней для пересчёта дневных агрегатов"""
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+        self.user = User.objects.create(name='Клиент', email='client@example.com')
+        self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        Booking.objects.create(user=self.user, master=self.master, service=self.service, appointment_datetime=self.start)
+        refresh_dirty_days()
+
+    def revenue(self):
+        return sum(BookingDailyRollup.objects.values_list('revenue', flat=True))
+
+    def test_price_change_marks_days_dirty(self):
+        self.assertEqual(self.revenue(), 1000)
+        self.service.price = 1500
+        self.service.save()
+        self.assertTrue(RollupDirtyDay.objects.exists())
+        refresh_dirty_days()
+        self.assertEqual(self.revenue(), 1500)
+        self.assertFalse(RollupDirtyDay.objects.exists())
+
+    def test_failed_refresh_keeps_marks(self):
+        Booking.objects.create(
+            user=self.user, master=self.master, service=self.service,
+            appointment_datetime=self.start + timedelta(hours=2),
+        )
+        with mock.patch.object(BookingDailyRollup.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                refresh_dirty_days()
+        self.assertTrue(RollupDirtyDay.objects.exists())
+        refresh_dirty_days()
+        self.assertEqual(self.revenue(), 2000)
+
+
+class SparseFieldsetTests(TestCase):
+    """?fields= и ?expand=: ответ содержит только выбранные поля, запрос читает только их колонки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.service = Service.objects.create(title='Стрижка', description='Длинное описание', price=1000)
+            cls.user = User.objects.create(name='Клиент', email='client@example.com')
+            cls.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            cls.booking = Booking.objects.create(
+                user=cls.user, master=cls.master, service=cls.service,
+                appointment_datetime=timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1),
+            )
+        cls.url = reverse('booking-detail', args=[cls.booking.pk])
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), selects_from(queries, Booking._meta.db_table)
+
+    def test_fields_limit_output_and_columns(self):
+        data, selects = self.get(self.url, {'fields': 'booking_id,status'})
+        self.assertEqual(data, {'booking_id': self.booking.pk, 'status': 'pending'})
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('JOIN', selects[0])
+        self.assertNotIn('"end_datetime"', selects[0])
+
+    def test_expand_joins_only_expanded_relations(self):
+        data, selects = self.get(self.url, {'fields': 'booking_id', 'expand': 'service'})
+        self.assertEqual(set(data), {'booking_id', 'service_detail'})
+        self.assertEqual(data['service_detail']['title'], 'Стрижка')
+        self.assertIn(f'JOIN "{Service._meta.db_table}"', selects[0])
+        self.assertNotIn(f'JOIN "{Master._meta.db_table}"', selects[0])
+
+    def test_nested_fields(self):
+        data, selects = self.get(reverse('booking-list'), {'fields': 'booking_id,service_detail.description'})
+        self.assertEqual(data['results'], [{'booking_id': self.booking.pk, 'service_detail': {'description': 'Длинное описание'}}])
+        # Описания услуги нет в плоской таблице - список читается из записей только с этой колонкой услуги
+        self.assertNotIn(f'"{Service._meta.db_table}"."title"', selects[-1])
+
+    def test_unknown_field(self):
+        for params in ({'fields': 'booking_id,secret'}, {'fields': 'user_detail.password'}, {'expand': 'owner'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class BookingExportTests(TestCase):
+    """Потоковая выгрузка записей в CSV и NDJSON пачками, с фильтрами списка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            service = Service.objects.create(title='Стрижка', description='', price=1000)
+            user = User.objects.create(name='Клиент', email='client@example.com')
+            master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+            cls.bookings = [
+                Booking.objects.create(
+                    user=user, master=master, service=service, appointment_datetime=start + timedelta(hours=2 * i),
+                    status='confirmed' if i % 2 else 'pending',
+                )
+                for i in range(5)
+            ]
+        cls.url = reverse('booking-export')
+        cls.admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    @override_settings(SALON_EXPORT_CHUNK_SIZE=2)
+    def test_csv_streamed_in_chunks(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('attachment; filename="bookings-', response['Content-Disposition'])
+        parts = [part.decode() for part in response.streaming_content]
+        # Заголовок отдельно, затем по пачке из двух строк
+        self.assertEqual(len(parts), 4)
+        rows = list(csv.reader(''.join(parts).splitlines()))
+        self.assertEqual(rows[0][:3], ['booking_id', 'user_name', 'user_email'])
+        self.assertEqual(sorted(int(row[0]) for row in rows[1:]), [booking.pk for booking in self.bookings])
+        first = next(row for row in rows[1:] if int(row[0]) == self.bookings[0].pk)
+        self.assertEqual(first[1:5], ['Клиент', 'client@example.com', 'Мастер', 'Стрижка'])
+
+    def test_ndjson_with_filters(self):
+        response = self.client.get(self.url, {'format': 'ndjson', 'status': 'confirmed'})
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            sorted(row['booking_id'] for row in rows),
+            [booking.pk for booking in self.bookings if booking.status == 'confirmed'],
+        )
+        self.assertEqual({row['status'] for row in rows}, {'confirmed'})
+        self.assertTrue(rows[0]['appointment_datetime'].endswith('Z'))
+
+    def test_admin_only(self):
+        self.client.force_login(AuthUser.objects.create_user('client'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FullTextSearchTests(TestCase):
+    """Поиск FTS5: русские окончания, ё/е, релевантность и обновление индекса сигналами"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.haircut = Service.objects.create(title='Стрижка', description='Мужская и женская', price=1000)
+            cls.coloring = Service.objects.create(
+                title='Окрашивание', description='Окрашивание после стрижки', price=3000,
+            )
+            cls.user = User.objects.create(name='Клиент', email='client@example.com')
+            cls.master = Master.objects.create(full_name='Иванов Пётр', specialization='Стилист', experience_years=3)
+            Master.objects.create(full_name='Сидорова Анна', specialization='Колорист', experience_years=5)
+            cls.booking = Booking.objects.create(
+                user=cls.user, master=cls.master, service=cls.haircut,
+                appointment_datetime=timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1),
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name, query):
+        response = self.client.get(reverse(f'{name}-list'), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_stemming(self):
+        self.assertEqual(stem('стрижки'), 'стрижк')
+        self.assertEqual(stem('иванова'), 'иванов')
+        # Основа не короче трёх букв, латиница не меняется
+        self.assertEqual(stem('уха'), 'уха')
+        self.assertEqual(stem('spa'), 'spa')
+        self.assertEqual(match_expression('Ёлки "стрижки" OR'), '"елк"* "стрижк"* "or"*')
+        self.assertIsNone(match_expression(' - "" '))
+
+    def test_word_forms_and_yo(self):
+        self.assertEqual([master['full_name'] for master in self.search('master', 'Иванова')], ['Иванов Пётр'])
+        self.assertEqual([master['full_name'] for master in self.search('master', 'петр')], ['Иванов Пётр'])
+        self.assertEqual(self.search('master', 'Петрова Анна'), [])
+
+    def test_results_ordered_by_relevance(self):
+        titles = [service['title'] for service in self.search('service', 'стрижки')]
+        # Совпадение в названии весомее упоминания в длинном описании
+        self.assertEqual(titles, ['Стрижка', 'Окрашивание'])
+
+    def test_booking_index_follows_related_rename(self):
+        self.assertEqual([b['booking_id'] for b in self.search('booking', 'иванов')], [self.booking.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.master.full_name = 'Сергеев Олег'
+            self.master.save()
+        cache.clear()
+        self.assertEqual(self.search('booking', 'иванов'), [])
+        with CaptureQueriesContext(connection) as queries:
+            found = self.search('booking', 'Сергееву')
+        self.assertEqual([b['booking_id'] for b in found], [self.booking.pk])
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql']])
+
+
+class CompiledListOutputTests(TestCase):
+    """Списки через CompiledSerializer совпадают с выводом сериализаторов DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            services = [
+                Service.objects.create(title=f'Услуга {i}', description='Описание', price=1000 + i) for i in range(3)
+            ]
+            users = [User.objects.create(name=f'Клиент {i}', email=f'client{i}@example.com') for i in range(3)]
+            masters = [
+                Master.objects.create(full_name=f'Мастер {i}', specialization='Стилист', experience_years=i)
+                for i in range(3)
+            ]
+            start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+            for i, master in enumerate(masters):
+                MasterService.objects.create(master=master, service=services[i])
+                Review.objects.create(user=users[i], master=master, rating=i + 3, comment='Отзыв')
+                for j in range(3):
+                    Booking.objects.create(
+                        user=users[j], master=master, service=services[j],
+                        appointment_datetime=start + timedelta(hours=2 * j, days=i),
+                    )
+
+    def assertSameOutput(self, url, params=None):
+        cache.clear()
+        compiled = self.client.get(url, params).json()
+        cache.clear()
+        with mock.patch('salon.fast_serializers.compile_serializer', return_value=None):
+            expected = self.client.get(url, params).json()
+        self.assertTrue(expected['results'])
+        self.assertEqual(compiled, expected)
+
+    def test_bookings(self):
+        self.assertSameOutput(reverse('booking-list'))
+        self.assertSameOutput(reverse('booking-list'), {'fields': 'booking_id,status,user_detail.name', 'expand': 'user'})
+
+    def test_masters(self):
+        self.assertSameOutput(reverse('master-list'))
+
+    def test_services(self):
+        self.assertSameOutput(reverse('service-list'))
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсоры keyset-пагинации при равных значениях ключа сортировки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        service = Service.objects.create(title='Стрижка', description='', price=1000)
+        user = User.objects.create(name='Клиент', email='client@example.com')
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        # Пять записей на одно время (к разным мастерам) и две позже
+        for i in range(7):
+            master = Master.objects.create(full_name=f'Мастер {i}', specialization='Стилист', experience_years=i)
+            Booking.objects.create(
+                user=user, master=master, service=service,
+                appointment_datetime=cls.start + timedelta(hours=2 * max(i - 4, 0)),
+            )
+        cls.expected = list(Booking.objects.order_by('-appointment_datetime', '-booking_id').values_list('pk', flat=True))
+
+    def walk(self, ordering=('-appointment_datetime',)):
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(Booking.objects.all(), ordering, 2, cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_forward_walk_visits_each_row_once(self):
+        pages = self.walk()
+        self.assertEqual([booking.pk for page in pages for booking in page], self.expected)
+        self.assertEqual(len(pages), 4)
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk()
+        for previous, page in zip(pages, pages[1:]):
+            back = keyset_paginate(Booking.objects.all(), ('-appointment_datetime',), 2, page.previous_cursor)
+            self.assertEqual([booking.pk for booking in back], [booking.pk for booking in previous])
+
+    def test_cursor_is_stable_after_insert_before_position(self):
+        first = keyset_paginate(Booking.objects.all(), ('-appointment_datetime',), 2)
+        # Новая запись в начале списка не сдвигает следующую страницу
+        Booking.objects.create(
+            user=User.objects.get(), master=Master.objects.first(), service=Service.objects.get(),
+            appointment_datetime=self.start + timedelta(days=7),
+        )
+        second = keyset_paginate(Booking.objects.all(), ('-appointment_datetime',), 2, first.next_cursor)
+        self.assertEqual([booking.pk for booking in second], self.expected[2:4])
+
+    def test_api_cursor_walk_and_invalid_cursor(self):
+        url = reverse('booking-list')
+        seen, params = [], {'pagination': 'cursor', 'ordering': 'appointment_datetime'}
+        with mock.patch.object(BookingPagination, 'page_size', 2):
+            while url:
+                cache.clear()
+                data = self.client.get(url, params).json()
+                self.assertLessEqual(len(data['results']), 2)
+                seen.extend(item['booking_id'] for item in data['results'])
+                url, params = data['next'], None
+        self.assertCountEqual(seen, self.expected)
+        self.assertEqual(len(seen), len(set(seen)))
+        response = self.client.get(reverse('booking-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag списка и записи: 304 до изменения данных и полный ответ после"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            self.user = User.objects.create(name='Клиент', email='client@example.com')
+            self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            self.booking = Booking.objects.create(
+                user=self.user, master=self.master, service=self.service,
+                appointment_datetime=timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1),
+            )
+
+    def assertRevalidation(self, url, change):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response
+
+    def set_status(self):
+        self.booking.status = 'confirmed'
+        self.booking.save()
+
+    def rename_master(self):
+        self.master.full_name = 'Другой мастер'
+        self.master.save()
+
+    def test_list_revalidates_after_booking_write(self):
+        response = self.assertRevalidation(reverse('booking-list'), self.set_status)
+        self.assertEqual(response.json()['results'][0]['status'], 'confirmed')
+
+    def test_list_revalidates_after_related_write(self):
+        response = self.assertRevalidation(reverse('booking-list'), self.rename_master)
+        self.assertEqual(response.json()['results'][0]['master_detail']['full_name'], 'Другой мастер')
+
+    def test_detail_revalidates_after_booking_write(self):
+        response = self.assertRevalidation(reverse('booking-detail', args=[self.booking.pk]), self.set_status)
+        self.assertEqual(response.json()['status'], 'confirmed')
+
+    def test_list_revalidates_after_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(title='Маникюр', description='', price=800)
+        url = reverse('service-list')
+        first = self.client.get(url)
+        self.assertNotIn('Last-Modified', first)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+            self.service.delete()
+        # Удаление не меняет max(updated_at): по If-Modified-Since список выглядел бы неизменным
+        since = http_date((timezone.now() + timedelta(hours=1)).timestamp())
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([service['title'] for service in response.json()['results']], ['Маникюр'])
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+
+class ResponseCacheTests(TestCase):
+    """Кэш ответов API устаревает при смене поколения моделей, от которых зависит ответ"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service = Service.objects.create(title='Стрижка', description='', price=1000)
+            self.user = User.objects.create(name='Клиент', email='client@example.com')
+            self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+            Booking.objects.create(
+                user=self.user, master=self.master, service=self.service,
+                appointment_datetime=timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1),
+            )
+        self.url = reverse('booking-list')
+
+    def get(self):
+        return self.client.get(self.url)
+
+    def test_dependency_write_invalidates(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.title = 'Окрашивание'
+            self.service.save()
+        response = self.get()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['service_detail']['title'], 'Окрашивание')
+
+    def test_unrelated_write_keeps_entry(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.user, master=self.master, rating=5, comment='Отзыв')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+    def test_generation_changes_only_after_commit(self):
+        self.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.service.title = 'Окрашивание'
+            self.service.save()
+            # До фиксации транзакции другие запросы видят прежние данные и прежний кэш
+            self.assertEqual(self.get()['X-Cache'], 'HIT')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+    def test_deploy_check_requires_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([message.id for message in run_checks(include_deployment_checks=True)
+                              if message.id.startswith('salon.')], ['salon.W001'])
+            self.assertNotIn('salon.W001', [message.id for message in run_checks()])
+        with override_settings(CACHES=shared):
+            self.assertEqual([message.id for message in run_checks(include_deployment_checks=True)
+                              if message.id.startswith('salon.')], [])
+
+
+class MasterRatingTests(TestCase):
+    """Рейтинги мастеров совпадают с пересчётом по отзывам после любых изменений отзывов"""
+
+    def setUp(self):
+        self.users = [User.objects.create(name=f'Клиент {i}', email=f'client{i}@example.com') for i in range(2)]
+        self.masters = [
+            Master.objects.create(full_name=f'Мастер {i}', specialization='Стилист', experience_years=i)
+            for i in range(2)
+        ]
+        for user in self.users:
+            for rating, master in zip((5, 3), self.masters):
+                Review.objects.create(user=user, master=master, rating=rating, comment='Отзыв')
+
+    def assertRatingsActual(self):
+        actual = actual_ratings()
+        fields = ['reviews_count', 'rating_sum', *(f'rating_{value}' for value in RATING_VALUES)]
+        for rating in MasterRating.objects.all():
+            expected = actual.pop(rating.master_id, dict.fromkeys(fields, 0))
+            self.assertEqual({field: getattr(rating, field) for field in fields}, expected)
+            if rating.reviews_count:
+                self.assertAlmostEqual(rating.average, rating.rating_sum / rating.reviews_count)
+            else:
+                self.assertIsNone(rating.average)
+        # У каждого мастера с отзывами есть строка рейтинга
+        self.assertEqual(actual, {})
+
+    def test_review_moved_to_another_master(self):
+        review = Review.objects.get(user=self.users[0], master=self.masters[0])
+        review.master = self.masters[1]
+        review.rating = 1
+        review.save()
+        self.assertRatingsActual()
+        self.assertEqual(MasterRating.objects.get(master=self.masters[0]).reviews_count, 1)
+        self.assertEqual(MasterRating.objects.get(master=self.masters[1]).rating_1, 1)
+
+    def test_cascade_delete_of_user(self):
+        self.users[0].delete()
+        self.assertRatingsActual()
+        self.users[1].delete()
+        self.assertRatingsActual()
+        self.assertEqual(set(MasterRating.objects.values_list('reviews_count', flat=True)), {0})
+
+    def test_cascade_delete_of_master(self):
+        self.masters[0].delete()
+        self.assertRatingsActual()
+        self.assertFalse(MasterRating.objects.filter(master_id=self.masters[0].pk).exists())
+
+    def test_zero_rating_is_invalid(self):
+        # Оценка 0 не попала бы ни в одну колонку распределения rating_1..rating_5
+        review = Review(user=self.users[0], master=self.masters[0], rating=0, comment='Отзыв')
+        with self.assertRaises(ValidationError) as raised:
+            review.full_clean()
+        self.assertIn('rating', raised.exception.message_dict)
+
+
+@override_settings(SALON_EXPORT_JOBS_IN_THREAD=False)
+class ExportJobTests(TestCase):
+    """Фоновая выгрузка: задание хранит параметры списка в JSON и строит queryset при выполнении"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(name=name, email=f'client{i}@example.com')
+            for i, name in enumerate(['Анна', 'Анастасия', 'Борис'])
+        ]
+        cls.admin = AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        patcher = override_settings(SALON_EXPORT_DIR=export_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.client.force_login(self.admin)
+
+    def download(self, job):
+        response = self.client.get(reverse('admin:salon_exportjob_download', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_admin_export_creates_job_with_list_params(self):
+        response = self.client.post(reverse('admin:salon_user_export') + '?q=Ана', {
+            'resource': '0', 'format': '0', 'userresource_name': 'on', 'userresource_email': 'on',
+        })
+        self.assertRedirects(response, reverse('admin:salon_exportjob_changelist'))
+        job = ExportJob.objects.get()
+        self.assertEqual(job.filters, {'params': {'q': ['Ана']}, 'pks': None})
+        self.assertEqual((job.status, job.file_format), ('pending', 'csv'))
+
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total_rows, job.processed_rows), ('done', 1, 1))
+        self.assertEqual(self.download(job)[1:], [['Анастасия', 'client1@example.com']])
+        # Задание выполняется один раз
+        self.assertFalse(run_job(job.pk))
+
+    def test_selected_records(self):
+        job = create_job(
+            User, {'params': {'o': ['-1']}, 'pks': [str(self.users[0].pk), str(self.users[2].pk)]},
+            UserResource, 'csv', user=self.admin,
+        )
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(sorted(row[1] for row in self.download(job)[1:]), ['Анна', 'Борис'])
+
+    def test_failing_job(self):
+        job = create_job(User, {'params': {'no_such_field': ['1']}}, UserResource, 'csv', user=self.admin)
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('IncorrectLookupParameters', job.error)
+        self.assertIsNotNone(job.finished_at)
+        response = self.client.get(reverse('admin:salon_exportjob_download', args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReviewPermissionTests(TestCase):
+    """Отзыв пишется от имени пользователя запроса, чужой меняет только администратор"""
+
+    def setUp(self):
+        self.master = Master.objects.create(full_name='Мастер', specialization='Стилист', experience_years=3)
+        self.author = User.objects.create(
+            name='Автор', email='author@example.com', auth_user=AuthUser.objects.create_user('author'),
+        )
+        self.other = User.objects.create(
+            name='Другой', email='other@example.com', auth_user=AuthUser.objects.create_user('other'),
+        )
+        self.review = Review.objects.create(user=self.author, master=self.master, rating=5, comment='Отзыв')
+        self.url = reverse('review-detail', args=[self.review.pk])
+
+    def test_create_ignores_user_from_body(self):
+        self.client.force_login(self.other.auth_user)
+        response = self.client.post(
+            reverse('review-list'), {'user': self.author.pk, 'master': self.master.pk, 'rating': 4},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Review.objects.get(pk=response.json()['review_id']).user, self.other)
+
+    def test_create_requires_salon_user(self):
+        self.client.force_login(AuthUser.objects.create_user('stranger'))
+        response = self.client.post(reverse('review-list'), {'master': self.master.pk, 'rating': 4})
+        self.assertEqual(response.status_code, 403)
+
+    def test_other_user_cannot_change_or_delete(self):
+        self.client.force_login(self.other.auth_user)
+        self.assertEqual(
+            self.client.patch(self.url, {'rating': 1}, content_type='application/json').status_code, 403,
+        )
+        self.assertEqual(self.client.delete(self.url).status_code, 403)
+        self.assertEqual(MasterRating.objects.get(master=self.master).rating_sum, 5)
+
+    def test_author_and_admin_can_change(self):
+        self.client.force_login(self.author.auth_user)
+        self.assertEqual(
+            self.client.patch(self.url, {'rating': 3}, content_type='application/json').status_code, 200,
+        )
+        self.client.force_login(AuthUser.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(MasterRating.objects.get(master=self.master).reviews_count, 0)
@@ -0,0 +1,104 @@
+"""
+Массовая смена статуса записей.
+
+Выбранные записи переводятся в новый статус одним UPDATE, условие которого
+пропускает только записи в статусах, из которых переход разрешён
+(ALLOWED_TRANSITIONS). История (simple_history и ChangeHistory), счётчики,
+агрегаты, занятые ячейки расписания и строки плоской таблицы списков
+обновляются пачкой, а не по сигналу на каждую запись.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import ACTIVE_STATUSES
+from .counters import counter_key, record_booking_changes
+from .models import Booking, BookingListItem, MasterTimeSlot
+from .response_cache import bump_generation_on_commit
+from .rollups import mark_days_dirty
+from .signals import invalidate_availability, save_change_history
+
+# Из какого статуса в какие разрешён переход
+ALLOWED_TRANSITIONS = {
+    'pending': ('confirmed', 'completed', 'cancelled'),
+    'confirmed': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+
+
+class TransitionError(Exception):
+    """Недопустимый целевой статус или записи изменены параллельно"""
+
+
+def allowed_sources(new_status):
+    """Статусы, из которых разрешён переход в new_status"""
+    return [old for old, targets in ALLOWED_TRANSITIONS.items() if new_status in targets]
+
+
+def day_bookings(master_id, day):
+    """Записи мастера на день (в текущем часовом поясе)"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return Booking.objects.filter(
+        master_id=master_id,
+        appointment_datetime__gte=start,
+        appointment_datetime__lt=start + timedelta(days=1),
+    )
+
+
+def transition_bookings(queryset, new_status, changed_by=''):
+    """
+    Переводит записи из queryset в new_status. Возвращает словарь:
+    updated - ID изменённых записей, skipped - [(ID, текущий статус)] записей,
+    для которых переход не разрешён.
+    """
+    if new_status not in ALLOWED_TRANSITIONS:
+        raise TransitionError(f'Неизвестный статус: {new_status}')
+    sources = allowed_sources(new_status)
+
+    with transaction.atomic():
+        bookings = list(queryset.select_for_update().order_by('pk'))
+        movable = [booking for booking in bookings if booking.status in sources]
+        skipped = [(booking.pk, booking.status) for booking in bookings if booking.status not in sources]
+        if movable:
+            # Условие по статусу повторяет проверку на стороне БД
+            now = timezone.now()
+            updated = Booking.objects.filter(
+                pk__in=[booking.pk for booking in movable], status__in=sources
+            ).update(status=new_status, updated_at=now)
+            if updated != len(movable):
+                # Статус части записей сменили между чтением и UPDATE - откатываем всё
+                raise TransitionError('Записи изменены параллельным запросом, повторите операцию')
+            BookingListItem.objects.filter(pk__in=[booking.pk for booking in movable]).update(
+                status=new_status, updated_at=now, synced_at=now
+            )
+            for booking in movable:
+                booking.updated_at = now
+            _after_transition(movable, new_status, changed_by)
+
+    return {
+        'updated': [booking.pk for booking in movable],
+        'skipped': skipped,
+    }
+
+
+def _after_transition(bookings, new_status, changed_by):
+    """То же, что делают сигналы сохранения записи, но для всей пачки"""
+    changes = []
+    for booking in bookings:
+        old_key = counter_key(booking.appointment_datetime, booking.status)
+        old_values = booking.get_original_values()
+        booking.status = new_status
+        booking._snapshot_tracked_fields(['status'])
+        changes.append((old_key, counter_key(booking.appointment_datetime, new_status)))
+        save_change_history(booking, 'updated', changed_by=changed_by, old_values=old_values)
+
+    Booking.history.bulk_history_create(bookings, update=True)
+    bump_generation_on_commit(Booking)
+    record_booking_changes(changes)
+    mark_days_dirty({new_key[0] for _, new_key in changes})
+    if new_status not in ACTIVE_STATUSES:
+        # Отменённые записи освобождают время мастера
+        MasterTimeSlot.objects.filter(booking_id__in=[booking.pk for booking in bookings]).delete()
+        invalidate_availability({booking.master_id for booking in bookings})
@@ -1,3 +1,4 @@
+from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import login, logout
@@ -6,8 +7,13 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.urls import reverse_lazy
-from .models import Booking, User, Master
+from django.utils.dateparse import parse_date
+from .models import Booking, BookingListItem, BookingRecord, Master
 from .forms import BookingForm, CustomUserCreationForm, BookingStatusUpdateForm
+from .pagination import KeysetPaginationMixin
+from .reservations import BookingConflict
+from .search import BOOKING_INDEX
+from .transitions import TransitionError, day_bookings, transition_bookings
 
 
 def is_admin(user):
@@ -55,42 +61,46 @@ def logout_view(request):
     return redirect('salon:booking_list')
 
 
-class BookingListView(ListView):
-    """Просмотр списка всех записей"""
-    model = Booking
+class BookingListView(KeysetPaginationMixin, ListView):
+    """
+    Просмотр списка всех записей (?pagination=cursor - постранично без подсчёта
+    общего числа). Читает плоскую таблицу BookingListItem без JOIN.
+    """
+    model = BookingListItem
     template_name = 'salon/booking_list.html'
     context_object_name = 'bookings'
     paginate_by = 10
     
     def get_queryset(self):
-        queryset = Booking.objects.select_related('user', 'master', 'service').order_by('-appointment_datetime')
+        queryset = BookingListItem.objects.order_by('-appointment_datetime')
         # Обычные пользователи видят только свои записи
         if self.request.user.is_authenticated and not self.request.user.is_staff:
-            try:
-                salon_user = User.objects.get(email=self.request.user.email)
-                queryset = queryset.filter(user=salon_user)
-            except User.DoesNotExist:
-                queryset = Booking.objects.none()
+            salon_user = self.request.salon_user
+            queryset = queryset.filter(user_id=salon_user.pk) if salon_user else BookingListItem.objects.none()
         # Неавторизованные пользователи видят все записи (или можно вернуть пустой queryset)
         return queryset
 
 
 class BookingDetailView(DetailView):
-    """Просмотр детальной информации о записи"""
+    """Просмотр детальной информации о записи (текущей или перенесённой в архив)"""
     model = Booking
     template_name = 'salon/booking_detail.html'
     context_object_name = 'booking'
     
-    def get_queryset(self):
-        queryset = Booking.objects.select_related('user', 'master', 'service')
+    def get_queryset(self, model=Booking):
+        queryset = model.objects.select_related('user', 'master', 'service')
         # Обычные пользователи могут видеть только свои записи
         if self.request.user.is_authenticated and not self.request.user.is_staff:
-            try:
-                salon_user = User.objects.get(email=self.request.user.email)
-                queryset = queryset.filter(user=salon_user)
-            except User.DoesNotExist:
-                queryset = Booking.objects.none()
+            salon_user = self.request.salon_user
+            queryset = queryset.filter(user_id=salon_user.pk) if salon_user else model.objects.none()
         return queryset
+    
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Записи нет среди текущих - возможно, она перенесена в архив
+            return super().get_object(self.get_queryset(BookingRecord))
 
 
 class BookingCreateView(LoginRequiredMixin, CreateView):
@@ -104,30 +114,32 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
+        kwargs['salon_user'] = self.request.salon_user
         return kwargs
     
     def form_valid(self, form):
         # Для обычных пользователей автоматически устанавливаем пользователя из модели User
+        salon_user = self.request.salon_user
         if not self.request.user.is_staff:
-            try:
-                salon_user = User.objects.get(email=self.request.user.email)
-                form.instance.user = salon_user
-            except User.DoesNotExist:
+            if not salon_user:
                 messages.error(self.request, 'Ошибка: пользователь не найден в системе')
                 return redirect('salon:booking_create')
+            form.instance.user_id = salon_user.pk
             # Устанавливаем статус по умолчанию для обычных пользователей
             form.instance.status = 'pending'
         else:
             # Для админов используем выбранного пользователя или устанавливаем из формы
-            if not form.cleaned_data.get('user'):
-                try:
-                    salon_user = User.objects.get(email=self.request.user.email)
-                    form.instance.user = salon_user
-                except User.DoesNotExist:
-                    pass
+            if not form.cleaned_data.get('user') and salon_user:
+                form.instance.user_id = salon_user.pk
         
+        try:
+            response = super().form_valid(form)
+        except BookingConflict as error:
+            # Время заняли параллельным запросом уже после проверки формы
+            form.add_error(None, error)
+            return self.form_invalid(form)
         messages.success(self.request, 'Запись успешно создана! Ожидайте подтверждения администратора.')
-        return super().form_valid(form)
+        return response
 
 
 class BookingUpdateView(LoginRequiredMixin, UpdateView):
@@ -142,24 +154,27 @@ class BookingUpdateView(LoginRequiredMixin, UpdateView):
         queryset = Booking.objects.select_related('user', 'master', 'service')
         # Обычные пользователи могут редактировать только свои записи
         if not self.request.user.is_staff:
-            try:
-                salon_user = User.objects.get(email=self.request.user.email)
-                queryset = queryset.filter(user=salon_user)
-            except User.DoesNotExist:
-                queryset = Booking.objects.none()
+            salon_user = self.request.salon_user
+            queryset = queryset.filter(user_id=salon_user.pk) if salon_user else Booking.objects.none()
         return queryset
     
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
+        kwargs['salon_user'] = self.request.salon_user
         return kwargs
     
     def form_valid(self, form):
         # Обычные пользователи не могут менять статус
         if not self.request.user.is_staff:
             form.instance.status = self.get_object().status
+        try:
+            response = super().form_valid(form)
+        except BookingConflict as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
         messages.success(self.request, 'Запись успешно обновлена!')
-        return super().form_valid(form)
+        return response
 
 
 class BookingDeleteView(LoginRequiredMixin, DeleteView):
@@ -174,11 +189,8 @@ class BookingDeleteView(LoginRequiredMixin, DeleteView):
         queryset = Booking.objects.select_related('user', 'master', 'service')
         # Обычные пользователи могут удалять только свои записи
         if not self.request.user.is_staff:
-            try:
-                salon_user = User.objects.get(email=self.request.user.email)
-                queryset = queryset.filter(user=salon_user)
-            except User.DoesNotExist:
-                queryset = Booking.objects.none()
+            salon_user = self.request.salon_user
+            queryset = queryset.filter(user_id=salon_user.pk) if salon_user else Booking.objects.none()
         return queryset
     
     def delete(self, request, *args, **kwargs):
@@ -187,8 +199,11 @@ class BookingDeleteView(LoginRequiredMixin, DeleteView):
 
 
 class AdminPendingBookingsView(LoginRequiredMixin, UserPassesTestMixin, ListView):
-    """Просмотр и управление записями в статусе "pending" для администраторов"""
-    model = Booking
+    """
+    Просмотр и управление записями в статусе "pending" для администраторов
+    (список - из плоской таблицы BookingListItem)
+    """
+    model = BookingListItem
     template_name = 'salon/admin_pending_bookings.html'
     context_object_name = 'pending_bookings'
     paginate_by = 10
@@ -200,19 +215,17 @@ class AdminPendingBookingsView(LoginRequiredMixin, UserPassesTestMixin, ListView
     
     def get_queryset(self):
         """Получаем только записи со статусом 'pending'"""
-        queryset = Booking.objects.filter(status='pending').select_related(
-            'user', 'master', 'service'
-        ).order_by('created_at')
+        queryset = BookingListItem.objects.filter(status='pending').order_by('created_at')
         
         # Фильтрация по мастеру (если указан)
         master_filter = self.request.GET.get('master')
         if master_filter:
             queryset = queryset.filter(master_id=master_filter)
         
-        # Поиск по имени клиента
+        # Поиск по клиенту, мастеру и услуге (полнотекстовый индекс), лучшие совпадения первыми
         search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(user__name__icontains=search)
+        if search and search.strip():
+            queryset = BOOKING_INDEX.filter(queryset, search).order_by('search_rank', 'created_at')
         
         return queryset
     
@@ -220,24 +233,43 @@ class AdminPendingBookingsView(LoginRequiredMixin, UserPassesTestMixin, ListView
         """Добавляем дополнительный контекст"""
         context = super().get_context_data(**kwargs)
         context['masters'] = Master.objects.all().order_by('full_name')
-        context['total_pending'] = Booking.objects.filter(status='pending').count()
+        context['total_pending'] = BookingListItem.objects.filter(status='pending').count()
         return context
     
     def post(self, request, *args, **kwargs):
-        """Обработка изменения статуса записи"""
-        booking_id = request.POST.get('booking_id')
+        """Изменение статуса одной или нескольких записей одним UPDATE"""
         new_status = request.POST.get('status')
+        booking_ids = [pk for pk in request.POST.getlist('booking_id') if pk.isdigit()]
+        master_id = request.POST.get('master_id', '')
+        day = parse_date(request.POST.get('date', ''))
         
-        if booking_id and new_status:
-            booking = get_object_or_404(Booking, pk=booking_id)
-            old_status = booking.get_status_display()
-            booking.status = new_status
-            booking.save()
-            messages.success(
-                request, 
-                f'Статус записи #{booking.booking_id} изменен с "{old_status}" на "{booking.get_status_display()}".'
-            )
+        if booking_ids and new_status:
+            queryset = Booking.objects.filter(pk__in=booking_ids)
+        elif master_id.isdigit() and day and new_status:
+            queryset = day_bookings(master_id, day)
         else:
-            messages.error(request, 'Ошибка: не указан ID записи или статус.')
+            messages.error(request, 'Ошибка: не выбраны записи или не указан статус.')
+            return redirect('salon:admin_pending_bookings')
+        
+        try:
+            result = transition_bookings(queryset, new_status, changed_by=request.user.username)
+        except TransitionError as error:
+            messages.error(request, f'Ошибка: {error}')
+            return redirect('salon:admin_pending_bookings')
+        
+        status_display = dict(Booking.STATUS_CHOICES)[new_status]
+        updated = result['updated']
+        if len(updated) == 1:
+            messages.success(request, f'Статус записи #{updated[0]} изменен на "{status_display}".')
+        elif updated:
+            messages.success(request, f'Статус "{status_display}" установлен для записей: {len(updated)}.')
+        elif not result['skipped']:
+            messages.warning(request, 'Записи не найдены.')
+        for pk, old_status in result['skipped']:
+            messages.error(
+                request,
+                f'Запись #{pk}: переход из статуса "{dict(Booking.STATUS_CHOICES)[old_status]}" '
+                f'в "{status_display}" не разрешён.'
+            )
         
         return redirect('salon:admin_pending_bookings')
@@ -1,43 +1,161 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import SAFE_METHODS, BasePermission, IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.db.models import Q, Count, Avg
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
-from .models import Booking, Master, Service
-from .serializers import BookingSerializer, MasterSerializer, ServiceSerializer
-from .filters import BookingFilter, MasterFilter, ServiceFilter
+from .availability import availability_index, from_timestamp, get_schedule_versions
+from .booking_archive import period_needs_archive, period_start
+from .bulk import bulk_create_bookings
+from .conditional import ConditionalGetMixin
+from .export import CSVRenderer, NDJSONRenderer, export_response
+from .fast_serializers import CompiledListMixin
+from .read_model import read_columns
+from .search import BOOKING_INDEX, FullTextSearchFilter
+from .response_cache import CachedResponseMixin, stats as response_cache_stats
+from .counters import booking_statistics
+from .models import ArchivedBooking, Booking, BookingListItem, BookingRecord, Master, MasterRating, Service, MasterService, Review, User
+from .pagination import BookingPagination
+from .serializers import (
+    BookingSerializer, RatedMasterSerializer, ReviewSerializer, ServiceSerializer, SparseFieldset
+)
+from .transitions import TransitionError, day_bookings, transition_bookings
+from .filters import (
+    BookingFilter, BookingListItemFilter, BookingRecordFilter, MasterFilter, ReviewFilter, ServiceFilter
+)
 
 
-class BookingViewSet(viewsets.ModelViewSet):
-    """ViewSet для модели Booking с Q-запросами, фильтрацией и пагинацией"""
+class BookingViewSet(CachedResponseMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
+    """
+    ViewSet для модели Booking с Q-запросами, фильтрацией и пагинацией.
+    Список, выгрузка и просмотр записи читают и архив (BookingRecord), если
+    date_from заходит в архив или передан ?archived=true; запись, не найденная
+    среди текущих, ищется в архиве. Список с ?fields= /
+    ?expand=, поля которого есть в плоской таблице BookingListItem, читает её.
+    """
+    cache_dependencies = (Booking, ArchivedBooking, User, Master, Service)
+    cache_user_params = ('my_bookings',)
     queryset = Booking.objects.select_related('user', 'master', 'service').all()
     serializer_class = BookingSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_class = BookingFilter
-    search_fields = ['user__name', 'user__email', 'master__full_name', 'service__title']
+    pagination_class = BookingPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
+    # Поиск по FTS5-индексу; search_fields используются только вне SQLite
+    search_index = 'booking'
     ordering_fields = ['appointment_datetime', 'created_at', 'status']
     ordering = ['-appointment_datetime']
     
+    @property
+    def sparse_fieldset(self):
+        """Выборка полей из ?fields= / ?expand= (только для чтения)"""
+        if not hasattr(self, '_sparse_fieldset'):
+            self._sparse_fieldset = None
+            if self.action in ('list', 'retrieve'):
+                self._sparse_fieldset = SparseFieldset.from_params(BookingSerializer, self.request.query_params)
+        return self._sparse_fieldset
+    
+    @property
+    def use_list_items(self):
+        """
+        Читать ли список из BookingListItem: ?fields= / ?expand= выбирают только
+        поля, скопированные в плоскую таблицу (имя и email клиента, имя мастера,
+        название и цена услуги). Полный ответ выводит и другие поля связей
+        (описание услуги, фото мастера) и читает Booking со связями.
+        """
+        if not hasattr(self, '_use_list_items'):
+            sparse = self.sparse_fieldset
+            self._use_list_items = (
+                self.action == 'list' and sparse is not None and not self.include_archive
+                and read_columns(sorted(sparse.columns() | set(self.ordering_fields))) is not None
+            )
+        return self._use_list_items
+    
+    @property
+    def search_fields(self):
+        if self.use_list_items:
+            return list(BOOKING_INDEX.read_models[BookingListItem])
+        return list(BOOKING_INDEX.fields)
+    
+    @property
+    def conditional_related(self):
+        # Валидаторы учитывают только связи, попадающие в ответ
+        sparse = self.sparse_fieldset
+        if sparse is None:
+            return ('user', 'master', 'service')
+        if self.use_list_items:
+            # Переименования связей меняют synced_at строк плоской таблицы
+            return ()
+        return tuple(sorted(sparse.expand))
+    
+    @property
+    def conditional_updated_field(self):
+        return 'synced_at' if self.use_list_items else 'updated_at'
+    
+    @property
+    def include_archive(self):
+        """Читать ли текущие и архивные записи вместе (только для чтения)"""
+        if not hasattr(self, '_include_archive'):
+            params = self.request.query_params
+            self._include_archive = self.action in ('list', 'retrieve', 'export') and (
+                params.get('archived') == 'true' or period_needs_archive(period_start(params.get('date_from')))
+            )
+        return self._include_archive
+    
+    @property
+    def filterset_class(self):
+        if self.use_list_items:
+            return BookingListItemFilter
+        return BookingRecordFilter if self.include_archive else BookingFilter
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse'] = self.sparse_fieldset
+        return context
+    
+    def base_queryset(self):
+        """
+        Записи со связями, которые выводит сериализатор. При ?fields= / ?expand=
+        присоединяются только раскрытые связи и читаются только нужные колонки
+        (например, без описания услуги). Если период заходит в архив - из
+        текущих и архивных записей вместе. Список из плоской таблицы читается
+        через values_list (compiled_rows), связи не нужны.
+        """
+        if self.use_list_items:
+            return BookingListItem.objects.all()
+        model = BookingRecord if self.include_archive else Booking
+        sparse = self.sparse_fieldset
+        if sparse is None:
+            return model.objects.select_related('user', 'master', 'service').all()
+        # Поля сортировки нужны keyset-пагинации, updated_at - условным запросам
+        columns = sparse.columns() | set(self.ordering_fields) | {'updated_at'}
+        columns |= {f'{relation}__updated_at' for relation in sparse.expand}
+        queryset = model.objects.only(*sorted(columns))
+        if sparse.expand:
+            queryset = queryset.select_related(*sorted(sparse.expand))
+        return queryset
+    
     def get_queryset(self):
         """
         Переопределяем queryset с использованием Q-объектов для сложных запросов
         """
-        queryset = Booking.objects.select_related('user', 'master', 'service').all()
+        queryset = self.base_queryset()
         
         # Фильтрация для текущего аутентифицированного пользователя
         if self.request.user.is_authenticated:
             user_filter = self.request.query_params.get('my_bookings', None)
             if user_filter == 'true':
-                # Используем Q-запрос для поиска пользователя по email
-                try:
-                    from .models import User
-                    salon_user = User.objects.get(email=self.request.user.email)
-                    queryset = queryset.filter(Q(user=salon_user))
-                except User.DoesNotExist:
+                # Пользователь салона уже найден SalonUserMiddleware по связи с учётной записью
+                salon_user = self.request.salon_user
+                if salon_user:
+                    queryset = queryset.filter(Q(user_id=salon_user.pk))
+                else:
                     queryset = queryset.none()
         
         # Фильтрация по статусу
@@ -93,50 +211,146 @@ class BookingViewSet(viewsets.ModelViewSet):
         
         return queryset
     
-    @action(detail=False, methods=['get'])
-    def statistics(self, request):
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve' or self.include_archive:
+                raise
+        # Записи нет среди текущих - возможно, она перенесена в архив
+        self._include_archive = True
+        return super().get_object()
+    
+    def compiled_rows(self, compiled, queryset):
+        if queryset.model is BookingListItem:
+            return compiled.rows(queryset, read_columns(compiled.columns))
+        return super().compiled_rows(compiled, queryset)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
         """
-        Кастомный action для получения статистики по записям
+        Массовое создание записей: тело запроса - список объектов в формате
+        BookingSerializer. Ответ содержит результат по каждому элементу.
         """
-        total_bookings = Booking.objects.count()
-        pending = Booking.objects.filter(status='pending').count()
-        confirmed = Booking.objects.filter(status='confirmed').count()
-        completed = Booking.objects.filter(status='completed').count()
-        cancelled = Booking.objects.filter(status='cancelled').count()
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'request body must be a non-empty list of bookings'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = settings.SALON_BULK_BOOKINGS_LIMIT
+        if len(items) > limit:
+            return Response(
+                {'error': f'no more than {limit} bookings per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Q-запрос для записей в ближайшие 30 дней
-        future_date = timezone.now() + timedelta(days=30)
-        upcoming = Booking.objects.filter(
-            Q(appointment_datetime__gte=timezone.now()) &
-            Q(appointment_datetime__lte=future_date) &
-            Q(status__in=['pending', 'confirmed'])
-        ).count()
+        results = bulk_create_bookings(
+            items, context=self.get_serializer_context(), changed_by=str(request.user)
+        )
+        created = [booking for _, booking, _ in results if booking is not None]
+        data = iter(BookingSerializer(created, many=True).data)
+        items_result = []
+        for index, booking, errors in results:
+            if booking is not None:
+                items_result.append({'index': index, 'status': 'created', 'booking': next(data)})
+            else:
+                items_result.append({'index': index, 'status': 'error', 'errors': errors})
         
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(created) < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
         return Response({
-            'total_bookings': total_bookings,
-            'pending': pending,
-            'confirmed': confirmed,
-            'completed': completed,
-            'cancelled': cancelled,
-            'upcoming_30_days': upcoming,
-        })
+            'created': len(created),
+            'failed': len(results) - len(created),
+            'results': items_result,
+        }, status=response_status)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def transition(self, request):
+        """
+        Массовая смена статуса: {"status": ..., "ids": [...]} или
+        {"status": ..., "master": <id>, "date": "YYYY-MM-DD"} (все записи мастера за день)
+        """
+        new_status = request.data.get('status')
+        ids = request.data.get('ids')
+        master_id = request.data.get('master')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                return Response({'error': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > settings.SALON_BULK_BOOKINGS_LIMIT:
+                return Response(
+                    {'error': f'no more than {settings.SALON_BULK_BOOKINGS_LIMIT} ids per request'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = Booking.objects.filter(pk__in=ids)
+        elif master_id is not None:
+            if not isinstance(master_id, int):
+                return Response({'error': 'master must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            day = parse_date(str(request.data.get('date', '')))
+            if day is None:
+                return Response({'error': 'date must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = day_bookings(master_id, day)
+        else:
+            return Response({'error': 'ids or master and date are required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            result = transition_bookings(queryset, new_status, changed_by=str(request.user))
+        except TransitionError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = {
+            'status': new_status,
+            'updated': result['updated'],
+            'skipped': [{'booking_id': pk, 'status': old_status} for pk, old_status in result['skipped']],
+        }
+        if ids is not None:
+            found = set(result['updated']) | {pk for pk, _ in result['skipped']}
+            response['not_found'] = [pk for pk in ids if pk not in found]
+        return Response(response)
+    
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAdminUser],
+        renderer_classes=[CSVRenderer, NDJSONRenderer]
+    )
+    def export(self, request):
+        """
+        Потоковая выгрузка записей в CSV (по умолчанию) или NDJSON (?format=ndjson).
+        Принимает те же фильтры, что и список записей.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(queryset, request.accepted_renderer)
+    
+    @action(detail=False, methods=['get'])
+    def statistics(self, request):
+        """
+        Кастомный action для получения статистики по записям (из счётчиков BookingCounter)
+        """
+        return Response(booking_statistics())
 
 
-class MasterViewSet(viewsets.ModelViewSet):
+class MasterViewSet(CachedResponseMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     """ViewSet для модели Master с Q-запросами и фильтрацией"""
-    queryset = Master.objects.select_related('image').prefetch_related('services').all()
-    serializer_class = MasterSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    conditional_related = ('rating',)
+    cache_dependencies = (Master, MasterRating)
+    queryset = Master.objects.select_related('image', 'rating').prefetch_related('services').all()
+    serializer_class = RatedMasterSerializer
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_class = MasterFilter
+    search_index = 'master'
     search_fields = ['full_name', 'specialization']
-    ordering_fields = ['full_name', 'experience_years', 'created_at']
+    # Рейтинг хранится в MasterRating, сортировка по нему - JOIN без GROUP BY по отзывам
+    ordering_fields = ['full_name', 'experience_years', 'created_at', 'rating__average', 'rating__reviews_count']
     ordering = ['full_name']
     
     def get_queryset(self):
         """
         Переопределяем queryset с использованием Q-объектов
         """
-        queryset = Master.objects.select_related('image').prefetch_related('services').all()
+        queryset = Master.objects.select_related('image', 'rating').prefetch_related('services').all()
         
         # Фильтрация по опыту работы (Q-запрос)
         min_experience = self.request.query_params.get('min_experience', None)
@@ -202,14 +416,119 @@ class MasterViewSet(viewsets.ModelViewSet):
         return Response({
             'message': f'Услуга "{service.title}" добавлена мастеру "{master.full_name}"'
         }, status=status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        Свободное время мастера на дату: ?date=YYYY-MM-DD[&service=<id>]
+        """
+        master = get_object_or_404(Master.objects.only('master_id', 'full_name'), pk=pk)
+        day = self._parse_day(request.query_params.get('date'))
+        if day is None:
+            return Response(
+                {'error': 'date must be in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        duration, error = self._service_duration(request)
+        if error:
+            return error
+        
+        version = get_schedule_versions([master.pk])[master.pk]
+        free = availability_index.free_intervals(master.pk, day, version=version)
+        slots = availability_index.free_slots(master.pk, day, duration, version=version)
+        return Response({
+            'master_id': master.pk,
+            'full_name': master.full_name,
+            'date': day.isoformat(),
+            'duration_minutes': duration,
+            'free_intervals': [
+                {'start': from_timestamp(start), 'end': from_timestamp(end)} for start, end in free
+            ],
+            'slots': [from_timestamp(slot) for slot in slots],
+        })
+    
+    @action(detail=False, methods=['get'], url_path='availability')
+    def availability_overview(self, request):
+        """
+        Свободные слоты всех мастеров, оказывающих услугу: ?service=<id>[&date_from=YYYY-MM-DD&days=7]
+        """
+        if not request.query_params.get('service'):
+            return Response(
+                {'error': 'service is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        duration, error = self._service_duration(request)
+        if error:
+            return error
+        
+        start_day = self._parse_day(request.query_params.get('date_from'))
+        try:
+            days = min(max(int(request.query_params.get('days', 7)), 1), 31)
+        except ValueError:
+            days = None
+        if start_day is None or days is None:
+            return Response(
+                {'error': 'date_from must be YYYY-MM-DD and days an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        masters = MasterService.objects.filter(
+            service_id=request.query_params['service']
+        ).order_by('master__full_name').values_list('master_id', 'master__full_name')
+        # Версии расписаний всех мастеров - одним запросом
+        versions = get_schedule_versions([master_id for master_id, _ in masters])
+        result = []
+        for master_id, full_name in masters:
+            schedule = []
+            for offset in range(days):
+                day = start_day + timedelta(days=offset)
+                slots = availability_index.free_slots(master_id, day, duration, version=versions[master_id])
+                if slots:
+                    schedule.append({
+                        'date': day.isoformat(),
+                        'slots': [from_timestamp(slot) for slot in slots],
+                    })
+            result.append({'master_id': master_id, 'full_name': full_name, 'days': schedule})
+        
+        return Response({
+            'service_id': int(request.query_params['service']),
+            'duration_minutes': duration,
+            'masters': result,
+        })
+    
+    @staticmethod
+    def _parse_day(value):
+        """Дата из параметра запроса; по умолчанию сегодня, None при ошибке формата"""
+        if not value:
+            return timezone.localdate()
+        try:
+            return parse_date(value)
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def _service_duration(request):
+        """Длительность слота: из услуги (?service=<id>) или шаг сетки по умолчанию"""
+        service_id = request.query_params.get('service')
+        if not service_id:
+            return settings.SALON_SLOT_STEP_MINUTES, None
+        try:
+            return Service.objects.values_list('duration_minutes', flat=True).get(pk=service_id), None
+        except (Service.DoesNotExist, ValueError):
+            return None, Response(
+                {'error': 'Service not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
 
-class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
+class ServiceViewSet(CachedResponseMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet для модели Service (только чтение)"""
+    cache_dependencies = (Service,)
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_class = ServiceFilter
+    search_index = 'service'
     search_fields = ['title', 'description']
     ordering_fields = ['title', 'price', 'created_at']
     ordering = ['title']
@@ -232,12 +551,41 @@ class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
                 q_objects &= Q(price__lte=max_price)
             queryset = queryset.filter(q_objects)
         
-        # Q-запрос: услуги с определенным словом в названии или описании
-        search_term = self.request.query_params.get('search', None)
-        if search_term:
-            queryset = queryset.filter(
-                Q(title__icontains=search_term) | Q(description__icontains=search_term)
-            )
-        
         return queryset
 
+
+class IsReviewAuthorOrAdmin(BasePermission):
+    """Изменять и удалять отзыв может только его автор или администратор"""
+    
+    def has_object_permission(self, request, view, obj):
+        if request.method in SAFE_METHODS or request.user.is_staff:
+            return True
+        salon_user = request.salon_user
+        return bool(salon_user) and obj.user_id == salon_user.pk
+
+
+class ReviewViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet для модели Review; рейтинг мастера обновляется сигналами отзыва.
+    Автор отзыва - пользователь салона из запроса, чужие отзывы меняет только администратор.
+    """
+    queryset = Review.objects.select_related('user', 'master').all()
+    serializer_class = ReviewSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly, IsReviewAuthorOrAdmin]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = ReviewFilter
+    ordering_fields = ['rating', 'created_at']
+    ordering = ['-created_at']
+    
+    def perform_create(self, serializer):
+        salon_user = self.request.salon_user
+        if not salon_user:
+            raise PermissionDenied('Отзыв может оставить только клиент салона')
+        serializer.save(user_id=salon_user.pk)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Попадания и промахи кэша ответов API в текущем процессе"""
+    return Response(response_cache_stats())